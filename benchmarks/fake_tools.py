@@ -0,0 +1,317 @@
+"""
+Fake brew, mas, git, sudo and unzip executables for benchmarking on any POSIX system.
+
+The fakes keep their install state where the real tools do, under a sandbox directory:
+Homebrew formulae in $HOMEBREW_PREFIX/Cellar, casks in $HOMEBREW_PREFIX/Caskroom and applications in
+$MACOS_INSTALLER_APPLICATIONS_DIR, so macos_installer's filesystem probe sees what they install.
+Every call is appended to $FAKE_CALL_LOG. Commands that change state sleep $FAKE_LATENCY seconds per
+package, listing commands sleep $FAKE_LIST_LATENCY seconds. Package names starting with 'fail' fail
+to install. Installed packages whose names start with 'old' (or 'Old') are outdated until upgraded.
+Installed Homebrew packages are at version 1.0, or 1.1 once upgraded. $FAKE_OFFLINE lists the backends
+that are down, among 'brew', 'cask' and 'mas': their downloads fail with a network error.
+"""
+
+import os
+import stat
+
+PRELUDE = """#!/bin/sh
+echo "$(basename "$0") $*" >> "$FAKE_CALL_LOG"
+delay() { case "$1" in ""|0|0.0) ;; *) sleep "$1";; esac; }
+apps="$MACOS_INSTALLER_APPLICATIONS_DIR"
+"""
+
+BREW = PRELUDE + r"""
+if [ "$1" = cask ]; then shift; dir="$HOMEBREW_PREFIX/Caskroom"; tool=cask; else dir="$HOMEBREW_PREFIX/Cellar"; tool=brew; fi
+mkdir -p "$dir"
+cmd="$1"; [ $# -gt 0 ] && shift
+rc=0
+case " $FAKE_OFFLINE " in
+  *" $tool "*)
+    case "$cmd" in
+      install|reinstall|fetch|upgrade)
+        delay "$FAKE_LATENCY"; echo "curl: (6) Could not resolve host: formulae.brew.sh" >&2; exit 1;;
+    esac;;
+esac
+case "$cmd" in
+  list)
+    delay "$FAKE_LIST_LATENCY"; ls -1 "$dir";;
+  fetch)
+    for p in "$@"; do delay "$FAKE_LATENCY"; done;;
+  outdated)
+    delay "$FAKE_LIST_LATENCY"
+    entries() {
+      sep=""
+      for p in "$1"/old*; do
+        [ -d "$p" ] && [ ! -f "$p/upgraded" ] || continue
+        printf '%s{"name": "%s", "installed_versions": ["1.0"], "current_version": "1.1"}' "$sep" "${p##*/}"; sep=", "
+      done
+    }
+    echo "{\"formulae\": [$(entries "$HOMEBREW_PREFIX/Cellar")], \"casks\": [$(entries "$HOMEBREW_PREFIX/Caskroom")]}";;
+  info)
+    delay "$FAKE_LIST_LATENCY"
+    version() { if [ -f "$1/upgraded" ]; then echo 1.1; else for v in "$1"/*/; do v="${v%/}"; echo "${v##*/}"; break; done; fi; }
+    formulae() {
+      sep=""
+      for p in "$HOMEBREW_PREFIX/Cellar"/*; do
+        [ -d "$p" ] || continue
+        printf '%s{"name": "%s", "installed": [{"version": "%s"}]}' "$sep" "${p##*/}" "$(version "$p")"; sep=", "
+      done
+    }
+    casks() {
+      sep=""
+      for p in "$HOMEBREW_PREFIX/Caskroom"/*; do
+        [ -d "$p" ] || continue
+        printf '%s{"token": "%s", "installed": "%s"}' "$sep" "${p##*/}" "$(version "$p")"; sep=", "
+      done
+    }
+    echo "{\"formulae\": [$(formulae)], \"casks\": [$(casks)]}";;
+  upgrade)
+    for p in "$@"; do
+      delay "$FAKE_LATENCY"
+      if [ -d "$dir/$p" ]; then touch "$dir/$p/upgraded"; else echo "Error: $p not installed" >&2; rc=1; fi
+    done;;
+  install|reinstall)
+    for p in "$@"; do
+      delay "$FAKE_LATENCY"
+      case "$p" in
+        fail*) echo "Error: $p: fake failure" >&2; rc=1;;
+        *.rb)
+          app=$(sed -n "s/^ *app ['\"]\([^'\"]*\)['\"].*/\1/p" "$p" | head -n 1)
+          mkdir -p "$apps/$app" "$dir/${p%.rb}/1.0"; echo "$app" > "$dir/${p%.rb}/app";;
+        *) mkdir -p "$dir/$p/1.0";;
+      esac
+    done;;
+  uninstall|remove|rm)
+    for p in "$@"; do
+      delay "$FAKE_LATENCY"
+      if [ -f "$dir/$p/app" ]; then rm -rf "$apps/$(cat "$dir/$p/app")"; fi
+      rm -rf "$dir/$p"
+    done;;
+esac
+exit $rc
+"""
+
+MAS = PRELUDE + r"""
+case " $FAKE_OFFLINE " in
+  *" mas "*)
+    case "$1" in
+      install|upgrade) delay "$FAKE_LATENCY"; echo "Error: The Internet connection appears to be offline." >&2; exit 1;;
+    esac;;
+esac
+case "$1" in
+  list)
+    delay "$FAKE_LIST_LATENCY"
+    for receipt in "$apps"/*.app/Contents/_MASReceipt; do
+      [ -f "$receipt/id" ] || continue
+      app="${receipt%/Contents/_MASReceipt}"; app="${app##*/}"
+      echo "$(cat "$receipt/id") ${app%.app} (1.0)"
+    done;;
+  outdated)
+    delay "$FAKE_LIST_LATENCY"
+    for receipt in "$apps"/Old*.app/Contents/_MASReceipt; do
+      [ -f "$receipt/id" ] && [ ! -f "$receipt/upgraded" ] || continue
+      app="${receipt%/Contents/_MASReceipt}"; app="${app##*/}"
+      echo "$(cat "$receipt/id") ${app%.app} (1.0 -> 1.1)"
+    done;;
+  upgrade)
+    shift
+    for id; do
+      delay "$FAKE_LATENCY"
+      for receipt in "$apps"/*.app/Contents/_MASReceipt; do
+        [ "$(cat "$receipt/id" 2>/dev/null)" = "$id" ] && touch "$receipt/upgraded"
+      done
+    done;;
+  install)
+    delay "$FAKE_LATENCY"
+    name=$(grep "^$2 " "$FAKE_ROOT/mas_catalog" | head -n 1 | cut -d ' ' -f 2-)
+    [ -n "$name" ] || { echo "Error: unknown app $2" >&2; exit 1; }
+    mkdir -p "$apps/$name.app/Contents/_MASReceipt"; echo "$2" > "$apps/$name.app/Contents/_MASReceipt/id";;
+esac
+exit 0
+"""
+
+GIT = PRELUDE + r"""
+case "$1" in
+  clone)
+    delay "$FAKE_LIST_LATENCY"
+    for target; do :; done
+    mkdir -p "$target/.git"; cp -R "$FAKE_ROOT/cask_repo/." "$target/";;
+  ls-remote|rev-parse)
+    delay "$FAKE_LIST_LATENCY"
+    if [ "$1" = ls-remote ]; then printf '0000000000000000000000000000000000000000\tHEAD\n'
+    else echo 0000000000000000000000000000000000000000; fi;;
+  pull|fetch)
+    delay "$FAKE_LIST_LATENCY";;
+esac
+exit 0
+"""
+
+# Paths the installers hard-code are mapped into the sandbox and only a few commands are allowed,
+# so a benchmark can never touch the real system
+SUDO = PRELUDE + r"""
+case "$1" in
+  rm|unzip|mkdir|true|*python*) ;;
+  *) echo "sudo: $1 not allowed in benchmarks" >&2; exit 1;;
+esac
+cmd="$1"; shift
+for arg; do
+  case "$arg" in
+    /Applications/*) arg="$apps/${arg#/Applications/}";;
+    /private/var/db/receipts*) arg="$FAKE_ROOT/receipts${arg#/private/var/db/receipts}";;
+  esac
+  set -- "$@" "$arg"; shift
+done
+exec "$cmd" "$@"
+"""
+
+UNZIP = PRELUDE + r"""
+delay "$FAKE_LATENCY"
+exit 0
+"""
+
+EXECUTABLES = {
+    'brew': BREW,
+    'mas': MAS,
+    'git': GIT,
+    'sudo': SUDO,
+    'unzip': UNZIP,
+}
+
+
+def write_executables(bin_dir):
+    """
+    Write the fake executables
+
+    Args:
+        bin_dir (str): Directory to put first on PATH
+
+    Returns:
+        No return value
+    """
+
+    os.makedirs(bin_dir, exist_ok=True)
+    for name, script in EXECUTABLES.items():
+        executable = os.path.join(bin_dir, name)
+        with open(executable, 'w') as script_file:
+            script_file.write(script)
+        os.chmod(executable, os.stat(executable).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def environment(root, latency=0.0, list_latency=0.0):
+    """
+    Get the environment that points macos_installer and the fakes at a sandbox
+
+    Args:
+        root (str): Sandbox directory
+        latency (float): Seconds each install, removal or download takes
+        list_latency (float): Seconds each listing or git query takes
+
+    Returns:
+        dict: Environment variables
+    """
+
+    env = dict(os.environ)
+    env.update({
+        'PATH': "{0}{1}{2}".format(os.path.join(root, "bin"), os.pathsep, os.environ.get('PATH', "")),
+        'HOME': os.path.join(root, "home"),
+        'HOMEBREW_PREFIX': os.path.join(root, "homebrew"),
+        'MACOS_INSTALLER_APPLICATIONS_DIR': os.path.join(root, "Applications"),
+        'MACOS_INSTALLER_CACHE_DIR': os.path.join(root, "cache"),
+        'FAKE_ROOT': root,
+        'FAKE_CALL_LOG': os.path.join(root, "calls.log"),
+        'FAKE_LATENCY': str(latency),
+        'FAKE_LIST_LATENCY': str(list_latency),
+    })
+    env.pop('XDG_CACHE_HOME', None)
+    return env
+
+
+def create_sandbox(root, packages=None, installed=None):
+    """
+    Create a sandbox: fake executables, an empty Homebrew prefix and applications directory,
+    the Mac Apple Store catalog and local cask definitions for the manifest, and the packages
+    that are already installed
+
+    Args:
+        root (str): Sandbox directory
+        packages list(dict): Manifest entries
+        installed list(dict): Manifest entries to mark as installed before the run
+
+    Returns:
+        No return value
+    """
+
+    write_executables(os.path.join(root, "bin"))
+    home = os.path.join(root, "home")
+    applications = os.path.join(root, "Applications")
+    cellar = os.path.join(root, "homebrew", "Cellar")
+    caskroom = os.path.join(root, "homebrew", "Caskroom")
+    casks = os.path.join(root, "cask_repo", "casks")
+    for directory in (home, applications, cellar, caskroom, casks, os.path.join(root, "receipts"),
+                      os.path.join(root, "cache")):
+        os.makedirs(directory, exist_ok=True)
+    open(os.path.join(root, "calls.log"), 'w').close()
+
+    with open(os.path.join(root, "mas_catalog"), 'w') as catalog:
+        for package in packages or []:
+            if package['package_type'] == 'mas':
+                catalog.write("{0} {1}\n".format(package['mas_id'], package['name']))
+            elif package['package_type'] == 'brewcasklocal':
+                with open(os.path.join(casks, "{0}.rb".format(package['name'])), 'w') as cask:
+                    cask.write("cask '{0}' do\n  version '1.0'\n  app '{1}'\nend\n".format(
+                        package['name'], local_app_name(package)))
+
+    if any(package['package_type'] == 'brewcasklocal' for package in packages or []):
+        # BrewCaskLocalInstaller only runs on a personal system
+        open(os.path.join(home, ".bootstrap_personal"), 'w').close()
+
+    for package in installed or []:
+        package_type = package['package_type']
+        if package_type == 'brew':
+            os.makedirs(os.path.join(cellar, package['name'], "1.0"), exist_ok=True)
+        elif package_type == 'brewcask':
+            os.makedirs(os.path.join(caskroom, package['name'], "1.0"), exist_ok=True)
+        elif package_type == 'brewcasklocal':
+            os.makedirs(os.path.join(caskroom, package['name'], "1.0"), exist_ok=True)
+            with open(os.path.join(caskroom, package['name'], "app"), 'w') as app_file:
+                app_file.write(local_app_name(package))
+            os.makedirs(os.path.join(applications, local_app_name(package)), exist_ok=True)
+        elif package_type == 'mas':
+            receipt = os.path.join(applications, "{0}.app".format(package['name']), "Contents", "_MASReceipt")
+            os.makedirs(receipt, exist_ok=True)
+            with open(os.path.join(receipt, "id"), 'w') as id_file:
+                id_file.write(package['mas_id'])
+
+
+def local_app_name(package):
+    """
+    Get the application a local cask installs
+
+    Args:
+        package (dict): Manifest entry
+
+    Returns:
+        str: Application name
+    """
+    return "{0}.app".format(package['name'].title())
+
+
+def count_calls(root):
+    """
+    Count the fake executables' calls
+
+    Args:
+        root (str): Sandbox directory
+
+    Returns:
+        dict: executable -> number of calls, with 'total'
+    """
+
+    counts = {'total': 0}
+    with open(os.path.join(root, "calls.log"), 'r') as log:
+        for line in log:
+            tool = line.split(" ", 1)[0]
+            if tool:
+                counts[tool] = counts.get(tool, 0) + 1
+                counts['total'] += 1
+    return counts
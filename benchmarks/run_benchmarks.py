@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Benchmark PackageManager.all_actions against fake brew, mas, git, sudo and unzip executables.
+
+Each scenario runs in a fresh sandbox in its own process, so it needs neither a Mac nor root and
+never touches the real system. For each manifest size and mode it reports wall time, the number of
+subprocesses spawned and peak RSS, for a first run (packages to install and remove) and a second,
+warm run (nothing left to do). Results can be saved as a baseline and later runs compared with it.
+
+Examples:
+
+    python3 benchmarks/run_benchmarks.py --save-baseline
+    python3 benchmarks/run_benchmarks.py --sizes 25 500 --modes sequential batch --latency 0.01
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_tools
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+DEFAULT_SIZES = [25, 500, 5000]
+MODES = ["sequential", "batch", "concurrent", "asyncio"]
+
+# Smallest wall time increase, in seconds, reported as a regression
+MIN_WALL_INCREASE = 0.05
+
+# Share of each package type in generated manifests
+TYPE_MIX = [('brew', 0.55), ('brewcask', 0.25), ('mas', 0.15), ('brewcasklocal', 0.05)]
+
+
+def generate_manifest(size, absent_ratio=0.1, seed=0):
+    """
+    Generate a manifest in the PACKAGES_DATA format
+
+    Args:
+        size (int): Number of entries
+        absent_ratio (float): Share of entries whose state is 'absent'
+        seed (int): Random seed, so that a size always gives the same manifest
+
+    Returns:
+        list(dict): Manifest entries
+    """
+
+    rng = random.Random(seed)
+    packages = []
+    counts = {}
+    for index in range(size):
+        point = rng.random()
+        package_type = TYPE_MIX[-1][0]
+        for candidate, share in TYPE_MIX:
+            if point < share:
+                package_type = candidate
+                break
+            point -= share
+        count = counts.get(package_type, 0)
+        counts[package_type] = count + 1
+        name = "{0}-{1}".format(package_type, count)
+        package = {
+            "full_name": "{0} {1}".format(name, "1.0"),
+            "name": name,
+            "package_type": package_type,
+            "state": "absent" if rng.random() < absent_ratio else "present",
+        }
+        if package_type == 'mas':
+            package["name"] = "Mas App {0}".format(count)
+            package["mas_id"] = str(1000000000 + index)
+        packages.append(package)
+    return packages
+
+
+def choose_installed(packages, installed_ratio=0.5, seed=0):
+    """
+    Choose the packages installed before the first run
+
+    Args:
+        packages list(dict): Manifest entries
+        installed_ratio (float): Share of entries already installed
+        seed (int): Random seed
+
+    Returns:
+        list(dict): Manifest entries to mark as installed
+    """
+
+    rng = random.Random(seed + 1)
+    return [package for package in packages if rng.random() < installed_ratio]
+
+
+def run_child(manifest_path=None, mode=None, timeout=None):
+    """
+    Run all_actions once in this process and print the measurements as JSON. The environment has
+    been pointed at the sandbox by the parent. A run that leaves a package out of its configured state fails.
+
+    Args:
+        manifest_path (str): Manifest file
+        mode (str): One of MODES
+        timeout (float): Per command timeout for the asyncio mode
+
+    Returns:
+        int: Exit status, 1 if a package failed or was deferred
+    """
+
+    import asyncio
+    import logging
+
+    sys.path.insert(0, REPO_DIR)
+    from macos_installer.PackageManager import PackageManager
+
+    logging.basicConfig(level=logging.ERROR, stream=sys.stderr)
+    logger = logging.getLogger("macos_installer.benchmark")
+
+    with open(manifest_path, 'r') as manifest_file:
+        data = manifest_file.read()
+
+    start = time.perf_counter()
+    if mode == "asyncio":
+        results = asyncio.run(PackageManager.all_actions_async(logger=logger, data=data, timeout=timeout))
+    else:
+        results = PackageManager.all_actions(logger=logger, data=data, batch=mode == "batch",
+                                             concurrency=True if mode == "concurrent" else None)
+    wall = time.perf_counter() - start
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes on macOS, kilobytes elsewhere
+        peak_rss //= 1024
+
+    # Same outcomes as installer.report: False is a failure unless the package is in its configured state
+    outcomes = {"changed": 0, "unchanged": 0, "failed": 0}
+    for installer, result in (results or {}).items():
+        if result:
+            outcomes["changed"] += 1
+        elif result is None or not installer.is_satisfied():
+            outcomes["failed"] += 1
+        else:
+            outcomes["unchanged"] += 1
+
+    json.dump({"wall_seconds": wall, "peak_rss_kb": peak_rss, "outcomes": outcomes}, sys.stdout)
+    if results is None or outcomes["failed"]:
+        sys.stderr.write("{0} of {1} packages failed\n".format(outcomes["failed"], len(results or {})))
+        return 1
+    return 0
+
+
+def run_scenario(size=None, mode=None, latency=0.0, list_latency=0.0, installed_ratio=0.5, keep=False):
+    """
+    Run one scenario: a first run and a warm second run in a new sandbox
+
+    Args:
+        size (int): Manifest size
+        mode (str): One of MODES
+        latency (float): Seconds each fake install, removal or download takes
+        list_latency (float): Seconds each fake listing takes
+        installed_ratio (float): Share of packages already installed before the first run
+        keep (bool): Keep the sandbox for inspection
+
+    Returns:
+        dict: 'first' and 'warm' measurements or None if a run failed
+    """
+
+    root = tempfile.mkdtemp(prefix="macos_installer_bench_")
+    try:
+        packages = generate_manifest(size)
+        fake_tools.create_sandbox(root, packages=packages,
+                                  installed=choose_installed(packages, installed_ratio=installed_ratio))
+        manifest_path = os.path.join(root, "manifest.json")
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump(packages, manifest_file)
+
+        env = fake_tools.environment(root, latency=latency, list_latency=list_latency)
+        measurements = {}
+        for run in ("first", "warm"):
+            open(env['FAKE_CALL_LOG'], 'w').close()
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", manifest_path, "--mode", mode],
+                env=env, cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+            if completed.returncode != 0:
+                sys.stderr.write("{0} {1} {2} run failed:\n{3}\n".format(mode, size, run, completed.stderr))
+                return None
+            measurement = json.loads(completed.stdout)
+            calls = fake_tools.count_calls(root)
+            measurement["subprocesses"] = calls.pop('total')
+            measurement["subprocesses_by_tool"] = calls
+            measurements[run] = measurement
+        return measurements
+    finally:
+        if keep:
+            sys.stderr.write("Sandbox kept in {0}\n".format(root))
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def compare(baseline=None, current=None, tolerance=0.1):
+    """
+    Compare results with a baseline
+
+    Args:
+        baseline (dict): Saved results
+        current (dict): New results
+        tolerance (float): Relative wall time or peak RSS increase reported as a regression
+
+    Returns:
+        tuple(list(str), list(str)): Report lines and regressions
+    """
+
+    lines = ["{0:<24} {1:<14} {2:>12} {3:>12} {4:>8}".format("scenario", "metric", "baseline", "current",
+                                                               "change")]
+    regressions = []
+    for scenario, runs in sorted(current["results"].items()):
+        base_runs = baseline["results"].get(scenario)
+        if not base_runs:
+            continue
+        for run, measurement in sorted(runs.items()):
+            base = base_runs.get(run)
+            if not base:
+                continue
+            for metric in ("wall_seconds", "subprocesses", "peak_rss_kb"):
+                before, after = base[metric], measurement[metric]
+                change = (after - before) / before if before else 0.0
+                lines.append("{0:<24} {1:<14} {2:>12.3f} {3:>12.3f} {4:>+8.1%}".format(
+                    "{0} {1}".format(scenario, run), metric, before, after, change))
+                if metric == "subprocesses":
+                    worse = after > before
+                elif metric == "wall_seconds":
+                    # Runs of a few milliseconds are too noisy to judge by their relative change
+                    worse = change > tolerance and after - before > MIN_WALL_INCREASE
+                else:
+                    worse = change > tolerance
+                if worse:
+                    regressions.append("{0} {1} {2}: {3:.3f} -> {4:.3f}".format(scenario, run, metric, before, after))
+    return lines, regressions
+
+
+def report(results=None):
+    """
+    Format results as a table
+
+    Args:
+        results (dict): Results
+
+    Returns:
+        str: Table
+    """
+
+    lines = ["{0:<24} {1:>10} {2:>12} {3:>12} {4:>8} {5:>10} {6:>7}".format(
+        "scenario", "run", "wall (s)", "subprocesses", "rss (MB)", "changed", "failed")]
+    for scenario, runs in sorted(results["results"].items()):
+        for run, measurement in sorted(runs.items()):
+            lines.append("{0:<24} {1:>10} {2:>12.3f} {3:>12} {4:>8.1f} {5:>10} {6:>7}".format(
+                scenario, run, measurement["wall_seconds"], measurement["subprocesses"],
+                measurement["peak_rss_kb"] / 1024.0, measurement["outcomes"]["changed"],
+                measurement["outcomes"]["failed"]))
+    return "\n".join(lines)
+
+
+def parse_args(args=None):
+    """
+    Parse command line arguments
+
+    Args:
+        args list(str): Arguments. Defaults to sys.argv[1:]
+
+    Returns:
+        obj: argparse Namespace
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark macos_installer with fake package tools")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Manifest sizes")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=["sequential"], help="Ways to run all_actions")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds each fake install, removal or download takes")
+    parser.add_argument("--list-latency", type=float, default=0.0, help="Seconds each fake listing takes")
+    parser.add_argument("--installed", type=float, default=0.5,
+                        help="Share of packages already installed before the first run")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="Save these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Relative wall time or RSS increase reported as a regression")
+    parser.add_argument("--output", help="Also write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep sandboxes for inspection")
+    parser.add_argument("--child", metavar="MANIFEST", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """
+    Run the benchmarks, print the results and compare them with the baseline
+
+    Args:
+        args list(str): Arguments. Defaults to sys.argv[1:]
+
+    Returns:
+        int: Exit status. 1 if a run failed or a regression was found
+    """
+
+    options = parse_args(args)
+    if options.child:
+        return run_child(manifest_path=options.child, mode=options.mode)
+
+    results = {
+        "settings": {
+            "latency": options.latency,
+            "list_latency": options.list_latency,
+            "installed": options.installed,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": {},
+    }
+    status = 0
+    for mode in options.modes:
+        for size in options.sizes:
+            measurements = run_scenario(size=size, mode=mode, latency=options.latency,
+                                        list_latency=options.list_latency, installed_ratio=options.installed,
+                                        keep=options.keep)
+            if measurements is None:
+                status = 1
+                continue
+            results["results"]["{0}-{1}".format(mode, size)] = measurements
+
+    print(report(results))
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+
+    if options.save_baseline:
+        with open(options.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        print("Baseline saved to {0}".format(options.baseline))
+    elif os.path.exists(options.baseline):
+        with open(options.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("settings", {}).get("latency") != options.latency:
+            print("Baseline was taken with a different latency; comparison may not be meaningful")
+        lines, regressions = compare(baseline=baseline, current=results, tolerance=options.tolerance)
+        print("")
+        print("\n".join(lines))
+        if regressions:
+            print("")
+            print("Regressions:")
+            print("\n".join(regressions))
+            status = 1
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+import asyncio
+import os
+import signal
+
+from .Tracer import Tracer
+from .CircuitBreaker import CircuitBreaker
+
+
+class CommandResults:
+    """CommandResults holds the outcome of a command, with the same fields as run_command results"""
+
+    def __init__(self,
+                 status_code=None,
+                 results="",
+                 errors="",
+                 timed_out=False):
+        """
+        Create a new CommandResults instance
+
+        Args:
+            status_code (int): Exit status
+            results (str): Standard output
+            errors (str): Standard error
+            timed_out (bool): True if the command was killed because it ran too long
+        """
+
+        self.status_code = status_code
+        self.results = results
+        self.errors = errors
+        self.timed_out = timed_out
+        self.success = status_code == 0 and not timed_out
+
+
+class AsyncCommandRunner:
+    """AsyncCommandRunner runs commands on an asyncio event loop, with per-backend concurrency limits"""
+
+    DEFAULT_LIMITS = {
+        'brew': 1,
+        'brewcask': 1,
+        'brewcasklocal': 4,
+        'mas': 4,
+    }
+
+    # Bytes read from a pipe at a time. Output is split into lines here, so a line has no length limit.
+    READ_SIZE = 64 * 1024
+
+    def __init__(self,
+                 logger=None,
+                 limits=None,
+                 max_processes=16,
+                 timeout=None):
+        """
+        Create a new AsyncCommandRunner instance. Create it outside the event loop or inside, but
+        use it from a single loop.
+
+        Args:
+            logger (obj): Logger instance
+            limits (dict): package_type -> maximum concurrent commands. Overrides DEFAULT_LIMITS.
+            max_processes (int): Maximum concurrent commands overall
+            timeout (float): Default seconds before a command is killed. None for no limit.
+        """
+
+        self.logger = logger
+        self.limits = dict(self.DEFAULT_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self.max_processes = max_processes
+        self.timeout = timeout
+        self.semaphores = {}
+        self.process_semaphore = None
+        self.homebrew_lock = None
+
+    def semaphore(self, backend):
+        """
+        Get the semaphore limiting commands for a backend, creating it on first use
+
+        Args:
+            backend (str): package_type or None for commands not tied to a backend
+
+        Returns:
+            obj: asyncio.Semaphore
+        """
+
+        semaphore = self.semaphores.get(backend)
+        if semaphore is None:
+            limit = self.limits.get(backend, self.max_processes) if backend else self.max_processes
+            semaphore = asyncio.Semaphore(max(1, limit))
+            self.semaphores[backend] = semaphore
+        return semaphore
+
+    async def run(self, cmd=None, backend=None, working_dir=None, timeout=None, homebrew_lock=False, breaker=True):
+        """
+        Run a command, reading its output as it is produced
+
+        Args:
+            cmd list(str): Command and arguments
+            backend (str): package_type whose concurrency limit and CircuitBreaker apply
+            working_dir (str): Directory to run the command in. Defaults to the current directory
+            timeout (float): Seconds before the command is killed. Defaults to the runner's timeout
+            homebrew_lock (bool): Hold the Homebrew lock while the command runs
+            breaker (bool): Run through the backend's CircuitBreaker, which retries transient failures and
+                fails the command without running it once the backend looks down. False for listings.
+
+        Returns:
+            obj: CommandResults instance
+        """
+
+        if backend is None or not breaker:
+            return await self.run_limited(cmd=cmd, backend=backend, working_dir=working_dir, timeout=timeout,
+                                          homebrew_lock=homebrew_lock)
+        circuit_breaker = CircuitBreaker.get(logger=self.logger, backend=backend)
+        # Retries wait without holding a slot
+        return await circuit_breaker.call_async(cmd=cmd, run=lambda: self.run_limited(
+            cmd=cmd, backend=backend, working_dir=working_dir, timeout=timeout, homebrew_lock=homebrew_lock))
+
+    async def run_limited(self, cmd=None, backend=None, working_dir=None, timeout=None, homebrew_lock=False):
+        """
+        Run a command once, within the concurrency limits. Called by run.
+
+        Args:
+            cmd list(str): Command and arguments
+            backend (str): package_type whose concurrency limit applies
+            working_dir (str): Directory to run the command in
+            timeout (float): Seconds before the command is killed. Defaults to the runner's timeout
+            homebrew_lock (bool): Hold the Homebrew lock while the command runs
+
+        Returns:
+            obj: CommandResults instance
+        """
+
+        if self.process_semaphore is None:
+            self.process_semaphore = asyncio.Semaphore(self.max_processes)
+        if homebrew_lock and self.homebrew_lock is None:
+            self.homebrew_lock = asyncio.Lock()
+        timeout = timeout if timeout is not None else self.timeout
+
+        async with self.semaphore(backend):
+            if homebrew_lock:
+                async with self.homebrew_lock:
+                    async with self.process_semaphore:
+                        return await self.spawn(cmd=cmd, working_dir=working_dir, timeout=timeout)
+            async with self.process_semaphore:
+                return await self.spawn(cmd=cmd, working_dir=working_dir, timeout=timeout)
+
+    async def spawn(self, cmd=None, working_dir=None, timeout=None):
+        """
+        Start a process and stream its stdout and stderr until it exits or times out
+
+        Args:
+            cmd list(str): Command and arguments
+            working_dir (str): Directory to run the command in
+            timeout (float): Seconds before the command is killed or None
+
+        Returns:
+            obj: CommandResults instance
+        """
+
+        with Tracer.span(name=" ".join(cmd), category="command") as span_args:
+            results = await self.spawn_process(cmd=cmd, working_dir=working_dir, timeout=timeout)
+            span_args["status_code"] = results.status_code
+            span_args["output_bytes"] = len(results.results) + len(results.errors)
+            span_args["timed_out"] = results.timed_out
+            return results
+
+    async def spawn_process(self, cmd=None, working_dir=None, timeout=None):
+        """
+        Start a process and collect its output. Called by spawn.
+
+        Args:
+            cmd list(str): Command and arguments
+            working_dir (str): Directory to run the command in
+            timeout (float): Seconds before the command is killed or None
+
+        Returns:
+            obj: CommandResults instance
+        """
+
+        try:
+            # A command with a timeout gets its own process group so that children are killed with it.
+            # Without one it stays in ours, where sudo can still reach the terminal.
+            process = await asyncio.create_subprocess_exec(
+                *cmd, cwd=working_dir, stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                start_new_session=timeout is not None)
+        except OSError as e:
+            return CommandResults(status_code=127, errors=str(e))
+
+        out_lines = []
+        err_lines = []
+        try:
+            await asyncio.wait_for(asyncio.gather(
+                self.read_stream(process.stdout, out_lines, cmd),
+                self.read_stream(process.stderr, err_lines, cmd),
+                process.wait()), timeout=timeout)
+        except asyncio.TimeoutError:
+            await self.stop(process, own_group=True)
+            if self.logger:
+                self.logger.error("AsyncCommandRunner {0} timed out after {1}s".format(" ".join(cmd), timeout))
+            return CommandResults(status_code=process.returncode, results="".join(out_lines),
+                                  errors="".join(err_lines), timed_out=True)
+        finally:
+            # Also on an error or a cancellation: never leave the process running or unreaped
+            await self.stop(process, own_group=timeout is not None)
+
+        return CommandResults(status_code=process.returncode, results="".join(out_lines), errors="".join(err_lines))
+
+    async def read_stream(self, stream, lines, cmd):
+        """
+        Collect a stream line by line as the process writes it
+
+        Args:
+            stream (obj): asyncio.StreamReader
+            lines list(str): Collected lines. Updated in place.
+            cmd list(str): Command, for logging
+
+        Returns:
+            No return value
+        """
+
+        pending = bytearray()
+        while True:
+            chunk = await stream.read(self.READ_SIZE)
+            if not chunk:
+                if pending:
+                    self.add_line(bytes(pending), lines, cmd)
+                return
+            start = len(pending)
+            pending.extend(chunk)
+            # Only the new chunk can hold a line end
+            end = pending.find(b"\n", start)
+            while end != -1:
+                self.add_line(bytes(pending[:end + 1]), lines, cmd)
+                del pending[:end + 1]
+                end = pending.find(b"\n")
+
+    def add_line(self, line, lines, cmd):
+        """
+        Collect one line of output. Called by read_stream.
+
+        Args:
+            line (bytes): Line, with its end if it has one
+            lines list(str): Collected lines. Updated in place.
+            cmd list(str): Command, for logging
+
+        Returns:
+            No return value
+        """
+
+        text = line.decode(errors='replace')
+        lines.append(text)
+        if self.logger:
+            self.logger.debug("{0}: {1}".format(cmd[0], text.rstrip()))
+
+    @staticmethod
+    async def stop(process, own_group=False):
+        """
+        Kill a process if it is still running, and wait for it
+
+        Args:
+            process (obj): asyncio.subprocess.Process
+            own_group (bool): Kill its whole process group, children included, so that nothing keeps the pipes open
+
+        Returns:
+            No return value
+        """
+
+        if process.returncode is None:
+            if own_group:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except OSError:
+                    process.kill()
+            else:
+                process.kill()
+        await process.wait()
@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+
+
+class CaskDefinition:
+    """CaskDefinition is the metadata parsed from a Homebrew Cask definition (.rb) file"""
+
+    # e.g. app 'Airmail 3.app'   app "Foo.app", target: "Bar.app"   version :latest
+    STANZA_PATTERN = re.compile(
+        r"""^\s*(?P<stanza>app|version|url|sha256|pkg)\s+"""
+        r"""(?:(?P<quote>['"])(?P<value>.*?)(?P=quote)|:(?P<symbol>\w+))"""
+        r"""(?:\s*,\s*target:\s*(?P<target_quote>['"])(?P<target>.*?)(?P=target_quote))?""")
+    CASK_PATTERN = re.compile(r"""^\s*cask\s+['"](?P<token>[^'"]+)['"]\s+do""")
+
+    cache = {}
+    cache_lock = threading.Lock()
+
+    def __init__(self,
+                 path=None,
+                 token=None,
+                 version=None,
+                 url=None,
+                 sha256=None,
+                 apps=None,
+                 pkgs=None):
+        """
+        Create a new CaskDefinition instance
+
+        Args:
+            path (str): Path of the .rb file
+            token (str): Cask token e.g. 'airmail'
+            version (str): version stanza e.g. '3.6.41' or 'latest'
+            url (str): url stanza, with #{version} expanded
+            sha256 (str): sha256 stanza e.g. a checksum or 'no_check'
+            apps list(str): Application names installed in /Applications, after any target: rename
+            pkgs list(str): pkg stanzas
+        """
+
+        self.path = path
+        self.token = token
+        self.version = version
+        self.url = url
+        self.sha256 = sha256
+        self.apps = apps if apps else []
+        self.pkgs = pkgs if pkgs else []
+
+    @property
+    def app(self):
+        """
+        The first application installed by this cask
+
+        Returns:
+            str: Application name e.g. 'Airmail 3.app' or None
+        """
+        return self.apps[0] if self.apps else None
+
+    @classmethod
+    def parse(cls, text=None, path=None):
+        """
+        Parse the text of a cask definition
+
+        Args:
+            text (str): Contents of the .rb file
+            path (str): Path of the .rb file, for reference only
+
+        Returns:
+            obj: CaskDefinition instance
+        """
+
+        definition = CaskDefinition(path=path)
+        for line in text.splitlines():
+            match = cls.CASK_PATTERN.match(line)
+            if match:
+                definition.token = match.group('token')
+                continue
+            match = cls.STANZA_PATTERN.match(line)
+            if not match:
+                continue
+            stanza = match.group('stanza')
+            value = match.group('value') if match.group('quote') else match.group('symbol')
+            if stanza == 'app':
+                definition.apps.append(match.group('target') or value)
+            elif stanza == 'pkg':
+                definition.pkgs.append(value)
+            elif getattr(definition, stanza) is None:
+                # Only the first stanza counts, later ones are usually inside on_* blocks
+                setattr(definition, stanza, value)
+
+        if definition.url and definition.version:
+            definition.url = definition.url.replace("#{version}", definition.version)
+        return definition
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        Load a cask definition, parsing the file only if it changed since it was last loaded
+
+        Args:
+            path (str): Path of the .rb file
+
+        Returns:
+            obj: CaskDefinition instance
+
+            Raises OSError if the file can't be read
+        """
+
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with cls.cache_lock:
+            cached = cls.cache.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        with open(path, 'r') as cask_def:
+            definition = cls.parse(text=cask_def.read(), path=path)
+        with cls.cache_lock:
+            cls.cache[path] = (key, definition)
+        return definition
+
+    def __repr__(self):
+        """
+        Create the string representation of this object. For print(...) etc.
+
+        Returns:
+            String representation of this object
+        """
+        return "token:{0},version:{1},url:{2},sha256:{3},apps:{4},pkgs:{5}".format(
+            self.token, self.version, self.url, self.sha256, self.apps, self.pkgs)
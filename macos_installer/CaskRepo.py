@@ -0,0 +1,241 @@
+import json
+import os
+import threading
+import time
+
+from . import command
+
+
+class CaskRepo:
+    """CaskRepo keeps a git checkout of local cask definitions up to date, syncing at most once per run"""
+
+    # Seconds after a successful check during which the remote isn't contacted at all
+    ttl = 15 * 60
+
+    STATE_FILE_NAME = "macos_installer_sync.json"
+
+    repos = {}
+    repos_lock = threading.Lock()
+
+    def __init__(self,
+                 logger=None,
+                 url=None,
+                 repo_dir=None,
+                 ttl=None):
+        """
+        Create a new CaskRepo instance
+
+        Args:
+            logger (obj): Logger instance
+            url (str): git URL of the cask definitions repo
+            repo_dir (str): Local checkout directory
+            ttl (int): Seconds a successful check stays fresh. Defaults to CaskRepo.ttl
+        """
+
+        self.logger = logger
+        self.url = url
+        self.repo_dir = repo_dir
+        self.ttl = ttl if ttl is not None else CaskRepo.ttl
+        self.synced = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get(cls, logger=None, url=None, repo_dir=None):
+        """
+        Get the shared instance for a checkout directory
+
+        Args:
+            logger (obj): Logger instance
+            url (str): git URL of the cask definitions repo
+            repo_dir (str): Local checkout directory
+
+        Returns:
+            obj: CaskRepo instance
+        """
+
+        with cls.repos_lock:
+            repo = cls.repos.get(repo_dir)
+            if repo is None:
+                repo = CaskRepo(logger=logger, url=url, repo_dir=repo_dir)
+                cls.repos[repo_dir] = repo
+            return repo
+
+    @classmethod
+    def reset(cls):
+        """
+        Forget all sync results so that the next run checks again. Called once per run.
+
+        Returns:
+            No return value
+        """
+
+        with cls.repos_lock:
+            cls.repos = {}
+
+    def ensure_synced(self):
+        """
+        Sync the checkout unless that already happened during this run. All callers share the result.
+
+        Returns:
+            bool: True if the checkout is present and up to date, False otherwise
+        """
+
+        with self.lock:
+            if self.synced is None:
+                self.synced = self.sync()
+            return self.synced
+
+    def sync(self, force=False):
+        """
+        Clone the repo if missing. Otherwise fetch only if the TTL expired and the remote ref moved. A checkout
+        that can't be updated, because the remote can't be reached or it has local changes, is used as it is.
+
+        Args:
+            force (bool): Ignore the TTL and compare with the remote ref
+
+        Returns:
+            bool: True if the checkout is present, False if it is missing and couldn't be cloned
+        """
+
+        if not os.path.exists(self.repo_dir):
+            return self.clone()
+
+        state = self.read_state()
+        if not force and state and time.time() - state.get("checked", 0) < self.ttl:
+            self.logger.info("CaskRepo.sync {0} checked recently, skipping".format(self.repo_dir))
+            return True
+
+        remote_ref = self.remote_ref()
+        if remote_ref is None:
+            self.logger.warning("CaskRepo.sync {0} can't reach {1}, using the checkout as it is".format(
+                self.repo_dir, self.url))
+            return True
+        local_ref = state.get("ref") if state else self.local_ref()
+        if remote_ref == local_ref:
+            self.logger.info("CaskRepo.sync {0} is up to date".format(self.repo_dir))
+            self.write_state(remote_ref)
+            return True
+
+        if self.has_local_changes(state):
+            self.logger.warning("CaskRepo.sync {0} has local changes, not updating it".format(self.repo_dir))
+            return True
+
+        # Shallow like the clone: only the remote's latest commit is fetched, then checked out as is.
+        # A depth 1 fetch has no common history with the checkout, so it can't be merged.
+        for cmd in (['git', 'fetch', '--depth', '1', 'origin', 'HEAD'], ['git', 'reset', '--hard', 'FETCH_HEAD']):
+            results = command.run(cmd=cmd, working_dir=self.repo_dir, logger=self.logger)
+            if not results.success:
+                self.logger.warning(("CaskRepo error updating cask definitions repo, using the checkout as it is"
+                                     + " status {0} results {1} errors {2}").format(
+                                     results.status_code, results.results, results.errors))
+                return True
+        self.write_state(self.local_ref() or remote_ref)
+        return True
+
+    def has_local_changes(self, state=None):
+        """
+        Does the checkout have changes an update would throw away: uncommitted edits, or commits made since the
+        last sync?
+
+        Args:
+            state (dict): Last sync record from read_state() or None
+
+        Returns:
+            bool: True if it has local changes or its status can't be read
+        """
+
+        cmd = ['git', 'status', '--porcelain']
+        results = command.run(cmd=cmd, working_dir=self.repo_dir, logger=self.logger)
+        if not results.success or results.results.strip():
+            return True
+        return state is not None and self.local_ref() != state.get("ref")
+
+    def clone(self):
+        """
+        Shallow clone the repo
+
+        Returns:
+            bool: True if the clone succeeded, False otherwise
+        """
+
+        parent_dir = os.path.dirname(self.repo_dir)
+        os.makedirs(parent_dir, exist_ok=True)
+        cmd = ['git', 'clone', '--depth', '1', self.url, self.repo_dir]
+        results = command.run(cmd=cmd, working_dir=parent_dir, logger=self.logger)
+        if not results.success:
+            self.logger.error(("CaskRepo error cloning cask definitions repo"
+                               + " status {0} results {1} errors {2}").format(
+                               results.status_code, results.results, results.errors))
+            return False
+        self.write_state(self.local_ref())
+        return True
+
+    def remote_ref(self):
+        """
+        Get the commit the remote's default branch points to
+
+        Returns:
+            str: Commit id or None if the remote can't be reached
+        """
+
+        cmd = ['git', 'ls-remote', self.url, 'HEAD']
+        results = command.run(cmd=cmd, working_dir=self.repo_dir, logger=self.logger)
+        if not results.success or not results.results.strip():
+            self.logger.warning(("CaskRepo error checking cask definitions repo"
+                                 + " status {0} results {1} errors {2}").format(
+                                 results.status_code, results.results, results.errors))
+            return None
+        return results.results.split()[0]
+
+    def local_ref(self):
+        """
+        Get the commit the checkout is at
+
+        Returns:
+            str: Commit id or None
+        """
+
+        cmd = ['git', 'rev-parse', 'HEAD']
+        results = command.run(cmd=cmd, working_dir=self.repo_dir, logger=self.logger)
+        return results.results.strip() if results.success else None
+
+    def state_file(self):
+        """
+        Get the path of the file recording the last sync. Kept inside .git so it's never committed.
+
+        Returns:
+            str: Path
+        """
+        return os.path.join(self.repo_dir, ".git", self.STATE_FILE_NAME)
+
+    def read_state(self):
+        """
+        Read the last sync record
+
+        Returns:
+            dict: 'ref' and 'checked' (epoch seconds) or None if there is no valid record
+        """
+
+        try:
+            with open(self.state_file(), 'r') as state_file:
+                state = json.load(state_file)
+            return state if isinstance(state, dict) else None
+        except (OSError, ValueError):
+            return None
+
+    def write_state(self, ref):
+        """
+        Record a successful sync
+
+        Args:
+            ref (str): Commit id the checkout is at
+
+        Returns:
+            No return value
+        """
+
+        try:
+            with open(self.state_file(), 'w') as state_file:
+                json.dump({"ref": ref, "checked": time.time()}, state_file)
+        except OSError as e:
+            self.logger.warning("CaskRepo can't record sync state: {0}".format(e))
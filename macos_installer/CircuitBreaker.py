@@ -0,0 +1,289 @@
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+
+class CircuitBreaker:
+    """CircuitBreaker tracks the health of a backend's commands, retrying transient failures and failing
+    fast once the backend looks down"""
+
+    # Consecutive transient failures, each after its retries, that open the circuit for the rest of the run
+    threshold = 3
+
+    # Retries of a command that failed transiently, waiting a random time up to base_delay * 2 ** attempt
+    # seconds but never more than max_delay
+    retries = 2
+    base_delay = 1.0
+    max_delay = 30.0
+
+    # Output, lowercased, of commands that failed because of the network or the service rather than the package
+    TRANSIENT_ERRORS = (
+        "could not resolve host",
+        "couldn't resolve host",
+        "failed to connect",
+        "connection refused",
+        "connection reset",
+        "connection timed out",
+        "operation timed out",
+        "network is unreachable",
+        "temporary failure in name resolution",
+        "service unavailable",
+        "bad gateway",
+        "gateway timeout",
+        "the request timed out",
+        "the internet connection appears to be offline",
+        "curl: (6)",
+        "curl: (7)",
+        "curl: (28)",
+        "curl: (35)",
+        "curl: (56)",
+    )
+
+    breakers = {}
+    breakers_lock = threading.Lock()
+
+    # Backends whose commands were refused or failed transiently in the current thread or task, see watch()
+    unavailable = contextvars.ContextVar("unavailable", default=None)
+
+    def __init__(self,
+                 logger=None,
+                 backend=None):
+        """
+        Create a new CircuitBreaker instance
+
+        Args:
+            logger (obj): Logger instance
+            backend (str): package_type whose commands this breaker guards
+        """
+
+        self.logger = logger
+        self.backend = backend
+        self.failures = 0
+        self.open = False
+        self.lock = threading.Lock()
+
+    @classmethod
+    def is_transient(cls, results):
+        """
+        Did a command fail in a way that trying again later may fix?
+
+        Args:
+            results (obj): Command results with success, status_code, results and errors
+
+        Returns:
+            bool: True if the command timed out or its output names a network or service error
+        """
+
+        if results.success:
+            return False
+        if getattr(results, 'timed_out', False):
+            return True
+        output = "{0}\n{1}".format(results.errors or "", results.results or "").lower()
+        return any(error in output for error in cls.TRANSIENT_ERRORS)
+
+    def delay(self, attempt):
+        """
+        Get the time to wait before a retry: exponential backoff with full jitter, so that commands failing
+        together don't retry together
+
+        Args:
+            attempt (int): Number of the retry, from 0
+
+        Returns:
+            float: Seconds
+        """
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def refuse(self, cmd=None):
+        """
+        Get the results of a command not run because the circuit is open
+
+        Args:
+            cmd list(str): Command and arguments
+
+        Returns:
+            obj: CommandResults instance that failed
+        """
+
+        # Imported here: AsyncCommandRunner builds on this class
+        from .AsyncCommandRunner import CommandResults
+
+        if self.logger:
+            self.logger.info("CircuitBreaker {0} is open, not running {1}".format(self.backend, " ".join(cmd)))
+        self.mark_unavailable()
+        return CommandResults(status_code=None, errors="{0} circuit open".format(self.backend))
+
+    def record(self, results=None, cmd=None):
+        """
+        Record the final outcome of a command. A success closes the streak of failures; a transient failure
+        extends it and opens the circuit at threshold.
+
+        Args:
+            results (obj): Command results
+            cmd list(str): Command and arguments
+
+        Returns:
+            No return value
+        """
+
+        with self.lock:
+            if results.success:
+                self.failures = 0
+                return
+            if not self.is_transient(results):
+                return
+            self.mark_unavailable()
+            self.failures += 1
+            if self.failures < self.threshold or self.open:
+                return
+            self.open = True
+        if self.logger:
+            self.logger.error("CircuitBreaker {0} open after {1} consecutive failures, last {2}: the remaining "
+                              "{0} packages are deferred".format(self.backend, self.threshold, " ".join(cmd)))
+
+    def retry(self, results=None, attempt=0, cmd=None):
+        """
+        Should a command be run again?
+
+        Args:
+            results (obj): Command results of the attempt
+            attempt (int): Number of the attempt, from 0
+            cmd list(str): Command and arguments
+
+        Returns:
+            bool: True if it failed transiently, has retries left and the circuit is still closed
+        """
+
+        if attempt >= self.retries or self.open or not self.is_transient(results):
+            return False
+        if self.logger:
+            self.logger.warning("CircuitBreaker {0} {1} failed transiently, retrying: {2}".format(
+                self.backend, " ".join(cmd), (results.errors or "").strip()))
+        return True
+
+    def call(self, cmd=None, run=None):
+        """
+        Run a command through the breaker
+
+        Args:
+            cmd list(str): Command and arguments
+            run (callable): Runs the command once and returns its results
+
+        Returns:
+            obj: Command results, failed without running if the circuit is open
+        """
+
+        attempt = 0
+        while True:
+            if self.open:
+                return self.refuse(cmd=cmd)
+            results = run()
+            if not self.retry(results=results, attempt=attempt, cmd=cmd):
+                self.record(results=results, cmd=cmd)
+                return results
+            time.sleep(self.delay(attempt))
+            attempt += 1
+
+    async def call_async(self, cmd=None, run=None):
+        """
+        Run a command through the breaker on the event loop
+
+        Args:
+            cmd list(str): Command and arguments
+            run (callable): Returns an awaitable that runs the command once and returns its results
+
+        Returns:
+            obj: Command results, failed without running if the circuit is open
+        """
+
+        attempt = 0
+        while True:
+            if self.open:
+                return self.refuse(cmd=cmd)
+            results = await run()
+            if not self.retry(results=results, attempt=attempt, cmd=cmd):
+                self.record(results=results, cmd=cmd)
+                return results
+            await asyncio.sleep(self.delay(attempt))
+            attempt += 1
+
+    def mark_unavailable(self):
+        """
+        Note in the current watch() that a command of this backend was refused or failed transiently
+
+        Returns:
+            No return value
+        """
+
+        backends = self.unavailable.get()
+        if backends is not None:
+            backends.add(self.backend)
+
+    @classmethod
+    @contextmanager
+    def watch(cls):
+        """
+        Collect the backends whose commands were refused or failed transiently in the enclosed block, in
+        this thread or task only. A failure with none of them is the package's own.
+
+        Returns:
+            Context manager yielding the set of package_types
+        """
+
+        backends = set()
+        token = cls.unavailable.set(backends)
+        try:
+            yield backends
+        finally:
+            cls.unavailable.reset(token)
+
+    @classmethod
+    def get(cls, logger=None, backend=None):
+        """
+        Get the breaker shared by all commands of a backend, creating it on first use
+
+        Args:
+            logger (obj): Logger instance
+            backend (str): package_type
+
+        Returns:
+            obj: CircuitBreaker instance
+        """
+
+        with cls.breakers_lock:
+            breaker = cls.breakers.get(backend)
+            if breaker is None:
+                breaker = CircuitBreaker(logger=logger, backend=backend)
+                cls.breakers[backend] = breaker
+            return breaker
+
+    @classmethod
+    def is_open(cls, backend=None):
+        """
+        Has a backend's circuit opened in this run?
+
+        Args:
+            backend (str): package_type
+
+        Returns:
+            bool: True if its commands are no longer run
+        """
+
+        breaker = cls.breakers.get(backend)
+        return breaker is not None and breaker.open
+
+    @classmethod
+    def reset(cls):
+        """
+        Close all circuits. Called once per run: a backend that was down may be back.
+
+        Returns:
+            No return value
+        """
+
+        with cls.breakers_lock:
+            cls.breakers = {}
@@ -0,0 +1,160 @@
+import json
+import os
+
+from . import paths
+from .FilesystemProbe import FilesystemProbe
+from .Inventory import Inventory
+from .InventoryCache import InventoryCache
+
+
+class Convergence:
+    """Convergence records that a manifest was fully applied and the state of the system it left behind"""
+
+    FILE_NAME = "converged.json"
+    FORMAT_VERSION = 1
+
+    # Backends whose install directories make up the system fingerprint
+    BACKENDS = ('brew', 'brewcask', 'mas')
+
+    def __init__(self,
+                 logger=None,
+                 manifest_hash=None,
+                 path=None,
+                 probe=None):
+        """
+        Create a new Convergence instance
+
+        Args:
+            logger (obj): Logger instance
+            manifest_hash (str): Content hash of the manifest being run
+            path (str): Record file. Defaults to converged.json in paths.cache_dir()
+            probe (obj): FilesystemProbe giving the directories fingerprinted. Defaults to Inventory.probe
+                or a FilesystemProbe
+        """
+
+        self.logger = logger
+        self.manifest_hash = manifest_hash
+        self.configured_path = path
+        self.probe = probe
+
+    @property
+    def path(self):
+        """
+        Record file path, resolved when first needed
+
+        Returns:
+            str: Path
+        """
+        if not self.configured_path:
+            self.configured_path = os.path.join(paths.cache_dir(), self.FILE_NAME)
+        return self.configured_path
+
+    def fingerprint(self):
+        """
+        Compute a fingerprint of what is installed: the modification time and number of entries of the
+        Homebrew Cellar and Caskroom and of the applications directory, and whether local casks are enabled.
+        Installing or removing any package changes it.
+
+        Returns:
+            list: Fingerprint or None if a directory is missing
+        """
+
+        if self.probe is None:
+            self.probe = Inventory.probe or FilesystemProbe()
+
+        directories = []
+        for backend in self.BACKENDS:
+            for directory in self.probe.directories(backend):
+                if directory not in directories:
+                    directories.append(directory)
+        fingerprint = InventoryCache.fingerprint(directories)
+        if fingerprint is None:
+            return None
+        return fingerprint + [os.path.exists(paths.personal_bootstrap())]
+
+    def read(self):
+        """
+        Read the record of the last converged run
+
+        Returns:
+            dict: 'manifest' and 'fingerprint' or None if there is no readable record
+        """
+
+        try:
+            with open(self.path, 'r') as record_file:
+                record = json.load(record_file)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(record, dict) or record.get("version") != self.FORMAT_VERSION:
+            return None
+        return record
+
+    def is_converged(self):
+        """
+        Did the last fully successful run apply this manifest, with nothing installed or removed since?
+
+        Returns:
+            bool: True if converged
+        """
+
+        if self.manifest_hash is None:
+            return False
+        record = self.read()
+        if record is None or record.get("manifest") != self.manifest_hash:
+            return False
+        fingerprint = self.fingerprint()
+        return fingerprint is not None and record.get("fingerprint") == fingerprint
+
+    def record(self, results=None):
+        """
+        Record the outcome of a run. Only a fully successful run, after which every package is in its
+        configured state, is recorded as converged; any other run clears the record. So is a run with
+        packages configured 'latest': a new version can appear without anything changing on this system.
+        And a run with version constraints: an upgrade outside the installer adds a keg without changing
+        the fingerprinted directories.
+
+        Args:
+            results (dict): installer -> result of install() or remove(), None if skipped
+
+        Returns:
+            bool: True if recorded as converged
+        """
+
+        converged = (self.manifest_hash is not None and results is not None and
+                     all(result is not None for result in results.values()) and
+                     all(installer.action() != "upgrade" for installer in results) and
+                     all(installer.version_constraint() is None for installer in results) and
+                     all(installer.is_satisfied() for installer in results))
+        fingerprint = self.fingerprint() if converged else None
+        if fingerprint is None:
+            self.clear()
+            return False
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = "{0}.{1}.tmp".format(self.path, os.getpid())
+            with open(tmp_path, 'w') as record_file:
+                json.dump({"version": self.FORMAT_VERSION, "manifest": self.manifest_hash,
+                           "fingerprint": fingerprint}, record_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            if self.logger:
+                self.logger.warning("Convergence.record {0} failed: {1}".format(self.path, e))
+            return False
+        return True
+
+    def clear(self):
+        """
+        Forget the converged state so that the next run checks every package
+
+        Returns:
+            No return value
+        """
+
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            if self.logger:
+                self.logger.warning("Convergence.clear {0} failed: {1}".format(self.path, e))
@@ -0,0 +1,148 @@
+class DependencyGraph:
+    """DependencyGraph links installers to the installers named in their package's depends_on"""
+
+    def __init__(self,
+                 logger=None,
+                 installers=None):
+        """
+        Create a new DependencyGraph instance. A name matches every installer with that name,
+        whatever its package type.
+
+        Args:
+            logger (obj): Logger instance
+            installers list(obj): \*Installer instances, including any that won't run but can be depended on
+        """
+
+        self.logger = logger
+        self.installers = list(installers or [])
+        self.dependencies = {}
+        self.dependents = {}
+        self.unknown = {}
+
+        by_name = {}
+        for installer in self.installers:
+            by_name.setdefault(installer.name, []).append(installer)
+
+        for installer in self.installers:
+            dependencies = []
+            for name in installer.package_info.depends_on or []:
+                found = by_name.get(name)
+                if not found:
+                    self.unknown.setdefault(installer, []).append(name)
+                    continue
+                for dependency in found:
+                    if dependency is not installer and dependency not in dependencies:
+                        dependencies.append(dependency)
+            self.dependencies[installer] = dependencies
+            for dependency in dependencies:
+                self.dependents.setdefault(dependency, []).append(installer)
+
+    def has_edges(self, installer=None):
+        """
+        Does an installer depend on another or have dependents? Without an installer: does any?
+
+        Args:
+            installer (obj): \*Installer instance or None
+
+        Returns:
+            bool: True if it has edges
+        """
+
+        if installer is None:
+            return any(self.dependencies.values()) or bool(self.unknown)
+        return bool(self.dependencies.get(installer) or self.dependents.get(installer) or
+                    installer in self.unknown)
+
+    def find_cycle(self):
+        """
+        Find a dependency cycle
+
+        Returns:
+            list(obj): Installers on a cycle, the first repeated at the end, or None if there is none
+        """
+
+        visiting, done = 1, 2
+        marks = {}
+        for root in self.installers:
+            if marks.get(root):
+                continue
+            # Iterative depth first search: (installer, index of the next dependency to visit)
+            stack = [(root, 0)]
+            marks[root] = visiting
+            while stack:
+                installer, index = stack[-1]
+                dependencies = self.dependencies[installer]
+                if index == len(dependencies):
+                    marks[installer] = done
+                    stack.pop()
+                    continue
+                stack[-1] = (installer, index + 1)
+                dependency = dependencies[index]
+                mark = marks.get(dependency)
+                if mark == visiting:
+                    path = [entry[0] for entry in stack]
+                    return path[path.index(dependency):] + [dependency]
+                if not mark:
+                    marks[dependency] = visiting
+                    stack.append((dependency, 0))
+        return None
+
+    def topological_order(self):
+        """
+        Order the installers so that each comes after its dependencies. Requires no cycle.
+
+        Returns:
+            list(obj): Installers
+        """
+
+        remaining = {installer: len(self.dependencies[installer]) for installer in self.installers}
+        order = [installer for installer in self.installers if not remaining[installer]]
+        for installer in order:
+            for dependent in self.dependents.get(installer, []):
+                remaining[dependent] -= 1
+                if not remaining[dependent]:
+                    order.append(dependent)
+        return order
+
+    def critical_paths(self, cost=None):
+        """
+        Compute the length of the longest chain of dependents starting at each installer, itself included.
+        Starting the installers with the longest chains first shortens the whole run.
+
+        Args:
+            cost (callable): Called with an installer, returns its estimated duration. Defaults to 1 each.
+
+        Returns:
+            dict: installer -> length
+        """
+
+        lengths = {}
+        for installer in reversed(self.topological_order()):
+            own = cost(installer) if cost else 1.0
+            lengths[installer] = own + max((lengths[dependent] for dependent in self.dependents.get(installer, [])),
+                                           default=0.0)
+        return lengths
+
+    @classmethod
+    def build(cls, logger=None, installers=None):
+        """
+        Create the graph of the installers and check it can be executed
+
+        Args:
+            logger (obj): Logger instance
+            installers list(obj): \*Installer instances
+
+        Returns:
+            obj: DependencyGraph instance or None if the dependencies form a cycle
+        """
+
+        graph = DependencyGraph(logger=logger, installers=installers)
+        for installer, names in graph.unknown.items():
+            logger.error("DependencyGraph {0} depends on {1}, which is not in the data".format(
+                installer.name, ", ".join(names)))
+        cycle = graph.find_cycle()
+        if cycle:
+            logger.error("DependencyGraph dependency cycle: {0}".format(
+                " -> ".join(installer.name for installer in cycle)))
+            return None
+        return graph
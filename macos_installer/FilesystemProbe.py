@@ -0,0 +1,142 @@
+import os
+
+
+class FilesystemProbe:
+    """FilesystemProbe answers presence questions by scanning Homebrew and application directories"""
+
+    DEFAULT_PREFIXES = ["/opt/homebrew", "/usr/local"]
+    DEFAULT_APPLICATIONS_DIR = "/Applications"
+
+    def __init__(self,
+                 prefix=None,
+                 applications_dir=None):
+        """
+        Create a new FilesystemProbe instance
+
+        Args:
+            prefix (str): Homebrew prefix. Defaults to $HOMEBREW_PREFIX or the first of DEFAULT_PREFIXES that exists
+            applications_dir (str): Applications directory. Defaults to $MACOS_INSTALLER_APPLICATIONS_DIR
+                or /Applications
+        """
+
+        self.configured_prefix = prefix
+        self.configured_applications_dir = applications_dir
+
+    @property
+    def prefix(self):
+        """
+        Homebrew prefix, resolved when first needed
+
+        Returns:
+            str: Homebrew prefix
+        """
+        if not self.configured_prefix:
+            self.configured_prefix = self.default_prefix()
+        return self.configured_prefix
+
+    @property
+    def applications_dir(self):
+        """
+        Applications directory, resolved when first needed
+
+        Returns:
+            str: Applications directory
+        """
+        if not self.configured_applications_dir:
+            self.configured_applications_dir = os.environ.get(
+                'MACOS_INSTALLER_APPLICATIONS_DIR', self.DEFAULT_APPLICATIONS_DIR)
+        return self.configured_applications_dir
+
+    @classmethod
+    def default_prefix(cls):
+        """
+        Find the Homebrew prefix
+
+        Returns:
+            str: Homebrew prefix
+        """
+
+        prefix = os.environ.get('HOMEBREW_PREFIX')
+        if prefix:
+            return prefix
+        for prefix in cls.DEFAULT_PREFIXES:
+            if os.path.isdir(os.path.join(prefix, "Cellar")):
+                return prefix
+        return cls.DEFAULT_PREFIXES[-1]
+
+    def directories(self, backend):
+        """
+        Get the directories whose contents tell what is installed for a backend
+
+        Args:
+            backend (str): package_type
+
+        Returns:
+            list(str): Directory paths
+        """
+
+        if backend == 'brew':
+            return [os.path.join(self.prefix, "Cellar")]
+        elif backend == 'brewcask':
+            return [os.path.join(self.prefix, "Caskroom")]
+        elif backend in ('mas', 'brewcasklocal'):
+            return [self.applications_dir]
+        else:
+            return []
+
+    def scan(self, backend):
+        """
+        Scan the directories for a backend once
+
+        Args:
+            backend (str): package_type
+
+        Returns:
+            tuple(set(str), bool):
+
+            Names found and whether they are the complete answer. A name not found in a complete
+            answer isn't installed; for an incomplete answer only found names are conclusive.
+
+            None if the probe can't decide anything for this backend
+        """
+
+        if backend == 'brew' or backend == 'brewcask':
+            # Cellar/<formula> and Caskroom/<cask>
+            names = self.entries(self.directories(backend)[0])
+            return (names, True) if names is not None else None
+
+        elif backend == 'brewcasklocal':
+            # Installed applications e.g. 'Airmail 3.app'
+            names = self.entries(self.applications_dir)
+            return (names if names is not None else set()), True
+
+        elif backend == 'mas':
+            # Apps from the Mac Apple Store carry a receipt. The mas_id isn't on disk in readable
+            # form, so only apps found by name are conclusive.
+            names = set()
+            for entry in self.entries(self.applications_dir) or []:
+                if entry.endswith(".app") and os.path.exists(
+                        os.path.join(self.applications_dir, entry, "Contents", "_MASReceipt")):
+                    names.add(entry[:-len(".app")])
+            return names, False
+
+        else:
+            return None
+
+    @staticmethod
+    def entries(directory):
+        """
+        List a directory
+
+        Args:
+            directory (str): Directory path
+
+        Returns:
+            set(str): Entry names or None if the directory can't be read
+        """
+
+        try:
+            with os.scandir(directory) as scanned:
+                return {entry.name for entry in scanned if not entry.name.startswith(".")}
+        except OSError:
+            return None
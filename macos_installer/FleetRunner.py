@@ -0,0 +1,340 @@
+import asyncio
+import json
+import os
+import signal
+import time
+
+from .Tracer import Tracer
+from .packages_data import PACKAGES_DATA
+
+
+class HostResult:
+    """HostResult is the outcome of a fleet run on a single host"""
+
+    # Host statuses besides the installer report statuses ('converged', 'changed', 'unchanged', 'failed')
+    UNREACHABLE = "unreachable"
+    TIMEOUT = "timeout"
+    ERROR = "error"
+
+    def __init__(self,
+                 host=None,
+                 status=None,
+                 exit_code=None,
+                 report=None,
+                 errors=None,
+                 duration=0.0):
+        """
+        Create a new HostResult instance
+
+        Args:
+            host (str): Host name
+            status (str): Report status, or 'unreachable', 'timeout' or 'error' if there is no report
+            exit_code (int): Exit status of the transport command
+            report (dict): Installer report, or the plan of a plan run. None if the host sent none.
+            errors list(str): Last lines the host wrote, kept when there is no report
+            duration (float): Seconds from start to finish
+        """
+
+        self.host = host
+        self.status = status
+        self.exit_code = exit_code
+        self.report = report
+        self.errors = errors if errors else []
+        self.duration = duration
+
+    def to_data(self):
+        """
+        Create a JSON compatible representation of this result
+
+        Returns:
+            dict: status, exit_code, duration, report and errors
+        """
+        return {
+            "status": self.status,
+            "exit_code": self.exit_code,
+            "duration": round(self.duration, 3),
+            "report": self.report,
+            "errors": self.errors,
+        }
+
+    def __repr__(self):
+        """
+        Create the string representation of this object. For print(...) etc.
+
+        Returns:
+            String representation of this object
+        """
+        return "{0}:{1}".format(self.host, self.status)
+
+
+class FleetRunner:
+    """FleetRunner converges one manifest across many hosts at once, through a pluggable transport"""
+
+    # Hosts running at once. A fleet run takes about as long as its slowest host while the fleet fits.
+    DEFAULT_PARALLEL = 64
+
+    # Lines kept from a host that sent no report
+    ERROR_LINES = 20
+
+    # Longest line read from a host. A report is one line, a few hundred bytes per package.
+    STREAM_LIMIT = 64 * 1024 * 1024
+
+    def __init__(self,
+                 logger=None,
+                 transport=None,
+                 parallel=None,
+                 timeout=None,
+                 progress=None):
+        """
+        Create a new FleetRunner instance
+
+        Args:
+            logger (obj): Logger instance
+            transport (obj): \*Transport instance, e.g. SSHTransport or LocalTransport
+            parallel (int): Maximum hosts running at once. Defaults to DEFAULT_PARALLEL
+            timeout (float): Seconds before a host's run is killed. None for no limit.
+            progress (callable): Called with (host, line) for each line a host writes. Defaults to logging it.
+        """
+
+        self.logger = logger
+        self.transport = transport
+        self.parallel = parallel if parallel else self.DEFAULT_PARALLEL
+        self.timeout = timeout
+        self.progress = progress if progress else self.log_progress
+
+    def log_progress(self, host, line):
+        """
+        Log a line a host wrote
+
+        Args:
+            host (str): Host name
+            line (str): Line, without its end
+
+        Returns:
+            No return value
+        """
+        self.logger.info("{0}: {1}".format(host, line))
+
+    @staticmethod
+    def arguments(plan=False, options=None):
+        """
+        Get the installer command line for each host. The manifest comes on standard input and the report
+        goes to standard output.
+
+        Args:
+            plan (bool): Only plan on each host
+            options list(str): Other installer arguments e.g. ["--batch"]
+
+        Returns:
+            list(str): Installer arguments
+        """
+        return ["--data", "-", "--report", "-"] + (["--plan"] if plan else []) + list(options or [])
+
+    def run(self, hosts=None, data=None, plan=False, options=None):
+        """
+        Run the installer on every host
+
+        Args:
+            hosts list(str): Host names
+            data (str): JSON manifest sent to every host. Defaults to packages_data.PACKAGES_DATA
+            plan (bool): Only plan on each host: the reports are the hosts' plans
+            options list(str): Other installer arguments e.g. ["--batch"]
+
+        Returns:
+            list(obj): HostResult instances in host order
+        """
+        return asyncio.run(self.run_async(hosts=hosts, data=data, plan=plan, options=options))
+
+    async def run_async(self, hosts=None, data=None, plan=False, options=None):
+        """
+        Run the installer on every host, at most parallel hosts at once, on an asyncio event loop
+
+        Args:
+            hosts list(str): Host names
+            data (str): JSON manifest sent to every host. Defaults to packages_data.PACKAGES_DATA
+            plan (bool): Only plan on each host
+            options list(str): Other installer arguments e.g. ["--batch"]
+
+        Returns:
+            list(obj): HostResult instances in host order
+        """
+
+        data = data if data else PACKAGES_DATA
+        if not isinstance(data, str):
+            data = json.dumps(data)
+        arguments = self.arguments(plan=plan, options=options)
+        semaphore = asyncio.Semaphore(self.parallel)
+
+        async def run_limited(host):
+            async with semaphore:
+                return await self.run_host(host=host, data=data, arguments=arguments)
+
+        return list(await asyncio.gather(*(run_limited(host) for host in hosts)))
+
+    async def run_host(self, host=None, data=None, arguments=None):
+        """
+        Run the installer on one host, streaming what it writes to progress
+
+        Args:
+            host (str): Host name
+            data (str): JSON manifest
+            arguments list(str): Installer arguments
+
+        Returns:
+            obj: HostResult instance
+        """
+
+        started = time.perf_counter()
+        with Tracer.span(name=host, category="fleet") as span_args:
+            try:
+                cmd = self.transport.command(host=host, arguments=arguments)
+                result = await self.spawn(host=host, cmd=cmd, data=data)
+            except Exception as e:
+                # One host's failure never stops the others
+                result = HostResult(host=host, status=HostResult.ERROR, errors=[repr(e)])
+            result.duration = time.perf_counter() - started
+            span_args["status"] = result.status
+        if result.status in (HostResult.UNREACHABLE, HostResult.TIMEOUT, HostResult.ERROR, "failed"):
+            self.logger.error("FleetRunner {0} {1} after {2:.1f}s".format(host, result.status, result.duration))
+        else:
+            self.logger.info("FleetRunner {0} {1} after {2:.1f}s".format(host, result.status, result.duration))
+        return result
+
+    async def spawn(self, host=None, cmd=None, data=None):
+        """
+        Start the transport command for a host, write the manifest and collect its report. Called by run_host.
+
+        Args:
+            host (str): Host name
+            cmd list(str): Transport command
+            data (str): JSON manifest
+
+        Returns:
+            obj: HostResult instance, without its duration
+        """
+
+        try:
+            # Its own process group, so that a timeout kills the transport's children too
+            process = await asyncio.create_subprocess_exec(
+                *cmd, env=self.transport.environment(host=host), stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, start_new_session=True,
+                limit=self.STREAM_LIMIT)
+        except OSError as e:
+            return HostResult(host=host, status=HostResult.ERROR, errors=[str(e)])
+
+        lines = []
+        reports = []
+
+        async def write_data():
+            try:
+                process.stdin.write(data.encode())
+                await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # The host closed its input, e.g. it never started: its exit status says why
+                pass
+            finally:
+                process.stdin.close()
+
+        async def read_stream(stream):
+            while True:
+                line = await stream.readline()
+                if not line:
+                    return
+                text = line.decode(errors='replace').rstrip()
+                if text.startswith("{"):
+                    # The report, one JSON line on standard output
+                    reports.append(text)
+                    continue
+                lines.append(text)
+                del lines[:-self.ERROR_LINES]
+                self.progress(host, text)
+
+        try:
+            await asyncio.wait_for(asyncio.gather(write_data(), read_stream(process.stdout),
+                                                  read_stream(process.stderr), process.wait()),
+                                   timeout=self.timeout)
+        except asyncio.TimeoutError:
+            await self.stop(process)
+            return HostResult(host=host, status=HostResult.TIMEOUT, exit_code=process.returncode, errors=lines)
+        except (ValueError, OSError) as e:
+            # e.g. a line longer than STREAM_LIMIT
+            await self.stop(process)
+            return HostResult(host=host, status=HostResult.ERROR, exit_code=process.returncode,
+                              errors=lines + [str(e)])
+        finally:
+            await self.stop(process)
+
+        report = None
+        for text in reversed(reports):
+            try:
+                report = json.loads(text)
+                break
+            except ValueError:
+                continue
+
+        if report is None:
+            unreachable = (self.transport.UNREACHABLE_STATUS is not None and
+                           process.returncode == self.transport.UNREACHABLE_STATUS)
+            return HostResult(host=host, status=HostResult.UNREACHABLE if unreachable else HostResult.ERROR,
+                              exit_code=process.returncode, errors=lines)
+        # A plan has no status: it is a summary of the actions to take
+        status = report.get("status", "planned")
+        return HostResult(host=host, status=status, exit_code=process.returncode, report=report)
+
+    @staticmethod
+    async def stop(process):
+        """
+        Kill a host's transport command and its children if still running, and wait for it
+
+        Args:
+            process (obj): asyncio.subprocess.Process
+
+        Returns:
+            No return value
+        """
+
+        if process.returncode is None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                process.kill()
+        await process.wait()
+
+    @staticmethod
+    def summary(results=None):
+        """
+        Aggregate the results of a fleet run
+
+        Args:
+            results list(obj): HostResult instances
+
+        Returns:
+            dict: 'hosts', host status -> number of hosts, and 'packages', outcome or planned action ->
+            number of packages across all hosts
+        """
+
+        hosts = {}
+        packages = {}
+        for result in results:
+            hosts[result.status] = hosts.get(result.status, 0) + 1
+            if result.report:
+                for key, count in result.report.get("summary", {}).items():
+                    packages[key] = packages.get(key, 0) + count
+        return {"hosts": hosts, "packages": packages}
+
+    @classmethod
+    def report(cls, results=None):
+        """
+        Create the aggregated report of a fleet run
+
+        Args:
+            results list(obj): HostResult instances
+
+        Returns:
+            dict: 'summary' from summary(), 'duration' of the slowest host and 'hosts', host -> result
+        """
+        return {
+            "summary": cls.summary(results=results),
+            "duration": round(max([result.duration for result in results] or [0.0]), 3),
+            "hosts": {result.host: result.to_data() for result in results},
+        }
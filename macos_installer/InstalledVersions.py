@@ -0,0 +1,239 @@
+import asyncio
+import json
+import threading
+
+from . import command
+
+
+class InstalledVersions:
+    """InstalledVersions is an index of the installed Homebrew package versions, taken with one query per run"""
+
+    # One query answers for formulae and casks alike
+    COMMAND = ["brew", "info", "--json=v2", "--installed"]
+
+    BACKENDS = ('brew', 'brewcask')
+
+    instance = None
+    instance_lock = threading.Lock()
+
+    def __init__(self,
+                 logger=None):
+        """
+        Create a new InstalledVersions instance. The query runs with the first lookup.
+
+        Args:
+            logger (obj): Logger instance
+        """
+
+        self.logger = logger
+        # backend -> name -> list of installed versions
+        self.packages = {}
+        self.loaded = False
+        # (backend, name) of the packages installed or upgraded since the query, looked up again with the
+        # next query rather than one query each
+        self.stale = set()
+        # Query started on the event loop, awaited by every installer that needs it
+        self.loading = None
+        self.lock = threading.RLock()
+
+    def load(self):
+        """
+        Query the installed versions
+
+        Returns:
+            bool: True if the query succeeded, False otherwise
+        """
+
+        with self.lock:
+            results = command.run(cmd=self.COMMAND, logger=self.logger)
+            return self.apply(results)
+
+    async def load_async(self, runner=None):
+        """
+        Query the installed versions on the event loop
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            bool: True if the query succeeded, False otherwise
+        """
+
+        try:
+            results = await runner.run(cmd=self.COMMAND, backend='brew', breaker=False)
+            return self.apply(results)
+        finally:
+            self.loading = None
+
+    def apply(self, results):
+        """
+        Parse the output of the query into the index. A failed query leaves no version known.
+
+        Args:
+            results (obj): Command results with success, status_code, results and errors
+
+        Returns:
+            bool: True if the query succeeded, False otherwise
+        """
+
+        packages = {}
+        success = results.success
+        if success:
+            try:
+                packages = self.parse(results.results)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                self.logger.error("InstalledVersions.load can't parse the output: {0}".format(e))
+                success = False
+        else:
+            self.logger.error("InstalledVersions.load failed status {0} results {1} errors {2}".format(
+                results.status_code, results.results, results.errors))
+
+        with self.lock:
+            self.packages = packages
+            self.stale = set()
+            self.loaded = True
+        return success
+
+    @staticmethod
+    def parse(output):
+        """
+        Parse brew info --json=v2 --installed. Formulae are indexed by name, full name and alias, casks by
+        token and full token.
+
+        Args:
+            output (str): e.g. {"formulae": [{"name": "git", "installed": [{"version": "2.20.1"}], ...}],
+                "casks": [{"token": "atom", "installed": "1.31.1", ...}]}
+
+        Returns:
+            dict: backend -> name -> list of installed versions
+        """
+
+        data = json.loads(output or "{}")
+        formulae = {}
+        for entry in data.get("formulae", []):
+            versions = [keg["version"] for keg in entry.get("installed") or [] if keg.get("version")]
+            for name in [entry["name"], entry.get("full_name")] + list(entry.get("aliases") or []):
+                if name:
+                    formulae[name] = versions
+        casks = {}
+        for entry in data.get("casks", []):
+            installed = entry.get("installed")
+            versions = [installed] if installed else []
+            for name in (entry["token"], entry.get("full_token")):
+                if name:
+                    casks[name] = versions
+        return {'brew': formulae, 'brewcask': casks}
+
+    def needs_load(self, backend=None, name=None):
+        """
+        Must the index be queried before a package can be looked up?
+
+        Args:
+            backend (str): package_type
+            name (str): Package name
+
+        Returns:
+            bool: True if never queried or the package changed since
+        """
+
+        return not self.loaded or (backend, name) in self.stale
+
+    def versions(self, backend=None, name=None):
+        """
+        Get the installed versions of a package, querying once if needed
+
+        Args:
+            backend (str): package_type. One of BACKENDS
+            name (str): Package name
+
+        Returns:
+            list(str): Installed versions, empty if the package isn't installed
+        """
+
+        if self.needs_load(backend=backend, name=name):
+            with self.lock:
+                if self.needs_load(backend=backend, name=name):
+                    self.load()
+        return self.found(backend=backend, name=name)
+
+    async def versions_async(self, runner=None, backend=None, name=None):
+        """
+        Get the installed versions of a package. Any query runs on the event loop, once however many
+        installers ask at the same time.
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+            backend (str): package_type. One of BACKENDS
+            name (str): Package name
+
+        Returns:
+            list(str): Installed versions, empty if the package isn't installed
+        """
+
+        if self.needs_load(backend=backend, name=name):
+            if self.loading is None:
+                self.loading = asyncio.ensure_future(self.load_async(runner=runner))
+            await asyncio.shield(self.loading)
+        return self.found(backend=backend, name=name)
+
+    def found(self, backend=None, name=None):
+        """
+        Look a package up in the loaded index
+
+        Args:
+            backend (str): package_type
+            name (str): Package name
+
+        Returns:
+            list(str): Installed versions, empty if the package isn't installed
+        """
+
+        return list(self.packages.get(backend, {}).get(name, []))
+
+    def discard(self, backend=None, name=None):
+        """
+        Record that a package was installed or upgraded: its version is looked up again with the next query
+
+        Args:
+            backend (str): package_type
+            name (str): Package name
+
+        Returns:
+            No return value
+        """
+
+        with self.lock:
+            if self.loaded:
+                self.stale.add((backend, name))
+
+    @classmethod
+    def get(cls, logger=None, backend=None):
+        """
+        Get the shared index, creating it on first use
+
+        Args:
+            logger (obj): Logger instance
+            backend (str): Package type
+
+        Returns:
+            obj: InstalledVersions instance or None if the backend isn't indexed
+        """
+
+        if backend not in cls.BACKENDS:
+            return None
+        with cls.instance_lock:
+            if cls.instance is None:
+                cls.instance = InstalledVersions(logger=logger)
+            return cls.instance
+
+    @classmethod
+    def reset(cls):
+        """
+        Forget the index so that the next lookup queries again. Called once per run.
+
+        Returns:
+            No return value
+        """
+
+        with cls.instance_lock:
+            cls.instance = None
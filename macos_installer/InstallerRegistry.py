@@ -0,0 +1,196 @@
+import importlib
+import threading
+
+
+class InstallerRegistry:
+    """InstallerRegistry maps each package_type to its installer class, importing a class only when first needed"""
+
+    # Entry point group through which other distributions add package types, e.g. in their setup.py:
+    # entry_points={'macos_installer.installers': ['pkg = my_package.PkgInstaller:PkgInstaller']}
+    ENTRY_POINT_GROUP = "macos_installer.installers"
+
+    BUILTIN = {
+        'brew': "macos_installer.installers.BrewInstaller:BrewInstaller",
+        'brewcask': "macos_installer.installers.BrewCaskInstaller:BrewCaskInstaller",
+        'mas': "macos_installer.installers.MASInstaller:MASInstaller",
+        'brewcasklocal': "macos_installer.installers.BrewCaskLocalInstaller:BrewCaskLocalInstaller",
+    }
+
+    # Installers added with register(), then entry points, looked up only for package types not builtin
+    registered = {}
+    plugins = None
+    classes = {}
+    lock = threading.RLock()
+
+    @classmethod
+    def entry_points(cls):
+        """
+        Find the installers other distributions registered, without importing them. Scanning installed
+        distributions is slow, so this is done at most once and only for package types not builtin.
+
+        Returns:
+            dict: package_type -> 'module:attribute'
+        """
+
+        with cls.lock:
+            if cls.plugins is not None:
+                return cls.plugins
+            cls.plugins = {}
+            try:
+                from importlib import metadata
+            except ImportError:
+                return cls.plugins
+
+            try:
+                found = metadata.entry_points()
+                if hasattr(found, "select"):
+                    group = found.select(group=cls.ENTRY_POINT_GROUP)
+                else:
+                    group = found.get(cls.ENTRY_POINT_GROUP, [])
+                cls.plugins = {entry_point.name: entry_point.value for entry_point in group}
+            except Exception:
+                pass
+            return cls.plugins
+
+    @classmethod
+    def spec(cls, package_type=None):
+        """
+        Get where the installer class for a package type lives. register() takes precedence over builtin
+        installers, which take precedence over entry points.
+
+        Args:
+            package_type (str): Package type
+
+        Returns:
+            obj: 'module:attribute', installer class or None if none is registered
+        """
+
+        spec = cls.registered.get(package_type)
+        if spec is None:
+            spec = cls.BUILTIN.get(package_type)
+        if spec is None:
+            spec = cls.entry_points().get(package_type)
+        return spec
+
+    @classmethod
+    def register(cls, package_type=None, installer=None):
+        """
+        Add or replace the installer for a package type
+
+        Args:
+            package_type (str): Package type e.g. 'pkg'
+            installer (obj): Installer class, or 'module:attribute' to import it when first needed
+
+        Returns:
+            No return value
+        """
+
+        with cls.lock:
+            cls.registered[package_type] = installer
+            cls.classes.pop(package_type, None)
+
+    @classmethod
+    def package_types(cls):
+        """
+        Get the package types an installer is registered for
+
+        Returns:
+            list(str): Package types
+        """
+
+        package_types = list(cls.BUILTIN.keys())
+        for package_type in list(cls.registered.keys()) + list(cls.entry_points().keys()):
+            if package_type not in package_types:
+                package_types.append(package_type)
+        return package_types
+
+    @classmethod
+    def is_registered(cls, package_type=None):
+        """
+        Is an installer registered for a package type? Nothing is imported.
+
+        Args:
+            package_type (str): Package type
+
+        Returns:
+            bool: True if registered
+        """
+        return cls.spec(package_type=package_type) is not None
+
+    @classmethod
+    def get(cls, package_type=None, logger=None):
+        """
+        Get the installer class for a package type, importing its module on first use
+
+        Args:
+            package_type (str): Package type
+            logger (obj): Logger instance
+
+        Returns:
+            obj: Installer class or None if no installer is registered or it can't be imported
+        """
+
+        installer_class = cls.classes.get(package_type)
+        if installer_class is not None:
+            return installer_class
+
+        with cls.lock:
+            installer_class = cls.classes.get(package_type)
+            if installer_class is not None:
+                return installer_class
+
+            spec = cls.spec(package_type=package_type)
+            if spec is None:
+                return None
+            if isinstance(spec, str):
+                module_name, _, attribute = spec.partition(":")
+                try:
+                    installer_class = importlib.import_module(module_name)
+                    for part in attribute.split("."):
+                        installer_class = getattr(installer_class, part)
+                except Exception as e:
+                    if logger:
+                        logger.error("InstallerRegistry.get {0} can't load {1}: {2}".format(package_type, spec, e))
+                    return None
+            else:
+                installer_class = spec
+            cls.classes[package_type] = installer_class
+            return installer_class
+
+    @classmethod
+    def fingerprint(cls, package_types=None):
+        """
+        Describe where the installers of package types come from, to tell whether entries validated by them
+        would still validate the same way. Builtin package types are validated without their installer and
+        are left out, so that no entry point is looked up for them.
+
+        Args:
+            package_types list(str): Package types
+
+        Returns:
+            tuple: (package_type, 'module:attribute' or None if none is registered) pairs, sorted
+        """
+
+        fingerprint = []
+        for package_type in sorted(set(package_types or [])):
+            if package_type in cls.BUILTIN:
+                continue
+            spec = cls.spec(package_type=package_type)
+            if spec is not None and not isinstance(spec, str):
+                spec = "{0}:{1}".format(spec.__module__, spec.__qualname__)
+            fingerprint.append((package_type, spec))
+        return tuple(fingerprint)
+
+    @classmethod
+    def reset(cls):
+        """
+        Forget registrations and loaded classes so that entry points are looked up again
+
+        Returns:
+            No return value
+        """
+
+        with cls.lock:
+            cls.registered = {}
+            cls.plugins = None
+            cls.classes = {}
@@ -0,0 +1,295 @@
+import threading
+
+from . import command
+from .FilesystemProbe import FilesystemProbe
+from .InventoryCache import InventoryCache
+
+
+class Inventory:
+    """Inventory is a snapshot of the packages installed for a single backend"""
+
+    LIST_COMMANDS = {
+        'brew': ["brew", "list"],
+        'brewcask': ["brew", "cask", "list"],
+        'mas': ["mas", "list"],
+    }
+
+    # Presence probe consulted before listing with LIST_COMMANDS. Set to None to always list.
+    probe = FilesystemProbe()
+
+    # Snapshots kept between runs, validated by a fingerprint of the probed directories. Set to None to disable.
+    cache = InventoryCache()
+
+    snapshots = {}
+    snapshots_lock = threading.Lock()
+
+    def __init__(self,
+                 logger=None,
+                 backend=None):
+        """
+        Create a new Inventory instance
+
+        Args:
+            logger (obj): Logger instance
+            backend (str): Package type listed by this inventory. One of 'brew', 'brewcask', 'mas', 'brewcasklocal'
+        """
+
+        self.logger = logger
+        self.backend = backend
+        self.names = set()
+        self.mas_ids = set()
+        self.loaded = False
+        self.complete = False
+        self.fingerprint = None
+        self.lock = threading.RLock()
+
+    def load(self):
+        """
+        Take a snapshot of the installed packages. A cached snapshot with an unchanged fingerprint
+        is used as is. Otherwise the presence probe is tried first and the backend is listed only
+        if the probe can't give a complete answer.
+
+        Returns:
+            bool: True if a snapshot was taken, False if listing failed
+        """
+
+        with self.lock:
+            if self.load_without_listing():
+                return True
+            return self.load_listing()
+
+    def load_without_listing(self):
+        """
+        Take a snapshot from the cache or the presence probe
+
+        Returns:
+            bool: True if a snapshot was taken, False if the backend has to be listed
+        """
+
+        with self.lock:
+            probe = self.probe
+            if probe is None and self.backend not in self.LIST_COMMANDS:
+                # Nothing to list, only the filesystem can answer
+                probe = FilesystemProbe()
+
+            self.loaded = True
+            self.fingerprint = None
+            if self.cache is not None:
+                self.fingerprint = InventoryCache.fingerprint((probe or FilesystemProbe()).directories(self.backend))
+                cached = self.cache.lookup(backend=self.backend, fingerprint=self.fingerprint)
+                if cached:
+                    self.names, self.mas_ids, self.complete = cached
+                    return True
+
+            scanned = probe.scan(self.backend) if probe else None
+            if scanned is None:
+                self.names = set()
+                self.mas_ids = set()
+                self.complete = False
+                return False
+
+            self.names, self.complete = scanned
+            self.mas_ids = set()
+            if self.complete:
+                self.store()
+            return True
+
+    def load_listing(self):
+        """
+        Take a snapshot of the installed packages by listing them once
+
+        Returns:
+            bool: True if the listing succeeded, False otherwise
+        """
+
+        with self.lock:
+            results = command.run(cmd=self.LIST_COMMANDS[self.backend], logger=self.logger)
+            return self.apply_listing(results)
+
+    async def load_listing_async(self, runner=None):
+        """
+        Take a snapshot of the installed packages by listing them once, on the event loop
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            bool: True if the listing succeeded, False otherwise
+        """
+
+        results = await runner.run(cmd=self.LIST_COMMANDS[self.backend], backend=self.backend, breaker=False)
+        return self.apply_listing(results)
+
+    def apply_listing(self, results):
+        """
+        Parse the output of a listing command into the snapshot
+
+        Args:
+            results (obj): Command results with success, status_code, results and errors
+
+        Returns:
+            bool: True if the listing succeeded, False otherwise
+        """
+
+        names = set()
+        mas_ids = set()
+        if results.success:
+            for line in results.results.split("\n"):
+                line = line.strip()
+                if not line:
+                    continue
+                if self.backend == 'mas':
+                    # e.g. "1333542190 1Password 7 (7.2.5)"
+                    mas_id, _, rest = line.partition(" ")
+                    mas_ids.add(mas_id)
+                    name = rest.rsplit(" (", 1)[0].strip()
+                    if name:
+                        names.add(name)
+                else:
+                    names.update(line.split())
+        else:
+            self.logger.error("Inventory.load {0} failed status {1} results {2} errors {3}".format(
+                self.backend, results.status_code, results.results, results.errors))
+
+        with self.lock:
+            # Keep what the probe found: it is conclusive for the names it found
+            self.names = self.names | names
+            self.mas_ids = mas_ids
+            self.loaded = True
+            self.complete = True
+            if results.success:
+                self.store()
+        return results.success
+
+    def store(self):
+        """
+        Save this snapshot in the cache, with the fingerprint taken before it
+
+        Returns:
+            No return value
+        """
+
+        if self.cache is not None:
+            self.cache.store(backend=self.backend, fingerprint=self.fingerprint, names=self.names,
+                             mas_ids=self.mas_ids, complete=self.complete)
+
+    def contains(self, name=None, mas_id=None):
+        """
+        Is a package present in this snapshot?
+
+        Args:
+            name (str): Package name
+            mas_id (str): Mac Apple Store id. Checked first when given
+
+        Returns:
+            bool: True if present, False otherwise
+        """
+
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self.load()
+
+        found = (mas_id is not None and mas_id in self.mas_ids) or (name is not None and name in self.names)
+        if found or self.complete:
+            return found
+
+        # The probe couldn't decide: fall back to listing, once
+        with self.lock:
+            if not self.complete:
+                self.load_listing()
+        return (mas_id is not None and mas_id in self.mas_ids) or (name is not None and name in self.names)
+
+    async def contains_async(self, runner=None, name=None, mas_id=None):
+        """
+        Is a package present in this snapshot? Any listing needed runs on the event loop.
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+            name (str): Package name
+            mas_id (str): Mac Apple Store id. Checked first when given
+
+        Returns:
+            bool: True if present, False otherwise
+        """
+
+        if not self.loaded and not self.load_without_listing():
+            await self.load_listing_async(runner=runner)
+
+        found = (mas_id is not None and mas_id in self.mas_ids) or (name is not None and name in self.names)
+        if found or self.complete:
+            return found
+
+        await self.load_listing_async(runner=runner)
+        return (mas_id is not None and mas_id in self.mas_ids) or (name is not None and name in self.names)
+
+    def add(self, name=None, mas_id=None):
+        """
+        Record a successful installation without relisting
+
+        Args:
+            name (str): Package name
+            mas_id (str): Mac Apple Store id
+
+        Returns:
+            No return value
+        """
+
+        if name:
+            self.names.add(name)
+        if mas_id:
+            self.mas_ids.add(mas_id)
+        if self.cache is not None:
+            self.cache.invalidate(backend=self.backend)
+
+    def discard(self, name=None, mas_id=None):
+        """
+        Record a successful removal without relisting
+
+        Args:
+            name (str): Package name
+            mas_id (str): Mac Apple Store id
+
+        Returns:
+            No return value
+        """
+
+        if name:
+            self.names.discard(name)
+        if mas_id:
+            self.mas_ids.discard(mas_id)
+        if self.cache is not None:
+            self.cache.invalidate(backend=self.backend)
+
+    @classmethod
+    def get(cls, logger=None, backend=None):
+        """
+        Get the shared snapshot for a backend, creating it on first use
+
+        Args:
+            logger (obj): Logger instance
+            backend (str): Package type. One of 'brew', 'brewcask', 'mas', 'brewcasklocal'
+
+        Returns:
+            obj: Inventory instance for the backend
+        """
+
+        with cls.snapshots_lock:
+            inventory = cls.snapshots.get(backend)
+            if inventory is None:
+                inventory = Inventory(logger=logger, backend=backend)
+                cls.snapshots[backend] = inventory
+            return inventory
+
+    @classmethod
+    def reset(cls):
+        """
+        Forget all snapshots so that the next lookup relists or rereads the cache. Called once per run.
+
+        Returns:
+            No return value
+        """
+
+        cls.snapshots = {}
+        if cls.cache is not None:
+            cls.cache.reset()
@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+
+from . import paths
+
+
+class InventoryCache:
+    """InventoryCache keeps each backend's last inventory snapshot on disk between runs"""
+
+    FILE_NAME = "inventory.json"
+    FORMAT_VERSION = 1
+
+    def __init__(self,
+                 logger=None,
+                 path=None):
+        """
+        Create a new InventoryCache instance
+
+        Args:
+            logger (obj): Logger instance
+            path (str): Cache file. Defaults to inventory.json in paths.cache_dir()
+        """
+
+        self.logger = logger
+        self.configured_path = path
+        self.entries = None
+        self.lock = threading.Lock()
+
+    @property
+    def path(self):
+        """
+        Cache file path, resolved when first needed
+
+        Returns:
+            str: Path
+        """
+        if not self.configured_path:
+            self.configured_path = os.path.join(paths.cache_dir(), self.FILE_NAME)
+        return self.configured_path
+
+    @staticmethod
+    def fingerprint(directories):
+        """
+        Compute a cheap fingerprint of the directories a snapshot was taken from.
+        Installing or removing a package adds or removes an entry, which changes both.
+
+        Args:
+            directories list(str): Directory paths
+
+        Returns:
+            list: [path, mtime_ns, entry count] per directory or None if any directory is missing
+        """
+
+        if not directories:
+            return None
+        fingerprint = []
+        for directory in directories:
+            try:
+                stat = os.stat(directory)
+                with os.scandir(directory) as scanned:
+                    count = sum(1 for _ in scanned)
+            except OSError:
+                return None
+            fingerprint.append([directory, stat.st_mtime_ns, count])
+        return fingerprint
+
+    def load(self):
+        """
+        Read the cache file once
+
+        Returns:
+            dict: backend -> cached snapshot
+        """
+
+        if self.entries is not None:
+            return self.entries
+        self.entries = {}
+        try:
+            with open(self.path, 'r') as cache_file:
+                data = json.load(cache_file)
+            if isinstance(data, dict) and data.get("version") == self.FORMAT_VERSION:
+                self.entries = data.get("backends", {})
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError) and self.logger:
+                self.logger.warning("InventoryCache.load {0} ignored: {1}".format(self.path, e))
+        return self.entries
+
+    def lookup(self, backend=None, fingerprint=None):
+        """
+        Get a cached snapshot if it was taken with the same fingerprint
+
+        Args:
+            backend (str): package_type
+            fingerprint (list): Current fingerprint
+
+        Returns:
+            tuple(set(str), set(str), bool): names, mas_ids and complete or None if there is no valid entry
+        """
+
+        if fingerprint is None:
+            return None
+        with self.lock:
+            entry = self.load().get(backend)
+        if not entry or entry.get("fingerprint") != fingerprint:
+            return None
+        return set(entry.get("names", [])), set(entry.get("mas_ids", [])), bool(entry.get("complete"))
+
+    def store(self, backend=None, fingerprint=None, names=None, mas_ids=None, complete=False):
+        """
+        Save a snapshot with the fingerprint it was taken with
+
+        Args:
+            backend (str): package_type
+            fingerprint (list): Fingerprint taken before the snapshot
+            names set(str): Installed package names
+            mas_ids set(str): Installed Mac Apple Store ids
+            complete (bool): True if names not present are known to be absent
+
+        Returns:
+            No return value
+        """
+
+        if fingerprint is None:
+            return
+        with self.lock:
+            self.load()[backend] = {
+                "fingerprint": fingerprint,
+                "names": sorted(names),
+                "mas_ids": sorted(mas_ids),
+                "complete": complete,
+            }
+            self.save()
+
+    def invalidate(self, backend=None):
+        """
+        Drop a backend's snapshot, e.g. after this run changed what is installed
+
+        Args:
+            backend (str): package_type
+
+        Returns:
+            No return value
+        """
+
+        with self.lock:
+            if self.load().pop(backend, None) is not None:
+                self.save()
+
+    def save(self):
+        """
+        Write the cache file atomically. Called with the lock held.
+
+        Returns:
+            No return value
+        """
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = "{0}.{1}.tmp".format(self.path, os.getpid())
+            with open(tmp_path, 'w') as cache_file:
+                json.dump({"version": self.FORMAT_VERSION, "backends": self.entries}, cache_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            if self.logger:
+                self.logger.warning("InventoryCache.save {0} failed: {1}".format(self.path, e))
+
+    def reset(self):
+        """
+        Forget what was read so that the next lookup reads the file again
+
+        Returns:
+            No return value
+        """
+
+        with self.lock:
+            self.entries = None
@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+import time
+
+from . import paths
+
+
+class Journal:
+    """Journal records the planned, started and completed actions of a run so that an interrupted run can be resumed"""
+
+    FILE_NAME = "journal.jsonl"
+
+    def __init__(self,
+                 logger=None,
+                 path=None,
+                 manifest_hash=None):
+        """
+        Create a new Journal instance
+
+        Args:
+            logger (obj): Logger instance
+            path (str): Journal file. Defaults to journal.jsonl in paths.cache_dir()
+            manifest_hash (str): Content hash of the manifest being run. A journal is only resumed by a run
+                of the same manifest.
+        """
+
+        self.logger = logger
+        self.configured_path = path
+        self.manifest_hash = manifest_hash
+        self.journal_file = None
+        self.lock = threading.Lock()
+
+    @property
+    def path(self):
+        """
+        Journal file path, resolved when first needed
+
+        Returns:
+            str: Path
+        """
+        if not self.configured_path:
+            self.configured_path = os.path.join(paths.cache_dir(), self.FILE_NAME)
+        return self.configured_path
+
+    @staticmethod
+    def key(installer):
+        """
+        Get what identifies an installer's package in the journal
+
+        Args:
+            installer (obj): \*Installer instance
+
+        Returns:
+            str: package_type:name
+        """
+        return "{0}:{1}".format(installer.package_info.package_type, installer.name)
+
+    def read(self):
+        """
+        Read the journal left by the last run. A torn last line, from a run that died while writing it,
+        is ignored.
+
+        Returns:
+            dict:
+
+            'manifest': manifest hash of that run
+
+            'done': key -> result of the actions confirmed as done
+
+            'in_flight': keys of the actions started but not completed
+
+            None if there is no readable journal
+        """
+
+        try:
+            with open(self.path, 'r') as journal_file:
+                lines = journal_file.readlines()
+        except OSError:
+            return None
+
+        state = None
+        started = set()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            event = record.get("event")
+            if event == "run":
+                # A resumed run continues the state of the run it resumed
+                if not (record.get("resumed") and state is not None and state["manifest"] == record.get("manifest")):
+                    state = {"manifest": record.get("manifest"), "done": {}, "in_flight": set()}
+                    started = set()
+            elif state is None:
+                continue
+            elif event == "started":
+                started.update(record.get("packages", []))
+            elif event == "completed":
+                key = record.get("package")
+                started.discard(key)
+                if record.get("satisfied"):
+                    state["done"][key] = record.get("result")
+                else:
+                    state["done"].pop(key, None)
+        if state is not None:
+            state["in_flight"] = started
+        return state
+
+    def open(self, resume=False):
+        """
+        Start journaling. When resuming a journal of the same manifest, it is appended to; otherwise it
+        is replaced.
+
+        Args:
+            resume (bool): Continue the last run's journal
+
+        Returns:
+            dict: key -> result of the actions the last run confirmed as done. Empty unless resuming.
+        """
+
+        done = {}
+        if resume:
+            state = self.read()
+            # Without a manifest hash there is no telling which run a journal belongs to
+            if state is not None and self.manifest_hash is not None and state["manifest"] == self.manifest_hash:
+                done = state["done"]
+                if self.logger:
+                    self.logger.info("Journal resuming: {0} done, {1} in flight will be verified".format(
+                        len(done), len(state["in_flight"])))
+            elif self.logger:
+                self.logger.warning("Journal {0}: no journal of this manifest to resume, starting over".format(
+                    self.path))
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.journal_file = open(self.path, 'a' if done else 'w')
+            if not done:
+                self.sync_directory()
+        except OSError as e:
+            if self.logger:
+                self.logger.warning("Journal.open {0} failed, running without a journal: {1}".format(self.path, e))
+            self.journal_file = None
+            return done
+
+        self.write([{"event": "run", "manifest": self.manifest_hash, "time": time.time(), "resumed": bool(done)}],
+                   sync=True)
+        return done
+
+    def planned(self, installers=None):
+        """
+        Record the actions this run will execute
+
+        Args:
+            installers list(obj): \*Installer instances
+
+        Returns:
+            No return value
+        """
+        self.write([{"event": "planned",
+                     "packages": [self.key(installer) for installer in installers],
+                     "actions": [installer.action() for installer in installers]}], sync=True)
+
+    def started(self, installers=None):
+        """
+        Record that actions are about to start. Not synced: an action whose start is lost is verified
+        on resume all the same.
+
+        Args:
+            installers list(obj): \*Installer instances
+
+        Returns:
+            No return value
+        """
+        self.write([{"event": "started", "packages": [self.key(installer) for installer in installers]}],
+                   sync=False)
+
+    def completed(self, results=None):
+        """
+        Record finished actions and whether each package is now in its configured state. Synced when an
+        action changed something, since that is the work a resumed run can skip.
+
+        Args:
+            results (dict): installer -> result of install() or remove()
+
+        Returns:
+            No return value
+        """
+
+        records = []
+        changed = False
+        for installer, result in results.items():
+            if result is True:
+                satisfied = True
+                changed = True
+            elif result is None:
+                satisfied = False
+            else:
+                satisfied = installer.is_satisfied()
+            records.append({"event": "completed", "package": self.key(installer), "result": result,
+                            "satisfied": satisfied})
+        self.write(records, sync=changed)
+
+    def close(self):
+        """
+        Record the end of the run and close the journal
+
+        Returns:
+            No return value
+        """
+
+        self.write([{"event": "finished", "time": time.time()}], sync=True)
+        with self.lock:
+            if self.journal_file is not None:
+                self.journal_file.close()
+                self.journal_file = None
+
+    def write(self, records=None, sync=False):
+        """
+        Append records, one JSON object per line
+
+        Args:
+            records list(dict): Records
+            sync (bool): fsync before returning
+
+        Returns:
+            No return value
+        """
+
+        with self.lock:
+            if self.journal_file is None:
+                return
+            try:
+                self.journal_file.write("".join(json.dumps(record) + "\n" for record in records))
+                self.journal_file.flush()
+                if sync:
+                    os.fsync(self.journal_file.fileno())
+            except (OSError, ValueError) as e:
+                if self.logger:
+                    self.logger.warning("Journal.write {0} failed, running without a journal: {1}".format(
+                        self.path, e))
+                self.journal_file = None
+
+    def sync_directory(self):
+        """
+        fsync the journal's directory so that a newly created journal survives a crash
+
+        Returns:
+            No return value
+        """
+
+        try:
+            directory = os.open(os.path.dirname(self.path), os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        except OSError:
+            pass
@@ -0,0 +1,128 @@
+import hashlib
+import marshal
+import os
+import threading
+
+from . import paths
+
+
+class ManifestCache:
+    """ManifestCache keeps the validated packages of the last manifest loaded, keyed by the manifest's content hash"""
+
+    FILE_NAME = "manifest.cache"
+
+    # Bump when the meaning of the cached records changes
+    SCHEMA_VERSION = 2
+
+    def __init__(self,
+                 logger=None,
+                 path=None):
+        """
+        Create a new ManifestCache instance
+
+        Args:
+            logger (obj): Logger instance
+            path (str): Cache file. Defaults to manifest.cache in paths.cache_dir()
+        """
+
+        self.logger = logger
+        self.configured_path = path
+        self.lock = threading.Lock()
+
+    @property
+    def path(self):
+        """
+        Cache file path, resolved when first needed
+
+        Returns:
+            str: Path
+        """
+        if not self.configured_path:
+            self.configured_path = os.path.join(paths.cache_dir(), self.FILE_NAME)
+        return self.configured_path
+
+    @staticmethod
+    def manifest_hash(data):
+        """
+        Compute the content hash of a manifest
+
+        Args:
+            data (str): Manifest JSON text
+
+        Returns:
+            str: sha256 hex digest
+        """
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def lookup(self, manifest_hash=None, fields=None):
+        """
+        Get the cached records of a manifest
+
+        Args:
+            manifest_hash (str): Content hash of the manifest
+            fields tuple(str): Record fields, in order. A cache written with other fields is ignored.
+
+        Returns:
+            tuple(list(tuple), list(str), tuple):
+
+            Field values of each valid package, the invalid entries as text and the registry fingerprint they
+            were validated with. See InstallerRegistry.fingerprint
+
+            None if there is no usable entry for this manifest
+        """
+
+        with self.lock:
+            try:
+                with open(self.path, 'rb') as cache_file:
+                    # One read: marshal.load on a file object reads in small pieces
+                    cached = marshal.loads(cache_file.read())
+            except FileNotFoundError:
+                return None
+            except (OSError, EOFError, ValueError, TypeError) as e:
+                if self.logger:
+                    self.logger.warning("ManifestCache.lookup {0} ignored: {1}".format(self.path, e))
+                return None
+
+        try:
+            schema_version, cached_fields, cached_hash, columns, invalid, registry = cached
+        except (TypeError, ValueError):
+            if self.logger:
+                self.logger.warning("ManifestCache.lookup {0} ignored: unexpected contents".format(self.path))
+            return None
+        if schema_version != self.SCHEMA_VERSION or cached_fields != tuple(fields) or cached_hash != manifest_hash:
+            return None
+        if (not isinstance(columns, list) or len(columns) != len(cached_fields) or
+                any(not isinstance(column, list) or len(column) != len(columns[0]) for column in columns)):
+            if self.logger:
+                self.logger.warning("ManifestCache.lookup {0} ignored: malformed records".format(self.path))
+            return None
+        return list(zip(*columns)), invalid, registry
+
+    def store(self, manifest_hash=None, fields=None, records=None, invalid=None, registry=None):
+        """
+        Save the records of a manifest, replacing those of any other manifest
+
+        Args:
+            manifest_hash (str): Content hash of the manifest
+            fields tuple(str): Record fields, in order
+            records list(tuple): Field values of each valid package
+            invalid list(str): Invalid entries as text, reported again when the cache is used
+            registry (tuple): InstallerRegistry.fingerprint of the manifest's package types
+
+        Returns:
+            No return value
+        """
+
+        with self.lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = "{0}.{1}.tmp".format(self.path, os.getpid())
+                # Stored a column per field: smaller and faster to load than a tuple per record
+                columns = [list(column) for column in zip(*records)] if records else [[] for _ in fields]
+                with open(tmp_path, 'wb') as cache_file:
+                    marshal.dump((self.SCHEMA_VERSION, tuple(fields), manifest_hash, columns, invalid or [],
+                                  tuple(registry or ())), cache_file)
+                os.replace(tmp_path, self.path)
+            except (OSError, ValueError) as e:
+                if self.logger:
+                    self.logger.warning("ManifestCache.store {0} failed: {1}".format(self.path, e))
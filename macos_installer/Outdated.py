@@ -0,0 +1,260 @@
+import asyncio
+import json
+import threading
+
+from . import command
+
+
+class Outdated:
+    """Outdated is a snapshot of the installed packages that have a newer version, taken with one query per source"""
+
+    # One query answers for every backend of a source: brew outdated covers formulae and casks alike
+    COMMANDS = {
+        'homebrew': ["brew", "outdated", "--json=v2"],
+        'mas': ["mas", "outdated"],
+    }
+
+    SOURCES = {
+        'brew': 'homebrew',
+        'brewcask': 'homebrew',
+        'mas': 'mas',
+    }
+
+    snapshots = {}
+    snapshots_lock = threading.Lock()
+
+    def __init__(self,
+                 logger=None,
+                 source=None):
+        """
+        Create a new Outdated instance
+
+        Args:
+            logger (obj): Logger instance
+            source (str): Query answering for the backends. One of 'homebrew', 'mas'
+        """
+
+        self.logger = logger
+        self.source = source
+        # backend -> name -> newest version, and for Mac Apple Store packages mas_id -> newest version
+        self.packages = {}
+        self.mas_ids = {}
+        self.loaded = False
+        # Query started on the event loop, awaited by every installer that needs it
+        self.loading = None
+        self.lock = threading.RLock()
+
+    def load(self):
+        """
+        Query the outdated packages once
+
+        Returns:
+            bool: True if the query succeeded, False otherwise
+        """
+
+        with self.lock:
+            results = command.run(cmd=self.COMMANDS[self.source], logger=self.logger)
+            return self.apply(results)
+
+    async def load_async(self, runner=None):
+        """
+        Query the outdated packages once, on the event loop
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            bool: True if the query succeeded, False otherwise
+        """
+
+        results = await runner.run(cmd=self.COMMANDS[self.source],
+                                   backend='mas' if self.source == 'mas' else 'brew', breaker=False)
+        return self.apply(results)
+
+    def apply(self, results):
+        """
+        Parse the output of the query into the snapshot. A failed query leaves nothing outdated.
+
+        Args:
+            results (obj): Command results with success, status_code, results and errors
+
+        Returns:
+            bool: True if the query succeeded, False otherwise
+        """
+
+        packages = {}
+        mas_ids = {}
+        success = results.success
+        if success:
+            try:
+                if self.source == 'homebrew':
+                    packages = self.parse_homebrew(results.results)
+                else:
+                    packages, mas_ids = self.parse_mas(results.results)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                self.logger.error("Outdated.load {0} can't parse the output: {1}".format(self.source, e))
+                success = False
+        else:
+            self.logger.error("Outdated.load {0} failed status {1} results {2} errors {3}".format(
+                self.source, results.status_code, results.results, results.errors))
+
+        with self.lock:
+            self.packages = packages
+            self.mas_ids = mas_ids
+            self.loaded = True
+        return success
+
+    @staticmethod
+    def parse_homebrew(output):
+        """
+        Parse brew outdated --json=v2
+
+        Args:
+            output (str): e.g. {"formulae": [{"name": "git", "current_version": "2.20.1", ...}], "casks": [...]}
+
+        Returns:
+            dict: backend -> name -> newest version
+        """
+
+        data = json.loads(output or "{}")
+        return {
+            'brew': {entry["name"]: entry.get("current_version") for entry in data.get("formulae", [])},
+            'brewcask': {entry["name"]: entry.get("current_version") for entry in data.get("casks", [])},
+        }
+
+    @staticmethod
+    def parse_mas(output):
+        """
+        Parse mas outdated
+
+        Args:
+            output (str): One line per App e.g. "497799835 Xcode (10.0 -> 10.1)"
+
+        Returns:
+            tuple(dict, dict): backend -> name -> newest version, and mas_id -> newest version
+        """
+
+        names = {}
+        mas_ids = {}
+        for line in (output or "").split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            mas_id, _, rest = line.partition(" ")
+            name, _, versions = rest.rpartition(" (")
+            if not name:
+                name, versions = rest, ""
+            version = versions.rstrip(")").rpartition("-> ")[2].strip() or None
+            mas_ids[mas_id] = version
+            names[name.strip()] = version
+        return {'mas': names}, mas_ids
+
+    def contains(self, backend=None, name=None, mas_id=None):
+        """
+        Does a package have a newer version?
+
+        Args:
+            backend (str): package_type
+            name (str): Package name
+            mas_id (str): Mac Apple Store id. Checked first when given
+
+        Returns:
+            bool: True if outdated
+        """
+
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self.load()
+        return self.found(backend=backend, name=name, mas_id=mas_id)
+
+    async def contains_async(self, runner=None, backend=None, name=None, mas_id=None):
+        """
+        Does a package have a newer version? The query runs on the event loop, once however many
+        installers ask at the same time.
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+            backend (str): package_type
+            name (str): Package name
+            mas_id (str): Mac Apple Store id. Checked first when given
+
+        Returns:
+            bool: True if outdated
+        """
+
+        if not self.loaded:
+            if self.loading is None:
+                self.loading = asyncio.ensure_future(self.load_async(runner=runner))
+            await self.loading
+        return self.found(backend=backend, name=name, mas_id=mas_id)
+
+    def found(self, backend=None, name=None, mas_id=None):
+        """
+        Look a package up in the loaded snapshot
+
+        Args:
+            backend (str): package_type
+            name (str): Package name
+            mas_id (str): Mac Apple Store id
+
+        Returns:
+            bool: True if outdated
+        """
+
+        if mas_id is not None and backend == 'mas':
+            return mas_id in self.mas_ids
+        return name is not None and name in self.packages.get(backend, {})
+
+    def discard(self, backend=None, name=None, mas_id=None):
+        """
+        Record a successful upgrade without querying again
+
+        Args:
+            backend (str): package_type
+            name (str): Package name
+            mas_id (str): Mac Apple Store id
+
+        Returns:
+            No return value
+        """
+
+        with self.lock:
+            self.packages.get(backend, {}).pop(name, None)
+            if mas_id is not None:
+                self.mas_ids.pop(mas_id, None)
+
+    @classmethod
+    def get(cls, logger=None, backend=None):
+        """
+        Get the shared snapshot answering for a backend, creating it on first use
+
+        Args:
+            logger (obj): Logger instance
+            backend (str): Package type
+
+        Returns:
+            obj: Outdated instance or None if the backend can't tell which packages are outdated
+        """
+
+        source = cls.SOURCES.get(backend)
+        if source is None:
+            return None
+        with cls.snapshots_lock:
+            outdated = cls.snapshots.get(source)
+            if outdated is None:
+                outdated = Outdated(logger=logger, source=source)
+                cls.snapshots[source] = outdated
+            return outdated
+
+    @classmethod
+    def reset(cls):
+        """
+        Forget all snapshots so that the next lookup queries again. Called once per run.
+
+        Returns:
+            No return value
+        """
+
+        with cls.snapshots_lock:
+            cls.snapshots = {}
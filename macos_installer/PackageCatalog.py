@@ -0,0 +1,214 @@
+import json
+import traceback
+
+from .ManifestCache import ManifestCache
+from .InstallerRegistry import InstallerRegistry
+from .packages_data import PACKAGES_DATA
+from .PackageInfo import PackageInfo
+
+
+class PackageCatalog:
+    """PackageCatalog holds the valid packages of a manifest, indexed by name, mas_id, package_type and state"""
+
+    # Validated packages of the last manifest loaded, reused while its content is unchanged. Set to None to disable.
+    cache = ManifestCache()
+
+    def __init__(self,
+                 packages=None):
+        """
+        Create a new PackageCatalog instance. Indexes are built on first lookup, so subset views are cheap.
+
+        Args:
+            packages list(obj): PackageInfo instances, in manifest order
+        """
+
+        self.packages = packages if packages is not None else []
+        self.indexes = None
+
+    def __len__(self):
+        """
+        Returns:
+            int: Number of packages
+        """
+        return len(self.packages)
+
+    def __iter__(self):
+        """
+        Returns:
+            Iterator over the PackageInfo instances in manifest order
+        """
+        return iter(self.packages)
+
+    def __getitem__(self, index):
+        """
+        Args:
+            index (int|slice): Position in manifest order
+
+        Returns:
+            obj: PackageInfo instance, or a list of them for a slice
+        """
+        return self.packages[index]
+
+    def __contains__(self, name):
+        """
+        Args:
+            name (str): Package name
+
+        Returns:
+            bool: True if a package with this name is in the catalog
+        """
+        return name in self.index()["name"]
+
+    def __repr__(self):
+        """
+        Create the string representation of this object. For print(...) etc.
+
+        Returns:
+            String representation of this object
+        """
+        return "PackageCatalog({0} packages)".format(len(self.packages))
+
+    def index(self):
+        """
+        Build the indexes in one pass over the packages, once
+
+        Returns:
+            dict: 'name', 'mas_id', 'package_type' and 'state' -> value -> list(obj) PackageInfo instances
+        """
+
+        if self.indexes is None:
+            indexes = {"name": {}, "mas_id": {}, "package_type": {}, "state": {}}
+            by_name = indexes["name"]
+            by_mas_id = indexes["mas_id"]
+            by_type = indexes["package_type"]
+            by_state = indexes["state"]
+            for package_info in self.packages:
+                by_name.setdefault(package_info.name, []).append(package_info)
+                if package_info.mas_id:
+                    by_mas_id.setdefault(package_info.mas_id, []).append(package_info)
+                by_type.setdefault(package_info.package_type, []).append(package_info)
+                by_state.setdefault(package_info.state, []).append(package_info)
+            self.indexes = indexes
+        return self.indexes
+
+    def get(self, name=None, package_type=None):
+        """
+        Find a package by name
+
+        Args:
+            name (str): Package name
+            package_type (str): Package type, to tell apart packages of different types with the same name
+
+        Returns:
+            obj: First matching PackageInfo instance or None
+        """
+
+        for package_info in self.index()["name"].get(name, ()):
+            if package_type is None or package_info.package_type == package_type:
+                return package_info
+        return None
+
+    def get_by_mas_id(self, mas_id=None):
+        """
+        Find a Mac Apple Store package by id
+
+        Args:
+            mas_id (str): Mac Apple Store id
+
+        Returns:
+            obj: PackageInfo instance or None
+        """
+
+        matches = self.index()["mas_id"].get(mas_id)
+        return matches[0] if matches else None
+
+    def of_type(self, package_type=None):
+        """
+        Get the packages of one type
+
+        Args:
+            package_type (str): Package type e.g. 'brew'
+
+        Returns:
+            obj: PackageCatalog view
+        """
+        return PackageCatalog(packages=self.index()["package_type"].get(package_type, []))
+
+    def with_state(self, state=None):
+        """
+        Get the packages with one configured state
+
+        Args:
+            state (str): 'present' or 'absent'
+
+        Returns:
+            obj: PackageCatalog view
+        """
+        return PackageCatalog(packages=self.index()["state"].get(state, []))
+
+    def package_types(self):
+        """
+        Get the package types present in the catalog
+
+        Returns:
+            list(str): Package types in order of first appearance
+        """
+        return list(self.index()["package_type"].keys())
+
+    @classmethod
+    def load(cls, logger=None, data=None):
+        """
+        Load a catalog from manifest data, validating each entry once. JSON text whose content hash
+        matches the cache is not parsed at all.
+
+        Args:
+            logger (obj): Logger instance
+            data (str|list(dict)): JSON text or parsed data. See package_data.py or README for examples.
+                Defaults to PACKAGES_DATA
+
+        Returns:
+            obj: PackageCatalog of the valid entries or None if the data can't be read
+        """
+
+        if not data:
+            data = PACKAGES_DATA
+
+        manifest_hash = None
+        if cls.cache is not None and isinstance(data, str):
+            manifest_hash = ManifestCache.manifest_hash(data)
+            cached = cls.cache.lookup(manifest_hash=manifest_hash, fields=PackageInfo.FIELDS)
+            # Entries of plugin package types are valid only while the same installers are registered
+            if cached is not None and cached[2] == InstallerRegistry.fingerprint(
+                    package_types=[package_type for package_type, spec in cached[2]]):
+                records, invalid, registry = cached
+                if logger:
+                    for package_data in invalid:
+                        logger.error("load_data: invalid data {0}".format(package_data))
+                return cls(packages=[PackageInfo.from_values(values) for values in records])
+
+        try:
+            packages_data = json.loads(data) if isinstance(data, str) else data
+
+            packages = []
+            invalid = []
+            package_types = []
+            for package_data in packages_data:
+                if isinstance(package_data, dict) and isinstance(package_data.get("package_type"), str):
+                    package_types.append(package_data["package_type"])
+                package_info = PackageInfo()
+                if package_info.load_from_data(package_data, logger=logger):
+                    packages.append(package_info)
+                else:
+                    invalid.append(str(package_data))
+                    if logger:
+                        logger.error("load_data: invalid data {0}".format(package_data))
+        except Exception as e:
+            if logger:
+                logger.error("load_data failed: {0} \n {1}".format(e, traceback.format_exc()))
+            return None
+
+        if manifest_hash is not None:
+            cls.cache.store(manifest_hash=manifest_hash, fields=PackageInfo.FIELDS,
+                            records=[package_info.values() for package_info in packages], invalid=invalid,
+                            registry=InstallerRegistry.fingerprint(package_types=package_types))
+        return cls(packages=packages)
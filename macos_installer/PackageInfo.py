@@ -1,12 +1,17 @@
-import json
-import traceback
-
-from .packages_data import PACKAGES_DATA
+from .InstallerRegistry import InstallerRegistry
+from .InstalledVersions import InstalledVersions
+from .VersionConstraint import VersionConstraint
 
 
 class PackageInfo:
     """PackageInfo represents the data needed to install a single package"""
 
+    # Fields read from a manifest entry
+    FIELDS = ("full_name", "name", "package_type", "mas_id", "state", "force", "package_url", "depends_on",
+              "version")
+
+    __slots__ = ("logger", "valid") + FIELDS
+
     all_instances = None
 
     def __init__(self,
@@ -14,7 +19,10 @@ class PackageInfo:
             name=None,
             package_type=None,
             mas_id=None,
-            state=None):
+            state=None,
+            package_url=None,
+            depends_on=None,
+            version=None):
         """
         Create a new PackageInfo instance
         Args:
@@ -22,7 +30,11 @@ class PackageInfo:
             name (str): Actual package name used for installation e.g. 'atom'
             package_type (str): Package type. One of 'brew', 'brewcask', 'mas'
             mas_id (str): Mac Apple Store id (Only required for Mac Apple Store package)
-            state (str): 'present' or 'absent'
+            state (str): 'present', 'absent' or 'latest' (present and upgraded when outdated)
+            package_url (str): Where to download the package from, for package types that need it e.g. 'pkg'
+            depends_on list(str): Names of the packages that must reach their configured state before this one
+            version (str): Installed version required when present e.g. '2.20.1', '>=3.2' or '>=3.2,<4'.
+                Only for 'brew' and 'brewcask' packages.
         """
 
         self.logger = None
@@ -33,6 +45,9 @@ class PackageInfo:
         self.mas_id = mas_id
         self.state = state if state else "present"
         self.force = "false"
+        self.package_url = package_url
+        self.depends_on = depends_on
+        self.version = version
 
     def set_field(self, name, value):
         """
@@ -46,7 +61,7 @@ class PackageInfo:
             No return value
 
         """
-        self.__dict__[name] = value
+        setattr(self, name, value)
 
     def __repr__(self):
         """
@@ -56,27 +71,44 @@ class PackageInfo:
             String representation of this object
 
         """
-        out = ""
-        for key, value in self.__dict__.items():
-            if key == "logger":
-                continue
-            sep = ',' if out else ''
-            out = out + "{0}{1}:{2}".format(sep, key, value)
-
-        return out
+        return ",".join("{0}:{1}".format(key, getattr(self, key)) for key in ("valid",) + self.FIELDS)
 
-    def is_valid(self):
+    def is_valid(self, logger=None):
         """
         Are the settings for this instance valid and consistent?
 
+        Args:
+            logger (obj): Logger instance. Defaults to this instance's logger
+
         Returns:
             bool: True if valid, False otherwise
         """
 
+        logger = logger or self.logger
+
+        if self.depends_on is not None and not (
+                isinstance(self.depends_on, list) and all(isinstance(name, str) for name in self.depends_on)):
+            if logger:
+                logger.error("Package {0} 'depends_on' must be a list of package names".format(self.name))
+            return False
+
+        if self.version is not None:
+            if self.package_type not in InstalledVersions.BACKENDS:
+                if logger:
+                    logger.error("Package {0} 'version' is only supported for package types {1}".format(
+                        self.name, ", ".join(InstalledVersions.BACKENDS)))
+                return False
+            if VersionConstraint.parse(self.version) is None:
+                if logger:
+                    logger.error("Package {0} 'version' {1} is not a valid version constraint".format(
+                        self.name, self.version))
+                return False
+
         # Mac Apple Store (mas) packages
         if self.package_type == 'mas':
             if not self.mas_id:
-                self.logger.error("Package type 'mas' without 'mas_id'")
+                if logger:
+                    logger.error("Package type 'mas' without 'mas_id'")
                 return False
             else:
                 return True
@@ -93,25 +125,61 @@ class PackageInfo:
         if self.package_type == 'brewcasklocal':
             return True if self.name else False
 
-        # package_type: zip, pkg, dmg or ? requires package_url
-        return False
+        # Other package types e.g. zip, pkg or dmg are validated by the installer registered for them
+        installer_class = InstallerRegistry.get(package_type=self.package_type, logger=logger)
+        if installer_class is None:
+            return False
+        return installer_class.is_valid_package(package_info=self, logger=logger)
 
-    def load_from_data(self, data):
+    def load_from_data(self, data, logger=None):
         """
         Load an instance from data structure.
 
         Args:
             data (dict): Data structure. See package_data.py or README for examples.
+            logger (obj): Logger instance used to report invalid data
 
         Returns:
             bool: True if loaded object is valid, False otherwise
         """
-        for field_name in self.__dict__.keys():
+        for field_name in self.FIELDS:
             if field_name in data:
-                self.__dict__[field_name] = data[field_name]
-        self.valid = self.is_valid()
+                setattr(self, field_name, data[field_name])
+        if isinstance(self.depends_on, str):
+            # A single dependency can be given by name
+            self.depends_on = [self.depends_on]
+        self.valid = self.is_valid(logger=logger)
         return self.valid
 
+    def values(self):
+        """
+        Get the field values, in FIELDS order
+
+        Returns:
+            tuple: Field values
+        """
+        return tuple(getattr(self, field_name) for field_name in self.FIELDS)
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Create a valid instance from field values saved with values(), without validating again
+
+        Args:
+            values tuple: Field values in FIELDS order
+
+        Returns:
+            obj: PackageInfo instance
+        """
+        package_info = cls.__new__(cls)
+        package_info.logger = None
+        package_info.valid = True
+        # Same order as FIELDS. Unpacked directly because this runs for every entry of a cached manifest.
+        (package_info.full_name, package_info.name, package_info.package_type, package_info.mas_id,
+         package_info.state, package_info.force, package_info.package_url, package_info.depends_on,
+         package_info.version) = values
+        return package_info
+
     @classmethod
     def load_all_data(cls, logger=None, data=None):
         """
@@ -129,25 +197,14 @@ class PackageInfo:
 
         """
 
-        packages_info = []
-        if not data:
-            data = PACKAGES_DATA
-        try:
-            packages_data = json.loads(data)
-
-            for package_data in  packages_data:
-                package_info = PackageInfo()
-                package_info.load_from_data(package_data)
-                if package_info.is_valid():
-                    packages_info.append(package_info)
-                else:
-                    logger.error("load_data: invalid data {0}".format(package_data))
+        # Imported here: PackageCatalog builds on this class
+        from .PackageCatalog import PackageCatalog
 
-            cls.all_instances = packages_info
-            return cls.get_instances()
-        except Exception as e:
-            logger.error("load_data failed: {0} \n {1}".format(e, traceback.format_exc()))
+        catalog = PackageCatalog.load(logger=logger, data=data)
+        if catalog is None:
             return None
+        cls.all_instances = catalog.packages
+        return cls.get_instances()
 
     @classmethod
     def get_instances(cls):
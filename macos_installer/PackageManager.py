@@ -1,13 +1,23 @@
-import os
+import asyncio
+import json
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
 from .packages_data import PACKAGES_DATA
-from .PackageInfo import PackageInfo
-
-from .installers.BrewInstaller import BrewInstaller
-from .installers.BrewCaskInstaller import BrewCaskInstaller
-from .installers.MASInstaller import MASInstaller
-from .installers.BrewCaskLocalInstaller import BrewCaskLocalInstaller
-
-PERSONAL_BOOTSTRAP="{0}/.bootstrap_personal".format(os.environ['HOME'])
+from .PackageCatalog import PackageCatalog
+from .Inventory import Inventory
+from .Outdated import Outdated
+from .InstalledVersions import InstalledVersions
+from .CircuitBreaker import CircuitBreaker
+from .CaskRepo import CaskRepo
+from .Scheduler import Scheduler
+from .Plan import Plan
+from .AsyncCommandRunner import AsyncCommandRunner
+from .Tracer import Tracer
+from .InstallerRegistry import InstallerRegistry
+from .DependencyGraph import DependencyGraph
+from .ManifestCache import ManifestCache
+from .Journal import Journal
+from .PrivilegedHelper import PrivilegedHelper
 
 
 class PackageManager():
@@ -16,6 +26,24 @@ class PackageManager():
     packages_info = []
     installers = []
 
+    DEFAULT_FETCH_CONCURRENCY = 4
+
+    @classmethod
+    def reset(cls):
+        """
+        Discard all state shared between installers so that a new run starts fresh
+
+        Returns:
+            No return value
+        """
+
+        Inventory.reset()
+        CaskRepo.reset()
+        PrivilegedHelper.reset()
+        Outdated.reset()
+        InstalledVersions.reset()
+        CircuitBreaker.reset()
+
     @classmethod
     def load_all_data(cls, logger=None, data=None):
         """
@@ -25,12 +53,14 @@ class PackageManager():
             data list(dict): Data structure. See package\_data.py or README for examples.
 
         Returns:
-             list(obj): 
-             A list of populated PackageInfo instances
+             obj: 
+             PackageCatalog of populated PackageInfo instances or None if the data can't be read
         """
 
         packages_data = data if data else PACKAGES_DATA
-        cls.packages_info = PackageInfo.load_all_data(data=packages_data, logger=logger)
+        with Tracer.span(name="load_all_data", category="manager") as span_args:
+            cls.packages_info = PackageCatalog.load(data=packages_data, logger=logger)
+            span_args["packages"] = len(cls.packages_info) if cls.packages_info is not None else 0
         return cls.packages_info
 
     @classmethod
@@ -39,7 +69,7 @@ class PackageManager():
         Create an appropriate installer for each configured package
 
         Args:
-            packages_info list(obj): A list of PackageInfo instances
+            packages_info (obj): PackageCatalog or list of PackageInfo instances
 
         Returns:
             list(obj):
@@ -49,66 +79,510 @@ class PackageManager():
         if not packages_info:
             packages_info = cls.packages_info
 
-        for package_info in packages_info:
+        with Tracer.span(name="create_installers", category="manager") as span_args:
+            cls.installers = []
+            # package_type -> installer class or None if the type is skipped. Each backend is imported
+            # only when the data contains its package type.
+            installer_classes = {}
+            for package_info in packages_info:
 
-            # Don't try to use an invalid package spec
-            if not package_info.valid:
-                continue
+                # Don't try to use an invalid package spec
+                if not package_info.valid:
+                    continue
 
-            if package_info.package_type == 'brew':
-                installer = BrewInstaller(logger=logger, package_info=package_info)
-                cls.installers.append(installer)
-            elif package_info.package_type == 'brewcask':
-                installer = BrewCaskInstaller(logger=logger, package_info=package_info)
-                cls.installers.append(installer)
-            elif package_info.package_type == 'mas':
-                installer = MASInstaller(logger=logger, package_info=package_info)
-                cls.installers.append(installer)
-            elif package_info.package_type == 'brewcasklocal':
-                # Skip unless personal system
-                if os.path.exists(PERSONAL_BOOTSTRAP):
-                    installer = BrewCaskLocalInstaller(logger=logger, package_info=package_info)
-                    cls.installers.append(installer)
-            else:
-                pass
+                package_type = package_info.package_type
+                if package_type not in installer_classes:
+                    installer_class = InstallerRegistry.get(package_type=package_type, logger=logger)
+                    if installer_class is not None and not installer_class.is_enabled(logger=logger):
+                        installer_class = None
+                    installer_classes[package_type] = installer_class
+
+                installer_class = installer_classes[package_type]
+                if installer_class is not None:
+                    cls.installers.append(installer_class(logger=logger, package_info=package_info))
+            span_args["installers"] = len(cls.installers)
 
         return cls.installers
 
     @classmethod
-    def run_installers(cls, logger=None, installers=None ):
+    def group_installers(cls, installers=None, batch=False, graph=None):
+        """
+        Group installers into units of work. Each unit is run with a single call.
+
+        Args:
+            installers list(obj): List of configured \*Installer instances
+            batch (bool): Group installers of the same batchable type and action into one unit
+            graph (obj): DependencyGraph of the installers. Installers with dependencies or dependents
+                are never batched, so that each starts and finishes on its own.
+
+        Returns:
+            list(list(obj)):
+            Units of work in the order of their first installer
+        """
+
+        units = []
+        batches = {}
+        for installer in installers:
+            action = installer.action()
+            if batch and installer.can_batch(action) and not (graph and graph.has_edges(installer)):
+                key = (type(installer), action)
+                if key in batches:
+                    batches[key].append(installer)
+                    continue
+                batches[key] = [installer]
+                units.append(batches[key])
+            else:
+                units.append([installer])
+        return units
+
+    @classmethod
+    def run_unit(cls, logger=None, unit=None):
+        """
+        Run a single unit of work
+
+        Args:
+            unit list(obj): Installers created by group_installers
+
+        Returns:
+            dict: installer -> result of install() or remove(), None if deferred because the backend is down
+        """
+
+        backend = unit[0].package_info.package_type
+        if CircuitBreaker.is_open(backend):
+            return cls.defer(logger=logger, results={installer: False for installer in unit}, unavailable={backend})
+        with CircuitBreaker.watch() as unavailable:
+            if len(unit) == 1:
+                results = {unit[0]: unit[0].run()}
+            else:
+                installer_class = type(unit[0])
+                results = installer_class.run_batch(logger=logger, installers=unit, action=unit[0].action())
+        return cls.defer(logger=logger, results=results, unavailable=unavailable)
+
+    @classmethod
+    def defer(cls, logger=None, results=None, unavailable=None):
+        """
+        Defer the failed installers of backends whose circuit is open, if their commands were refused or failed
+        transiently: their failure says the backend is down, not that the package is wrong. Deferred installers
+        aren't journaled as done, so a resumed run retries them.
+
+        Args:
+            results (dict): installer -> result of install() or remove(). Updated in place.
+            unavailable (set): package_types whose commands were refused or failed transiently while the
+                installers ran, from CircuitBreaker.watch()
+
+        Returns:
+            dict: results, with None for the deferred installers
+        """
+
+        for installer, result in results.items():
+            backend = installer.package_info.package_type
+            if result is False and backend in (unavailable or ()) and CircuitBreaker.is_open(backend):
+                logger.warning("PackageManager {0} deferred: {1} is unavailable".format(
+                    installer.name, installer.package_info.package_type))
+                results[installer] = None
+        return results
+
+    @classmethod
+    def prefetch(cls, logger=None, installers=None, executor=None):
+        """
+        Start downloading the artifacts of all installers that will install something
+
+        Args:
+            installers list(obj):  List of configured \*Installer instances
+            executor (obj): Executor the downloads run on
+
+        Returns:
+            dict: installer -> future of installer.fetch()
+        """
+
+        fetches = {}
+        for installer in installers:
+            if installer.needs_fetch():
+                fetches[installer] = executor.submit(installer.fetch)
+        return fetches
+
+    @classmethod
+    def plan(cls, logger=None, data=None):
+        """
+        Compute the actions all_actions would execute, without executing any of them.
+        Presence is answered from a single fresh inventory snapshot per backend.
+
+        Args:
+            data list(dict): Data structure. See package_data.py or README for examples.
+
+        Returns:
+            obj: Plan instance. Pass it to run_installers or all_actions to execute it.
+        """
+
+        cls.reset()
+        packages_info = cls.load_all_data(data=data, logger=logger)
+        installers = cls.create_installers(packages_info=packages_info, logger=logger)
+        return Plan.build(logger=logger, installers=installers)
+
+    @classmethod
+    def dependency_graph(cls, logger=None, installers=None):
+        """
+        Build the dependency graph of the installers if any package has depends_on
+
+        Args:
+            installers list(obj): \*Installer instances, including those that won't run but can be depended on
+
+        Returns:
+            obj: DependencyGraph instance, None if no package has dependencies or False if they form a cycle
+        """
+
+        if not any(installer.package_info.depends_on for installer in installers):
+            return None
+        graph = DependencyGraph.build(logger=logger, installers=installers)
+        return graph if graph is not None else False
+
+    @classmethod
+    def manifest_hash(cls, data=None):
+        """
+        Compute the content hash identifying the data of a run
+
+        Args:
+            data (str|list(dict)): JSON text or parsed data. Defaults to PACKAGES_DATA
+
+        Returns:
+            str: sha256 hex digest
+        """
+
+        data = data if data else PACKAGES_DATA
+        return ManifestCache.manifest_hash(data if isinstance(data, str) else json.dumps(data, sort_keys=True))
+
+    @classmethod
+    def journal(cls, logger=None, data=None, plan=None, journal=None):
+        """
+        Get the journal of a run
+
+        Args:
+            data list(dict): Data structure being run. Identifies the run to resume.
+            plan (obj): Plan being run instead of data. Its packages' fields identify the run.
+            journal (bool|obj): True for a Journal in the cache directory, or a Journal instance
+
+        Returns:
+            obj: Journal instance or None if the run isn't journaled
+        """
+
+        if not journal:
+            return None
+        if journal is not True:
+            return journal
+        if plan:
+            data = [dict(zip(plan_action.installer.package_info.FIELDS, plan_action.installer.package_info.values()))
+                    for plan_action in plan.actions]
+        return Journal(logger=logger, manifest_hash=cls.manifest_hash(data=data))
+
+    @classmethod
+    def resume(cls, logger=None, installers=None, journal=None, resume=False, results=None):
+        """
+        Open the journal and take out the installers a resumed run already confirmed as done
+
+        Args:
+            installers list(obj): \*Installer instances to run
+            journal (obj): Journal instance
+            resume (bool): Skip the actions the journal confirms as done
+            results (dict): installer -> result, updated with the result the journal recorded for each
+                installer taken out
+
+        Returns:
+            list(obj): Installers still to run
+        """
+
+        done = journal.open(resume=resume)
+        if done:
+            remaining = []
+            for installer in installers:
+                key = Journal.key(installer)
+                if key in done:
+                    results[installer] = done[key]
+                else:
+                    remaining.append(installer)
+            installers = remaining
+        journal.planned(installers=installers)
+        return installers
+
+    @classmethod
+    def run_installers(cls, logger=None, installers=None, batch=False, concurrency=None, prefetch=None,
+                       plan=None, journal=None, resume=False):
         """
         Run all the installer instances
 
         Args:
             installers list(obj):  List of configured \*Installer instances
+            batch (bool): Install or remove packages of the same Homebrew type with one command
+            concurrency (bool|dict): Run backends concurrently. True for Scheduler.DEFAULT_LIMITS or
+                a dict of package_type -> limit. Serial if not set.
+            prefetch (bool|int): Download artifacts in the background while earlier packages install.
+                True for DEFAULT_FETCH_CONCURRENCY downloads at once or the number of downloads.
+            plan (obj): Plan from plan(). Only its pending installers are run, installers is ignored.
+            journal (obj): Journal recording the run's actions as they complete. Not journaled if None.
+            resume (bool): Skip the actions the journal confirms a previous run of the same data completed.
+                Only an action that was in flight is verified again.
+
+        Packages with depends_on run in dependency order, the longest chains of dependents first. A package
+        whose dependency doesn't reach its configured state is skipped.
 
         Returns:
-            No return value
+            dict: installer -> result of install() or remove(), None if skipped for a dependency or deferred
+            because its backend is down.
+            None if the dependencies form a cycle; nothing is run.
         """
 
-        if not installers:
+        results = {}
+        noops = []
+        if plan:
+            installers = plan.pending()
+            noops = plan.noops()
+            # Already in the configured state: the same result install() or remove() would return
+            for installer in noops:
+                results[installer] = False
+        elif not installers:
             installers = cls.installers
 
-        for installer in installers:
-            if installer.state == "present":
-                installer.install()
-            elif installer.state == "absent":
-                installer.remove()
+        graph = cls.dependency_graph(logger=logger, installers=list(installers) + list(noops))
+        if graph is False:
+            return None
+
+        if journal:
+            # Installers done before stay in the graph, their dependents see them as satisfied
+            installers = cls.resume(logger=logger, installers=installers, journal=journal, resume=resume,
+                                    results=results)
+
+        units = cls.group_installers(installers=installers, batch=batch, graph=graph)
+
+        fetches = {}
+        fetch_executor = None
+        if prefetch:
+            max_workers = cls.DEFAULT_FETCH_CONCURRENCY if prefetch is True else prefetch
+            fetch_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="macos_installer-fetch")
+            fetches = cls.prefetch(logger=logger, installers=installers, executor=fetch_executor)
+
+        def run_unit(unit):
+            # Start as soon as this unit's artifacts are downloaded
+            wait([fetches[installer] for installer in unit if installer in fetches])
+            if not journal:
+                return cls.run_unit(logger=logger, unit=unit)
+            journal.started(installers=unit)
+            unit_results = cls.run_unit(logger=logger, unit=unit)
+            journal.completed(results=unit_results)
+            return unit_results
+
+        try:
+            if graph:
+                limits = concurrency if isinstance(concurrency, dict) else None
+                scheduler = Scheduler(logger=logger, limits=limits)
+                results.update(scheduler.run_graph(units=units, graph=graph, run_unit=run_unit,
+                                                   max_workers=None if concurrency else 1))
+            elif concurrency:
+                limits = concurrency if isinstance(concurrency, dict) else None
+                scheduler = Scheduler(logger=logger, limits=limits)
+                results.update(scheduler.run(units=units, run_unit=run_unit))
             else:
-                pass
+                for unit in units:
+                    results.update(run_unit(unit))
+        finally:
+            if fetch_executor:
+                fetch_executor.shutdown(wait=True)
+            if journal:
+                journal.close()
+        cls.check_versions(logger=logger, results=results)
+        return results
 
     @classmethod
-    def all_actions(cls, logger=None, data=None):
+    def all_actions(cls, logger=None, data=None, batch=False, concurrency=None, prefetch=None, plan=None,
+                    journal=None, resume=False):
         """
         Execute all actions for all configured packages i.e. install or remove them.
 
         Args:
             data list(dict): Data structure. See package_data.py or README for examples.
+            batch (bool): Install or remove packages of the same Homebrew type with one command
+            concurrency (bool|dict): Run backends concurrently. See run_installers
+            prefetch (bool|int): Download artifacts while earlier packages install. See run_installers
+            plan (obj): Plan from plan(). Executed as is, without reloading data or relisting packages.
+            journal (bool|obj): Journal the run so that it can be resumed. True for the default Journal
+            resume (bool): Skip the actions a previous run of the same data completed. Implies journal.
 
         Returns:
-            No return value
+            dict: installer -> result of install() or remove()
 
         """
+        journal = cls.journal(logger=logger, data=data, plan=plan, journal=journal or resume)
+        if plan:
+            return cls.run_installers(logger=logger, batch=batch, concurrency=concurrency, prefetch=prefetch,
+                                      plan=plan, journal=journal, resume=resume)
+
+        cls.reset()
         packages_info = cls.load_all_data(data=data, logger=logger)
         installers = cls.create_installers(packages_info=packages_info, logger=logger)
-        cls.run_installers(installers=installers, logger=logger)
+        return cls.run_installers(installers=installers, logger=logger, batch=batch, concurrency=concurrency,
+                                  prefetch=prefetch, journal=journal, resume=resume)
+
+    @classmethod
+    async def all_actions_async(cls, logger=None, data=None, limits=None, timeout=None, plan=None, journal=None,
+                                resume=False):
+        """
+        Execute all actions for all configured packages on an asyncio event loop.
+        Commands run through one AsyncCommandRunner, so one thread drives all processes.
+
+        Args:
+            data list(dict): Data structure. See package_data.py or README for examples.
+            limits (dict): package_type -> maximum concurrent commands. See AsyncCommandRunner.DEFAULT_LIMITS
+            timeout (float): Seconds before any single command is killed. None for no limit.
+            plan (obj): Plan from plan(). Executed as is, without reloading data or relisting packages.
+            journal (bool|obj): Journal the run so that it can be resumed. See all_actions
+            resume (bool): Skip the actions a previous run of the same data completed. Implies journal.
+
+        Returns:
+            dict: installer -> result of install_async() or remove_async(), None if skipped for a dependency or
+            deferred because its backend is down.
+            None if the dependencies form a cycle; nothing is run.
+        """
+
+        results = {}
+        noops = []
+        if plan:
+            installers = plan.pending()
+            noops = plan.noops()
+            for installer in noops:
+                results[installer] = False
+        else:
+            cls.reset()
+            packages_info = cls.load_all_data(data=data, logger=logger)
+            installers = cls.create_installers(packages_info=packages_info, logger=logger)
+
+        graph = cls.dependency_graph(logger=logger, installers=list(installers) + list(noops))
+        if graph is False:
+            return None
+
+        journal = cls.journal(logger=logger, data=data, plan=plan, journal=journal or resume)
+        if journal:
+            installers = cls.resume(logger=logger, installers=installers, journal=journal, resume=resume,
+                                    results=results)
+
+        runner = AsyncCommandRunner(logger=logger, limits=limits, timeout=timeout)
+        await cls.load_inventories_async(logger=logger, installers=installers, runner=runner)
+
+        # Set when an installer is done, for the installers depending on it
+        finished = {installer: asyncio.Event() for installer in installers}
+
+        async def run_installer(installer):
+            try:
+                if graph:
+                    dependencies = graph.dependencies.get(installer, [])
+                    for dependency in dependencies:
+                        if dependency in finished:
+                            await finished[dependency].wait()
+                    if installer in graph.unknown or not all(dependency.is_satisfied() for dependency in dependencies):
+                        if installer.is_satisfied():
+                            return False
+                        logger.error("PackageManager.all_actions_async {0} skipped: a dependency is not in its "
+                                     "configured state".format(installer.name))
+                        return None
+                if journal:
+                    journal.started(installers=[installer])
+                backend = installer.package_info.package_type
+                result = False
+                unavailable = {backend}
+                if not CircuitBreaker.is_open(backend):
+                    # Each installer runs in its own task, so the watch sees only its commands
+                    with CircuitBreaker.watch() as unavailable:
+                        result = await installer.run_async(runner=runner)
+                result = cls.defer(logger=logger, results={installer: result}, unavailable=unavailable)[installer]
+                if journal:
+                    journal.completed(results={installer: result})
+                return result
+            except Exception as e:
+                logger.error("PackageManager.all_actions_async {0} failed: {1} \n {2}".format(
+                    installer.name, e, traceback.format_exc()))
+                return False
+            finally:
+                finished[installer].set()
+
+        try:
+            outcomes = await asyncio.gather(*(run_installer(installer) for installer in installers))
+        finally:
+            if journal:
+                journal.close()
+        results.update(zip(installers, outcomes))
+        await cls.check_versions_async(logger=logger, results=results, runner=runner)
+        return results
+
+    @classmethod
+    def check_versions(cls, logger=None, results=None):
+        """
+        Check the installed versions of the packages with a version constraint, all from one query.
+        A package whose installed version doesn't satisfy its constraint is reported and its result
+        set to False: it isn't in its configured state.
+
+        Args:
+            logger (obj): Logger instance
+            results (dict): installer -> result of install() or remove(), None if skipped. Updated in place.
+
+        Returns:
+            list(obj): \*Installer instances whose installed version doesn't satisfy their constraint
+        """
+
+        noncompliant = []
+        for installer, result in results.items():
+            if (result is None or installer.version_constraint() is None or
+                    installer.action() not in ("install", "upgrade") or not installer.is_present()):
+                continue
+            if not installer.is_version_compliant():
+                versions = installer.installed_versions().versions(
+                    backend=installer.package_info.package_type, name=installer.name)
+                logger.error("PackageManager.check_versions {0} installed version {1} doesn't satisfy {2}".format(
+                    installer.name, ", ".join(versions) or "unknown", installer.package_info.version))
+                results[installer] = False
+                noncompliant.append(installer)
+        return noncompliant
+
+    @classmethod
+    async def check_versions_async(cls, logger=None, results=None, runner=None):
+        """
+        Check the installed versions of the packages with a version constraint. The query runs on the event
+        loop. See check_versions.
+
+        Args:
+            logger (obj): Logger instance
+            results (dict): installer -> result of install_async() or remove_async(). Updated in place.
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            list(obj): \*Installer instances whose installed version doesn't satisfy their constraint
+        """
+
+        for installer, result in results.items():
+            if result is not None and installer.version_constraint() is not None:
+                # One query answers for every installer
+                await installer.is_version_compliant_async(runner=runner)
+        return cls.check_versions(logger=logger, results=results)
+
+    @classmethod
+    async def load_inventories_async(cls, logger=None, installers=None, runner=None):
+        """
+        Take the inventory snapshots the installers need before any of them run, one listing per backend
+        at most and all backends at once.
+
+        Args:
+            installers list(obj):  List of configured \*Installer instances
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            No return value
+        """
+
+        by_backend = {}
+        for installer in installers:
+            by_backend.setdefault(installer.package_info.package_type, []).append(installer)
+
+        async def load_backend(backend_installers):
+            for installer in backend_installers:
+                try:
+                    await installer.is_present_async(runner=runner)
+                except Exception as e:
+                    logger.error("PackageManager.load_inventories_async {0} failed: {1}".format(installer.name, e))
+
+        await asyncio.gather(*(load_backend(backend_installers) for backend_installers in by_backend.values()))
@@ -0,0 +1,182 @@
+class PlanAction:
+    """PlanAction is the action needed to bring a single package to its configured state"""
+
+    INSTALL = "install"
+    REMOVE = "remove"
+    UPGRADE = "upgrade"
+    NOOP = "noop"
+    # Present, but no installed version satisfies the version constraint. Left as is and reported as failed.
+    NONCOMPLIANT = "noncompliant"
+    # The state can't be checked without changing anything e.g. a local cask not checked out yet. Run to find out.
+    UNKNOWN = "unknown"
+
+    def __init__(self,
+                 installer=None,
+                 action=None):
+        """
+        Create a new PlanAction instance
+
+        Args:
+            installer (obj): \*Installer instance for the package
+            action (str): One of 'install', 'remove', 'upgrade', 'noop', 'noncompliant', 'unknown'
+        """
+
+        self.installer = installer
+        self.action = action
+
+    @property
+    def package_type(self):
+        """
+        Package type of the installer
+
+        Returns:
+            str: package_type e.g. 'brew'
+        """
+        return self.installer.package_info.package_type
+
+    def to_data(self):
+        """
+        Create a JSON compatible representation of this action
+
+        Returns:
+            dict: name, full_name, mas_id, state and action. For a package with a version constraint also the
+            version, the installed versions and whether they comply.
+        """
+        package_info = self.installer.package_info
+        data = {
+            "name": package_info.name,
+            "full_name": package_info.full_name,
+            "mas_id": package_info.mas_id,
+            "state": package_info.state,
+            "action": self.action,
+        }
+        installed_versions = self.installer.installed_versions()
+        if package_info.version is not None and installed_versions is not None:
+            data["version"] = package_info.version
+            data["installed_versions"] = installed_versions.versions(backend=package_info.package_type,
+                                                                     name=package_info.name)
+            data["version_compliant"] = self.installer.is_version_compliant()
+        return data
+
+    def __repr__(self):
+        """
+        Create the string representation of this object. For print(...) etc.
+
+        Returns:
+            String representation of this object
+        """
+        return "{0}:{1}:{2}".format(self.package_type, self.installer.name, self.action)
+
+
+class Plan:
+    """Plan is the list of actions a run would execute, computed without executing any of them"""
+
+    def __init__(self, actions=None):
+        """
+        Create a new Plan instance
+
+        Args:
+            actions list(obj): PlanAction instances in manifest order
+        """
+
+        self.actions = actions if actions else []
+
+    @classmethod
+    def build(cls, logger=None, installers=None):
+        """
+        Compare the configured state of each installer with the inventory snapshot. Packages configured
+        'latest' are compared with the outdated snapshot too: one query per backend. Present packages with a
+        version constraint are compared with the installed versions: one query per run. Nothing is changed,
+        so a package whose state can't be checked as things are gets the 'unknown' action.
+
+        Args:
+            logger (obj): Logger instance
+            installers list(obj): List of configured \*Installer instances
+
+        Returns:
+            obj: Plan instance
+        """
+
+        actions = []
+        for installer in installers:
+            action = installer.action()
+            if action is not None and not installer.can_plan():
+                action = PlanAction.UNKNOWN
+            elif action == PlanAction.INSTALL and installer.is_present():
+                action = PlanAction.NOOP if installer.is_version_compliant() else PlanAction.NONCOMPLIANT
+            elif action == PlanAction.REMOVE and not installer.is_present():
+                action = PlanAction.NOOP
+            elif action == PlanAction.UPGRADE:
+                if not installer.is_present():
+                    action = PlanAction.INSTALL
+                elif not installer.is_outdated():
+                    action = PlanAction.NOOP if installer.is_version_compliant() else PlanAction.NONCOMPLIANT
+            elif action is None:
+                action = PlanAction.NOOP
+            actions.append(PlanAction(installer=installer, action=action))
+        return Plan(actions=actions)
+
+    def pending(self):
+        """
+        Get the installers that have something to do, a version to report as noncompliant or an unknown state
+
+        Returns:
+            list(obj): \*Installer instances whose action isn't 'noop', in manifest order
+        """
+        return [plan_action.installer for plan_action in self.actions if plan_action.action != PlanAction.NOOP]
+
+    def noops(self):
+        """
+        Get the installers already in their configured state
+
+        Returns:
+            list(obj): \*Installer instances whose action is 'noop', in manifest order
+        """
+        return [plan_action.installer for plan_action in self.actions if plan_action.action == PlanAction.NOOP]
+
+    def by_backend(self):
+        """
+        Group the actions by package type
+
+        Returns:
+            dict: package_type -> list of PlanAction instances
+        """
+        grouped = {}
+        for plan_action in self.actions:
+            grouped.setdefault(plan_action.package_type, []).append(plan_action)
+        return grouped
+
+    def summary(self):
+        """
+        Count the actions of each kind
+
+        Returns:
+            dict: 'install', 'remove', 'upgrade', 'noop', 'noncompliant' and 'unknown' -> number of actions
+        """
+        counts = {PlanAction.INSTALL: 0, PlanAction.REMOVE: 0, PlanAction.UPGRADE: 0, PlanAction.NOOP: 0,
+                  PlanAction.NONCOMPLIANT: 0, PlanAction.UNKNOWN: 0}
+        for plan_action in self.actions:
+            counts[plan_action.action] = counts.get(plan_action.action, 0) + 1
+        return counts
+
+    def is_converged(self):
+        """
+        Is every package already in its configured state?
+
+        Returns:
+            bool: True if there is nothing to do
+        """
+        return not self.pending()
+
+    def to_data(self):
+        """
+        Create a JSON compatible representation of this plan
+
+        Returns:
+            dict: 'summary' counts and 'backends', package_type -> list of actions
+        """
+        return {
+            "summary": self.summary(),
+            "backends": {package_type: [plan_action.to_data() for plan_action in plan_actions]
+                         for package_type, plan_actions in self.by_backend().items()},
+        }
@@ -0,0 +1,236 @@
+import atexit
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+
+from .Tracer import Tracer
+
+
+class PrivilegedHelper:
+    """PrivilegedHelper runs file operations as root through one helper process started once per run"""
+
+    # Helper program, run by file path so that it doesn't depend on how this package was installed
+    SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "privileged.py")
+
+    # Command prefix that runs the helper as root. None for $MACOS_INSTALLER_SUDO (split like a shell
+    # command; empty runs the helper as the current user, e.g. for tests) or else ["sudo"].
+    prefix = None
+
+    instance = None
+    instance_lock = threading.Lock()
+
+    def __init__(self,
+                 logger=None,
+                 prefix=None):
+        """
+        Create a new PrivilegedHelper instance. The helper process starts with the first operation.
+
+        Args:
+            logger (obj): Logger instance
+            prefix list(str): Command prefix that runs the helper as root. Defaults to command_prefix()
+        """
+
+        self.logger = logger
+        self.prefix = prefix if prefix is not None else self.command_prefix()
+        self.process = None
+        self.failed = False
+        # True once an operation was run in the background, so that close() waits for it
+        self.background = False
+        # Operations waiting for the pipe: list of [operations, results]
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        self.pipe_lock = threading.Lock()
+
+    @classmethod
+    def command_prefix(cls):
+        """
+        Get the command prefix that runs the helper as root
+
+        Returns:
+            list(str): Command prefix
+        """
+
+        if cls.prefix is not None:
+            return list(cls.prefix)
+        configured = os.environ.get('MACOS_INSTALLER_SUDO')
+        if configured is not None:
+            return shlex.split(configured)
+        return ["sudo"]
+
+    @classmethod
+    def get(cls, logger=None):
+        """
+        Get the helper shared by all installers in this run
+
+        Args:
+            logger (obj): Logger instance
+
+        Returns:
+            obj: PrivilegedHelper instance
+        """
+
+        with cls.instance_lock:
+            if cls.instance is None:
+                cls.instance = PrivilegedHelper(logger=logger)
+            return cls.instance
+
+    @classmethod
+    def reset(cls):
+        """
+        Stop the shared helper so that the next run starts its own
+
+        Returns:
+            No return value
+        """
+
+        with cls.instance_lock:
+            instance = cls.instance
+            cls.instance = None
+        if instance is not None:
+            instance.close()
+
+    def start(self):
+        """
+        Start the helper process. Called with the pipe lock held. sudo asks for a password at most once,
+        on the terminal the run was started from.
+
+        Returns:
+            bool: True if the helper is running
+        """
+
+        if self.process is not None and self.process.poll() is None:
+            return True
+        if self.failed:
+            return False
+
+        cmd = self.prefix + [sys.executable, "-I", self.SERVER]
+        with Tracer.span(name=" ".join(cmd), category="command"):
+            try:
+                self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                                universal_newlines=True, bufsize=1)
+            except OSError as e:
+                self.failed = True
+                if self.logger:
+                    self.logger.error("PrivilegedHelper.start {0} failed: {1}".format(" ".join(cmd), e))
+                return False
+        atexit.register(self.close)
+        return True
+
+    def run(self, operations=None):
+        """
+        Carry out file operations as root. Operations submitted by other threads while the helper is busy
+        are sent along with them in one batch.
+
+        Args:
+            operations list(dict): Operations, see privileged.py e.g. {"op": "remove_tree", "path": p}
+
+        Returns:
+            list(dict): One result per operation: {"ok": True} or {"ok": False, "error": message}
+        """
+
+        request = [list(operations), None]
+        with self.pending_lock:
+            self.pending.append(request)
+
+        with self.pipe_lock:
+            with self.pending_lock:
+                batch = self.pending
+                self.pending = []
+            if batch:
+                self.send(batch)
+        return request[1]
+
+    def send(self, batch=None):
+        """
+        Send a batch of requests to the helper and hand each its results. Called with the pipe lock held.
+
+        Args:
+            batch list(list): Requests queued by run()
+
+        Returns:
+            No return value
+        """
+
+        operations = [operation for request in batch for operation in request[0]]
+        unavailable = [{"ok": False, "error": "privileged helper unavailable"}] * len(operations)
+        results = None
+        try:
+            if any(operation.get("background") for operation in operations):
+                self.background = True
+            with Tracer.span(name="privileged helper", category="command",
+                             operations=len(operations)) as span_args:
+                if self.start():
+                    try:
+                        self.process.stdin.write(json.dumps(operations) + "\n")
+                        self.process.stdin.flush()
+                        line = self.process.stdout.readline()
+                        results = json.loads(line) if line else None
+                    except (OSError, ValueError) as e:
+                        if self.logger:
+                            self.logger.error("PrivilegedHelper.run failed: {0}".format(e))
+                        results = None
+                if (not isinstance(results, list) or len(results) != len(operations) or
+                        not all(isinstance(result, dict) for result in results)):
+                    # The helper died, e.g. sudo was refused, or replied nonsense: fail the batch, restart on
+                    # the next one
+                    if results is not None and self.logger:
+                        self.logger.error("PrivilegedHelper.run unexpected reply: {0}".format(results))
+                    self.stop()
+                    results = unavailable
+                span_args["failed"] = sum(1 for result in results if not result.get("ok"))
+        finally:
+            # Every request of the batch gets its results, whatever happened: other threads are waiting on them
+            if results is None:
+                results = unavailable
+            index = 0
+            for request in batch:
+                request[1] = results[index:index + len(request[0])]
+                index += len(request[0])
+
+    def close(self):
+        """
+        Wait for the removals running in the background, log what they freed and stop the helper
+
+        Returns:
+            No return value
+        """
+
+        if self.background and self.process is not None:
+            self.background = False
+            result = self.run(operations=[{"op": "wait_purged"}])[0]
+            if self.logger:
+                if result.get("ok"):
+                    self.logger.info("PrivilegedHelper purged {0} files, {1} bytes in the background".format(
+                        result.get("files"), result.get("bytes")))
+                    errors = result.get("errors") or []
+                else:
+                    errors = [result.get("error")]
+                for error in errors:
+                    self.logger.warning("PrivilegedHelper purge failed: {0}".format(error))
+        self.stop()
+
+    def stop(self):
+        """
+        Stop the helper process: it exits at the end of its input, once its background removals are done
+
+        Returns:
+            No return value
+        """
+
+        process = self.process
+        self.process = None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        process.stdout.close()
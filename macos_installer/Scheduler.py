@@ -0,0 +1,199 @@
+import heapq
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Scheduler:
+    """Scheduler runs units of installer work concurrently, with a concurrency limit per backend"""
+
+    # Homebrew changes are serialized by its global lock anyway (see command.HOMEBREW_LOCK).
+    # Mac Apple Store downloads and local cask receipt processing can overlap.
+    DEFAULT_LIMITS = {
+        'brew': 1,
+        'brewcask': 1,
+        'brewcasklocal': 4,
+        'mas': 4,
+    }
+
+    def __init__(self,
+                 logger=None,
+                 limits=None):
+        """
+        Create a new Scheduler instance
+
+        Args:
+            logger (obj): Logger instance
+            limits (dict): package_type -> maximum number of concurrent units. Overrides DEFAULT_LIMITS.
+        """
+
+        self.logger = logger
+        self.limits = dict(self.DEFAULT_LIMITS)
+        if limits:
+            self.limits.update(limits)
+
+    def limit(self, backend):
+        """
+        Get the concurrency limit for a backend
+
+        Args:
+            backend (str): package_type
+
+        Returns:
+            int: Maximum number of units of this backend run at the same time
+        """
+        return max(1, self.limits.get(backend, 1))
+
+    def run(self, units=None, run_unit=None):
+        """
+        Run all units. Each backend gets its own lane of workers, so units of one backend
+        start in the order given while different backends run side by side.
+
+        Args:
+            units list(list(obj)): Units of work, see PackageManager.group_installers
+            run_unit (callable): Called with a unit, returns dict installer -> result
+
+        Returns:
+            dict: installer -> result
+        """
+
+        lanes = {}
+        for unit in units:
+            backend = unit[0].package_info.package_type
+            lanes.setdefault(backend, []).append(unit)
+
+        executors = []
+        futures = []
+        try:
+            for backend, backend_units in lanes.items():
+                executor = ThreadPoolExecutor(max_workers=self.limit(backend),
+                                              thread_name_prefix="macos_installer-{0}".format(backend))
+                executors.append(executor)
+                for unit in backend_units:
+                    futures.append((unit, executor.submit(run_unit, unit)))
+
+            results = {}
+            for unit, future in futures:
+                try:
+                    results.update(future.result())
+                except Exception as e:
+                    self.logger.error("Scheduler.run {0} failed: {1} \n {2}".format(
+                        ", ".join(installer.name for installer in unit), e, traceback.format_exc()))
+                    for installer in unit:
+                        results[installer] = False
+            return results
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=True)
+
+    def run_graph(self, units=None, graph=None, run_unit=None, max_workers=None):
+        """
+        Run units in dependency order. A unit starts once every installer it depends on is in its
+        configured state. Among the units ready to start, those heading the longest chains of dependents
+        start first, within the per-backend limits. Independent units run side by side.
+
+        Args:
+            units list(list(obj)): Units of work, see PackageManager.group_installers. Installers with
+                dependencies or dependents must each be in a unit of their own.
+            graph (obj): DependencyGraph of the installers. Installers in the graph without a unit are
+                not run; they count as done.
+            run_unit (callable): Called with a unit, returns dict installer -> result
+            max_workers (int): Maximum number of units run at the same time. 1 runs them one by one.
+
+        Returns:
+            dict: installer -> result. None for installers skipped because a dependency isn't in its
+            configured state.
+        """
+
+        unit_of = {}
+        for index, unit in enumerate(units):
+            for installer in unit:
+                unit_of[installer] = index
+
+        priorities = graph.critical_paths()
+        remaining = [0] * len(units)
+        blocked = [False] * len(units)
+        dependents = [set() for _ in units]
+        for index, unit in enumerate(units):
+            for installer in unit:
+                if installer in graph.unknown:
+                    blocked[index] = True
+                for dependency in graph.dependencies.get(installer, []):
+                    if dependency in unit_of:
+                        if index not in dependents[unit_of[dependency]]:
+                            dependents[unit_of[dependency]].add(index)
+                            remaining[index] += 1
+                    elif not dependency.is_satisfied():
+                        blocked[index] = True
+
+        results = {}
+        ready = []
+
+        def finish(index):
+            # A unit is done: release the dependents waiting for it. Dependents that can't run are
+            # finished in turn, without running, so that the whole chain behind a failure is skipped.
+            finished = [index]
+            while finished:
+                index = finished.pop()
+                satisfied = all(installer.is_satisfied() for installer in units[index])
+                for dependent in dependents[index]:
+                    remaining[dependent] -= 1
+                    if not satisfied:
+                        blocked[dependent] = True
+                    if not remaining[dependent] and not release(dependent):
+                        finished.append(dependent)
+
+        def release(index):
+            # All of a unit's dependencies are done: queue it, or skip it if one of them failed
+            if not blocked[index]:
+                priority = max(priorities.get(installer, 0.0) for installer in units[index])
+                heapq.heappush(ready, (-priority, index))
+                return True
+            for installer in units[index]:
+                satisfied = installer.is_satisfied()
+                results[installer] = False if satisfied else None
+                if not satisfied:
+                    self.logger.error("Scheduler.run_graph {0} skipped: a dependency is not in its configured state"
+                                      .format(installer.name))
+            return False
+
+        for index in range(len(units)):
+            if not remaining[index] and not release(index):
+                finish(index)
+
+        max_workers = max(1, max_workers or len(units) or 1)
+        running = {}
+        active = {}
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="macos_installer-graph")
+        try:
+            while ready or running:
+                deferred = []
+                while ready and len(running) < max_workers:
+                    entry = heapq.heappop(ready)
+                    backend = units[entry[1]][0].package_info.package_type
+                    if active.get(backend, 0) >= self.limit(backend):
+                        deferred.append(entry)
+                        continue
+                    active[backend] = active.get(backend, 0) + 1
+                    running[executor.submit(run_unit, units[entry[1]])] = entry[1]
+                for entry in deferred:
+                    heapq.heappush(ready, entry)
+                if not running:
+                    break
+
+                done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    unit = units[index]
+                    backend = unit[0].package_info.package_type
+                    active[backend] -= 1
+                    try:
+                        results.update(future.result())
+                    except Exception as e:
+                        self.logger.error("Scheduler.run_graph {0} failed: {1} \n {2}".format(
+                            ", ".join(installer.name for installer in unit), e, traceback.format_exc()))
+                        for installer in unit:
+                            results[installer] = False
+                    finish(index)
+            return results
+        finally:
+            executor.shutdown(wait=True)
@@ -0,0 +1,310 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Span:
+    """Span is one timed step of a run: a manager phase, an installer action or a spawned command"""
+
+    __slots__ = ("name", "category", "start", "duration", "thread_id", "args")
+
+    def __init__(self,
+                 name=None,
+                 category=None,
+                 start=None,
+                 duration=None,
+                 thread_id=None,
+                 args=None):
+        """
+        Create a new Span instance
+
+        Args:
+            name (str): What was done e.g. 'install atom' or 'brew list'
+            category (str): Kind of step e.g. 'manager', 'install', 'is_present', 'command'
+            start (float): Start, seconds since the tracer was enabled
+            duration (float): Duration in seconds
+            thread_id (int): Track the step ran on: its asyncio task's, or else its thread's
+            args (dict): Details e.g. package, exit status, output size
+        """
+
+        self.name = name
+        self.category = category
+        self.start = start
+        self.duration = duration
+        self.thread_id = thread_id
+        self.args = args if args else {}
+
+
+class Tracer:
+    """Tracer records spans for a run and exports them as Chrome trace events or a summary table"""
+
+    enabled = False
+    origin = 0.0
+    spans = []
+    lock = threading.Lock()
+
+    # (installer id, category) pairs being traced in the current thread or task, so that an override
+    # calling its base class method is recorded once
+    active = contextvars.ContextVar("active", default=frozenset())
+
+    # Categories of the installer actions timed per package in summary()
+    ACTION_CATEGORIES = ("install", "remove", "upgrade")
+
+    # (task, track id) of the current asyncio task. Concurrent tasks overlap on one thread, so each gets its
+    # own track. A task inherits its creator's value, so the task is checked too.
+    task_track = contextvars.ContextVar("task_track", default=None)
+    task_tracks = itertools.count(1)
+
+    @classmethod
+    def enable(cls):
+        """
+        Start recording spans, discarding any recorded before
+
+        Returns:
+            No return value
+        """
+
+        with cls.lock:
+            cls.spans = []
+            cls.origin = time.perf_counter()
+            cls.enabled = True
+
+    @classmethod
+    def disable(cls):
+        """
+        Stop recording spans. Recorded spans are kept for export.
+
+        Returns:
+            No return value
+        """
+
+        cls.enabled = False
+
+    @classmethod
+    @contextmanager
+    def span(cls, name=None, category=None, **args):
+        """
+        Time the enclosed block. Details found out inside the block can be added to the yielded dict.
+
+        Args:
+            name (str): What is done
+            category (str): Kind of step
+            args: Details recorded with the span
+
+        Returns:
+            Context manager yielding the span's args dict
+        """
+
+        if not cls.enabled:
+            yield args
+            return
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            span = Span(name=name, category=category, start=start - cls.origin, duration=end - start,
+                        thread_id=cls.track_id(), args=args)
+            with cls.lock:
+                cls.spans.append(span)
+
+    @classmethod
+    def track_id(cls):
+        """
+        Get the Chrome trace track of the current step
+
+        Returns:
+            int: Track of the current asyncio task, or the current thread's id outside of one
+        """
+
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is None:
+            return threading.get_ident()
+        track = cls.task_track.get()
+        if track is None or track[0] is not task:
+            track = (task, next(cls.task_tracks))
+            cls.task_track.set(track)
+        return track[1]
+
+    @classmethod
+    def traced(cls, category):
+        """
+        Decorator recording a span around an installer method, async methods included
+
+        Args:
+            category (str): Kind of step e.g. 'install'
+
+        Returns:
+            Decorator
+        """
+
+        def decorator(method):
+            if inspect.iscoroutinefunction(method):
+                @functools.wraps(method)
+                async def async_wrapper(self, *args, **kwargs):
+                    key = (id(self), category)
+                    active = cls.active.get()
+                    if not cls.enabled or key in active:
+                        return await method(self, *args, **kwargs)
+                    token = cls.active.set(active | {key})
+                    try:
+                        with cls.span(name="{0} {1}".format(category, self.name), category=category,
+                                      installer=type(self).__name__, package=self.name,
+                                      **cls.nesting(self, category, active)) as span_args:
+                            result = await method(self, *args, **kwargs)
+                            span_args["result"] = result
+                            return result
+                    finally:
+                        cls.active.reset(token)
+                return async_wrapper
+
+            @functools.wraps(method)
+            def wrapper(self, *args, **kwargs):
+                key = (id(self), category)
+                active = cls.active.get()
+                if not cls.enabled or key in active:
+                    return method(self, *args, **kwargs)
+                token = cls.active.set(active | {key})
+                try:
+                    with cls.span(name="{0} {1}".format(category, self.name), category=category,
+                                  installer=type(self).__name__, package=self.name,
+                                  **cls.nesting(self, category, active)) as span_args:
+                        result = method(self, *args, **kwargs)
+                        span_args["result"] = result
+                        return result
+                finally:
+                    cls.active.reset(token)
+            return wrapper
+
+        return decorator
+
+    @classmethod
+    def nesting(cls, installer, category, active):
+        """
+        Mark an action span started inside another action of the same installer, e.g. the install an upgrade
+        of an absent package runs, so that summary() counts its time once
+
+        Args:
+            installer (obj): \*Installer instance
+            category (str): Kind of step
+            active (frozenset): (installer id, category) pairs being traced
+
+        Returns:
+            dict: {'nested': True} for a nested action span, otherwise empty
+        """
+
+        if category in cls.ACTION_CATEGORIES and any((id(installer), outer) in active
+                                                     for outer in cls.ACTION_CATEGORIES):
+            return {"nested": True}
+        return {}
+
+    @classmethod
+    def chrome_trace(cls):
+        """
+        Create Chrome trace event data, viewable in chrome://tracing or Perfetto
+
+        Returns:
+            dict: {'traceEvents': [...]} with one complete ('X') event per span
+        """
+
+        pid = os.getpid()
+        with cls.lock:
+            spans = list(cls.spans)
+        events = []
+        for span in spans:
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round(span.start * 1e6, 3),
+                "dur": round(span.duration * 1e6, 3),
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": {key: value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+                         for key, value in span.args.items()},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    @classmethod
+    def export_chrome_trace(cls, path=None):
+        """
+        Write the recorded spans as a Chrome trace event JSON file
+
+        Args:
+            path (str): Output file
+
+        Returns:
+            No return value
+        """
+
+        with open(path, 'w') as trace_file:
+            json.dump(cls.chrome_trace(), trace_file)
+
+    @classmethod
+    def summary(cls, limit=10):
+        """
+        Summarize where the time went
+
+        Args:
+            limit (int): Number of rows in each list
+
+        Returns:
+            dict:
+
+            'slowest_packages': (package, seconds) for outermost install, remove and upgrade spans, slowest first
+
+            'repeated_commands': (command, count, total seconds) most repeated first
+        """
+
+        with cls.lock:
+            spans = list(cls.spans)
+
+        packages = {}
+        commands = {}
+        for span in spans:
+            if span.category in cls.ACTION_CATEGORIES:
+                if span.args.get("nested"):
+                    continue
+                package = span.args.get("package")
+                packages[package] = packages.get(package, 0.0) + span.duration
+            elif span.category == "command":
+                count, total = commands.get(span.name, (0, 0.0))
+                commands[span.name] = (count + 1, total + span.duration)
+
+        slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:limit]
+        repeated = sorted(((name, count, total) for name, (count, total) in commands.items()),
+                          key=lambda item: (item[1], item[2]), reverse=True)[:limit]
+        return {"slowest_packages": slowest, "repeated_commands": repeated}
+
+    @classmethod
+    def summary_table(cls, limit=10):
+        """
+        Format summary() as a plain text table
+
+        Args:
+            limit (int): Number of rows in each list
+
+        Returns:
+            str: Table
+        """
+
+        summary = cls.summary(limit=limit)
+        lines = ["Slowest packages", "{0:>10}  {1}".format("seconds", "package")]
+        for package, seconds in summary["slowest_packages"]:
+            lines.append("{0:>10.3f}  {1}".format(seconds, package))
+        lines.append("")
+        lines.append("Most repeated commands")
+        lines.append("{0:>6}  {1:>10}  {2}".format("count", "seconds", "command"))
+        for name, count, total in summary["repeated_commands"]:
+            lines.append("{0:>6}  {1:>10.3f}  {2}".format(count, total, name))
+        return "\n".join(lines)
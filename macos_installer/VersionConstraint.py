@@ -0,0 +1,143 @@
+import re
+
+
+class VersionConstraint:
+    """VersionConstraint is a condition on a package version e.g. '>=3.2,<4' or '3.2.1'"""
+
+    # Longest operators first, so that '>=' isn't read as '>'
+    OPERATORS = ("~=", "==", "!=", ">=", "<=", ">", "<")
+
+    PART = re.compile(r"\d+|[A-Za-z]+")
+
+    def __init__(self,
+                 text=None,
+                 clauses=None):
+        """
+        Create a new VersionConstraint instance. Use parse() to create one from text.
+
+        Args:
+            text (str): Constraint as written in the data
+            clauses list(tuple(str, str)): (operator, version) pairs, all of which must hold
+        """
+
+        self.text = text
+        self.clauses = clauses if clauses else []
+
+    @classmethod
+    def parse(cls, text=None):
+        """
+        Parse a constraint: comma separated clauses of an operator (~=, ==, !=, >=, <=, >, <) and a version.
+        A version without an operator must match exactly.
+
+        Args:
+            text (str): e.g. '3.2.1', '>=3.2', '>=3.2,<4' or '~=3.2'
+
+        Returns:
+            obj: VersionConstraint instance or None if the text isn't a valid constraint
+        """
+
+        if not isinstance(text, str):
+            return None
+        clauses = []
+        for clause in text.split(","):
+            clause = clause.strip()
+            operator = "=="
+            for candidate in cls.OPERATORS:
+                if clause.startswith(candidate):
+                    operator = candidate
+                    clause = clause[len(candidate):].strip()
+                    break
+            if not clause or not re.search(r"\d", clause):
+                return None
+            if operator == "~=" and cls.upper_bound(clause) is None:
+                return None
+            clauses.append((operator, clause))
+        return VersionConstraint(text=text, clauses=clauses)
+
+    @classmethod
+    def key(cls, version):
+        """
+        Get a sort key for a version. Numbers compare as numbers. Letters mark a pre-release: they come
+        before the end of the version, which comes before further numbers. So '3.2.10' > '3.2.9',
+        '3.2b1' < '3.2' < '3.2.1' and '2.20.1_1' > '2.20.1'. Zeros before the end or a pre-release are
+        ignored: '3.2' == '3.2.0'.
+
+        Args:
+            version (str): Version e.g. '3.2.1' or Homebrew's '2.20.1_1'
+
+        Returns:
+            tuple: Sort key
+        """
+
+        parts = []
+        zeros = []
+        for part in cls.PART.findall(version):
+            if not part.isdigit():
+                zeros = []
+                parts.append((0, part.lower()))
+            elif int(part) == 0:
+                zeros.append((2, 0))
+            else:
+                parts.extend(zeros)
+                zeros = []
+                parts.append((2, int(part)))
+        parts.append((1, ""))
+        return tuple(parts)
+
+    @classmethod
+    def upper_bound(cls, version):
+        """
+        Get the version a compatible release stays below: '~=3.2' means '>=3.2,<4' and '~=3.2.1' '>=3.2.1,<3.3'
+
+        Args:
+            version (str): Version with at least two parts, the last but one a number
+
+        Returns:
+            tuple: Sort key of the bound or None if the version has too few parts
+        """
+
+        parts = cls.PART.findall(version)
+        if len(parts) < 2 or not parts[-2].isdigit():
+            return None
+        return cls.key(".".join(parts[:-2] + [str(int(parts[-2]) + 1)]))
+
+    def matches(self, version=None):
+        """
+        Does a version satisfy every clause?
+
+        Args:
+            version (str): Installed version
+
+        Returns:
+            bool: True if it does
+        """
+
+        if version is None:
+            return False
+        installed = self.key(version)
+        for operator, clause_version in self.clauses:
+            wanted = self.key(clause_version)
+            if operator == "==" and installed != wanted:
+                return False
+            elif operator == "!=" and installed == wanted:
+                return False
+            elif operator == ">=" and installed < wanted:
+                return False
+            elif operator == "<=" and installed > wanted:
+                return False
+            elif operator == ">" and installed <= wanted:
+                return False
+            elif operator == "<" and installed >= wanted:
+                return False
+            elif operator == "~=" and (installed < wanted or installed >= self.upper_bound(clause_version)):
+                return False
+        return True
+
+    def __repr__(self):
+        """
+        Create the string representation of this object. For print(...) etc.
+
+        Returns:
+            String representation of this object
+        """
+        return self.text or ",".join(operator + version for operator, version in self.clauses)
@@ -0,0 +1,76 @@
+import threading
+import time
+
+from .Tracer import Tracer
+from .CircuitBreaker import CircuitBreaker
+
+# Homebrew takes a global lock while it changes an installation, so commands that do are serialized here
+HOMEBREW_LOCK = threading.RLock()
+
+
+def run(cmd=None, working_dir=None, logger=None, lock=None, backend=None):
+    """
+    Run a command. Single point through which all installers spawn processes.
+
+    Args:
+        cmd list(str): Command and arguments
+        working_dir (str): Directory to run the command in. Defaults to the current directory
+        logger (obj): Logger instance
+        lock (obj): Lock held while the command runs e.g. HOMEBREW_LOCK
+        backend (str): package_type the command is for. Its CircuitBreaker retries transient failures and
+            fails the command without running it once the backend looks down. None runs the command once.
+
+    Returns:
+        obj: run_command results with success, status_code, results and errors
+    """
+
+    if backend is None:
+        return run_locked(cmd=cmd, working_dir=working_dir, logger=logger, lock=lock)
+    breaker = CircuitBreaker.get(logger=logger, backend=backend)
+    return breaker.call(cmd=cmd, run=lambda: run_locked(cmd=cmd, working_dir=working_dir, logger=logger, lock=lock))
+
+
+def run_locked(cmd=None, working_dir=None, logger=None, lock=None):
+    """
+    Run a command once, holding a lock if given
+
+    Args:
+        cmd list(str): Command and arguments
+        working_dir (str): Directory to run the command in
+        logger (obj): Logger instance
+        lock (obj): Lock held while the command runs or None
+
+    Returns:
+        obj: run_command results
+    """
+
+    if lock is None:
+        return traced_run_command(cmd=cmd, working_dir=working_dir, logger=logger, lock_wait=0.0)
+    requested = time.perf_counter()
+    with lock:
+        return traced_run_command(cmd=cmd, working_dir=working_dir, logger=logger,
+                                  lock_wait=time.perf_counter() - requested)
+
+
+def traced_run_command(cmd=None, working_dir=None, logger=None, lock_wait=0.0):
+    """
+    Run a command inside a Tracer span recording its exit status and output size
+
+    Args:
+        cmd list(str): Command and arguments
+        working_dir (str): Directory to run the command in
+        logger (obj): Logger instance
+        lock_wait (float): Seconds spent waiting for the lock before the command could start
+
+    Returns:
+        obj: run_command results
+    """
+
+    # Imported on first use so that loading the package doesn't need it
+    from run_command import run_command
+
+    with Tracer.span(name=" ".join(cmd), category="command", lock_wait=lock_wait) as span_args:
+        results = run_command(cmd=cmd, working_dir=working_dir, logger=logger)
+        span_args["status_code"] = results.status_code
+        span_args["output_bytes"] = len(results.results or "") + len(results.errors or "")
+        return results
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+
+from macos_installer.FleetRunner import FleetRunner
+from macos_installer.installer import default_logger
+from macos_installer.transports.LocalTransport import LocalTransport
+from macos_installer.transports.SSHTransport import SSHTransport
+
+# Host statuses that fail a fleet run
+FAILED_STATUSES = ("failed", "unreachable", "timeout", "error")
+
+
+def main(hosts=None, data=None, logger=None, transport=None, parallel=None, timeout=None, plan=False,
+         options=None, progress=None):
+    """
+    Converge, or plan, the same data on many hosts at once
+
+    Args:
+        hosts list(str): Host names
+        data (str): JSON manifest. Defaults to packages_data.PACKAGES_DATA
+        logger (obj): logger instance
+        transport (obj): \*Transport instance. Defaults to SSHTransport()
+        parallel (int): Maximum hosts running at once. Defaults to FleetRunner.DEFAULT_PARALLEL
+        timeout (float): Seconds before a host's run is killed. None for no limit.
+        plan (bool): Only plan on each host
+        options list(str): Installer arguments for every host e.g. ["--batch"]
+        progress (callable): Called with (host, line) for each line a host writes. Defaults to logging it.
+
+    Returns:
+        list(obj): HostResult instances in host order. See FleetRunner.report for the aggregated report.
+    """
+
+    if not logger:
+        logger = default_logger()
+    if transport is None:
+        transport = SSHTransport()
+    runner = FleetRunner(logger=logger, transport=transport, parallel=parallel, timeout=timeout, progress=progress)
+    return runner.run(hosts=hosts, data=data, plan=plan, options=options)
+
+
+def parse_args(args=None):
+    """
+    Parse command line arguments
+
+    Args:
+        args list(str): Arguments. Defaults to sys.argv[1:]
+
+    Returns:
+        obj: argparse Namespace
+    """
+
+    parser = argparse.ArgumentParser(prog="macos_installer.fleet",
+                                     description="Install macOS packages on many hosts at once")
+    parser.add_argument("hosts", nargs="*", help="Hosts, as ssh destinations e.g. admin@mac-01")
+    parser.add_argument("--hosts-file", metavar="FILE", help="File of hosts, one per line")
+    parser.add_argument("--data", help="JSON manifest file. Defaults to packages_data.PACKAGES_DATA")
+    parser.add_argument("--plan", action="store_true", help="Only plan on each host")
+    parser.add_argument("--parallel", type=int, default=None, metavar="N",
+                        help="Run on at most N hosts at once. Defaults to {0}".format(FleetRunner.DEFAULT_PARALLEL))
+    parser.add_argument("--timeout", type=float, default=None, metavar="SECONDS",
+                        help="Kill a host's run after SECONDS")
+    parser.add_argument("--report", metavar="FILE",
+                        help="Write the aggregated JSON report to FILE instead of standard output")
+    parser.add_argument("--local", action="store_true",
+                        help="Run each host as a local process instead of through ssh, e.g. for tests")
+    parser.add_argument("--python", help="Python interpreter on the hosts")
+    parser.add_argument("--user", help="ssh user for hosts given without one")
+    parser.add_argument("--ssh-option", action="append", default=[], metavar="OPTION",
+                        help="Option passed to ssh, e.g. --ssh-option=-i --ssh-option=~/.ssh/fleet")
+    parser.add_argument("--installer-option", action="append", default=[], metavar="OPTION",
+                        help="Option passed to the installer on every host, e.g. --installer-option=--batch")
+    return parser.parse_args(args)
+
+
+def cli(args=None):
+    """
+    Command line entry point
+
+    Args:
+        args list(str): Arguments. Defaults to sys.argv[1:]
+
+    Returns:
+        int: Exit status, 1 if any host failed or couldn't be reached
+    """
+
+    options = parse_args(args)
+    hosts = list(options.hosts)
+    if options.hosts_file:
+        with open(options.hosts_file, 'r') as hosts_file:
+            hosts.extend(line.strip() for line in hosts_file if line.strip() and not line.startswith("#"))
+    if not hosts:
+        sys.stderr.write("macos_installer.fleet: no hosts\n")
+        return 2
+
+    data = None
+    if options.data:
+        with open(options.data, 'r') as data_file:
+            data = data_file.read()
+
+    if options.local:
+        transport = LocalTransport(python=options.python)
+    else:
+        transport = SSHTransport(python=options.python, user=options.user, options=options.ssh_option)
+
+    results = main(hosts=hosts, data=data, transport=transport, parallel=options.parallel, timeout=options.timeout,
+                   plan=options.plan, options=options.installer_option)
+    fleet_report = FleetRunner.report(results=results)
+    if options.report:
+        with open(options.report, 'w') as report_file:
+            json.dump(fleet_report, report_file, indent=2)
+            report_file.write("\n")
+    else:
+        json.dump(fleet_report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    return 1 if any(result.status in FAILED_STATUSES for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -1,26 +1,234 @@
 #!/uar/bin/env python3
 
-from standard_logger import get_logger
+import argparse
+import asyncio
+import json
+import sys
+
 from macos_installer.PackageManager import PackageManager
+from macos_installer.Convergence import Convergence
+from macos_installer.Tracer import Tracer
+
+# main() result when the last run already applied the data and nothing was installed or removed since
+CONVERGED = "converged"
 
 
-def main(data=None, logger=None):
+def main(data=None, logger=None, batch=False, concurrency=None, prefetch=None, plan=None, use_asyncio=False,
+         journal=None, resume=False, force=False):
     """
     Standalone entry point for installation package
 
     Args:
         data (list(dict)): Data structure. See package_data.py or README for examples.
         logger (obj): logger instance
+        batch (bool): Install or remove packages of the same Homebrew type with one command
+        concurrency (bool|dict): Run backends concurrently. True for default limits or a dict of
+            package_type -> limit
+        prefetch (bool|int): Download artifacts while earlier packages install
+        plan (obj): Precomputed Plan from plan(). data is ignored if given.
+        use_asyncio (bool): Drive all commands from one asyncio event loop. concurrency is used as the
+            per-backend limits; batch and prefetch don't apply.
+        journal (bool|obj): Journal the run so that an interrupted run can be resumed
+        resume (bool): Skip the actions an interrupted run of the same data completed
+        force (bool): Check every package even if the last run converged
     
     Returns:
-        Nothing returned
+        str|dict: CONVERGED if the last fully successful run applied the same data and nothing was installed
+        or removed since; nothing is checked. Otherwise installer -> result, see PackageManager.all_actions
+    """
+
+    if not logger:
+        logger = default_logger()
+
+    convergence = None
+    if not plan:
+        convergence = Convergence(logger=logger, manifest_hash=PackageManager.manifest_hash(data=data))
+        if not force and not resume and convergence.is_converged():
+            logger.info("macos_installer: converged, nothing to do")
+            return CONVERGED
+
+    if use_asyncio:
+        limits = concurrency if isinstance(concurrency, dict) else None
+        results = asyncio.run(PackageManager.all_actions_async(data=data, logger=logger, limits=limits, plan=plan,
+                                                               journal=journal, resume=resume))
+    else:
+        results = PackageManager.all_actions(data=data, logger=logger, batch=batch, concurrency=concurrency,
+                                             prefetch=prefetch, plan=plan, journal=journal, resume=resume)
+    if convergence:
+        convergence.record(results=results)
+    return results
+
+
+def plan(data=None, logger=None):
+    """
+    Dry run: compute what main() would do without installing or removing anything
+
+    Args:
+        data (list(dict)): Data structure. See package_data.py or README for examples.
+        logger (obj): logger instance
+
+    Returns:
+        obj: Plan instance with install, remove and noop actions grouped by package type
     """
 
     if not logger:
-        logger = get_logger(application_name="macos_installer", console=True)
-    PackageManager.all_actions(data=data, logger=logger)
-    return
+        logger = default_logger()
+    return PackageManager.plan(data=data, logger=logger)
+
+
+def report(results=None):
+    """
+    Summarize the outcome of main() for the machine reading it, e.g. a fleet run
+
+    Args:
+        results (str|dict): What main() returned
+
+    Returns:
+        dict: 'status', one of 'converged', 'changed', 'unchanged' or 'failed', 'summary' counts of packages
+        'changed', 'unchanged', 'failed' and 'deferred' (skipped for a dependency or an unavailable backend),
+        and 'packages', one entry per package with its outcome
+    """
+
+    summary = {"changed": 0, "unchanged": 0, "failed": 0, "deferred": 0}
+    if results == CONVERGED:
+        return {"status": CONVERGED, "summary": summary, "packages": []}
+    if results is None:
+        return {"status": "failed", "summary": summary, "packages": [], "error": "dependency cycle"}
+
+    packages = []
+    for installer, result in results.items():
+        if result is True:
+            outcome = "changed"
+        elif result is None:
+            outcome = "deferred"
+        elif installer.is_satisfied():
+            outcome = "unchanged"
+        else:
+            outcome = "failed"
+        summary[outcome] += 1
+        packages.append({"name": installer.name, "package_type": installer.package_info.package_type,
+                         "state": installer.state, "outcome": outcome})
+
+    if summary["failed"] or summary["deferred"]:
+        status = "failed"
+    elif summary["changed"]:
+        status = "changed"
+    else:
+        status = "unchanged"
+    return {"status": status, "summary": summary, "packages": packages}
+
+
+def write_report(data=None, path=None):
+    """
+    Write a JSON report on one line
+
+    Args:
+        data (dict): Report
+        path (str): File to write, '-' for standard output
+
+    Returns:
+        No return value
+    """
+
+    if path == "-":
+        sys.stdout.write(json.dumps(data) + "\n")
+        sys.stdout.flush()
+        return
+    with open(path, 'w') as report_file:
+        json.dump(data, report_file)
+        report_file.write("\n")
+
+
+def default_logger():
+    """
+    Create the console logger used when none is given. standard_logger is imported only here.
+
+    Returns:
+        obj: Logger instance
+    """
+
+    from standard_logger import get_logger
+    return get_logger(application_name="macos_installer", console=True)
+
+
+def parse_args(args=None):
+    """
+    Parse command line arguments
+
+    Args:
+        args list(str): Arguments. Defaults to sys.argv[1:]
+
+    Returns:
+        obj: argparse Namespace
+    """
+
+    parser = argparse.ArgumentParser(prog="macos_installer", description="Install macOS packages")
+    parser.add_argument("--data", help="JSON manifest file, '-' for standard input. "
+                                       "Defaults to packages_data.PACKAGES_DATA")
+    parser.add_argument("--plan", action="store_true", help="Print the planned actions as JSON and exit")
+    parser.add_argument("--batch", action="store_true", help="Batch Homebrew installs and removals")
+    parser.add_argument("--concurrent", action="store_true", help="Run backends concurrently")
+    parser.add_argument("--asyncio", action="store_true", help="Drive all commands from one asyncio event loop")
+    parser.add_argument("--prefetch", type=int, default=None, metavar="N",
+                        help="Download up to N artifacts in the background")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip the actions an interrupted run of the same manifest completed")
+    parser.add_argument("--no-journal", action="store_true",
+                        help="Don't journal the run. It can't be resumed.")
+    parser.add_argument("--force", action="store_true",
+                        help="Check every package even if the last run converged")
+    parser.add_argument("--report", metavar="FILE",
+                        help="Write a JSON report of the run, or with --plan the plan, to FILE ('-' for standard "
+                             "output)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Write a Chrome trace of the run to FILE and print the slowest steps")
+    return parser.parse_args(args)
+
+
+def cli(args=None):
+    """
+    Command line entry point
+
+    Args:
+        args list(str): Arguments. Defaults to sys.argv[1:]
+
+    Returns:
+        int: Exit status, 1 if a package failed or was deferred or the dependencies form a cycle
+    """
+
+    options = parse_args(args)
+    data = None
+    if options.data == "-":
+        data = sys.stdin.read()
+    elif options.data:
+        with open(options.data, 'r') as data_file:
+            data = data_file.read()
+
+    if options.trace:
+        Tracer.enable()
+    try:
+        if options.plan:
+            plan_data = plan(data=data).to_data()
+            if options.report:
+                write_report(data=plan_data, path=options.report)
+            else:
+                json.dump(plan_data, sys.stdout, indent=2)
+                sys.stdout.write("\n")
+            return 0
+
+        results = main(data=data, batch=options.batch, concurrency=options.concurrent or None,
+                       prefetch=options.prefetch, use_asyncio=options.asyncio, journal=not options.no_journal,
+                       resume=options.resume, force=options.force)
+        run_report = report(results=results)
+        if options.report:
+            write_report(data=run_report, path=options.report)
+        return 1 if run_report["status"] == "failed" else 0
+    finally:
+        if options.trace:
+            Tracer.disable()
+            Tracer.export_chrome_trace(path=options.trace)
+            sys.stderr.write(Tracer.summary_table() + "\n")
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(cli())
@@ -1,6 +1,27 @@
+from .. import command
+from ..Tracer import Tracer
+from ..Outdated import Outdated
+from ..InstalledVersions import InstalledVersions
+from ..VersionConstraint import VersionConstraint
+from ..CircuitBreaker import CircuitBreaker
+
+
 class BaseInstaller:
     """ Base class for all \*Installer types"""
 
+    # Command prefixes used to install or remove several packages in one call, e.g. ["brew", "install"].
+    # None if this installer type can't be batched.
+    batch_install_command = None
+    batch_remove_command = None
+    batch_upgrade_command = None
+
+    # Command prefix used to download a package without installing it, e.g. ["brew", "fetch"].
+    # None if this installer type has nothing to prefetch.
+    fetch_command = None
+
+    # True if install and remove commands change the Homebrew installation and so hold the Homebrew lock
+    uses_homebrew = False
+
     def __init__(self,
                  logger=None,
                  package_info=None):
@@ -34,3 +55,628 @@ class BaseInstaller:
             No return value
         """
         self.logger.error("remove not implemented")
+
+    @classmethod
+    def is_enabled(cls, logger=None):
+        """
+        Should packages of this type be handled on this system at all?
+
+        Args:
+            logger (obj): Logger instance
+
+        Returns:
+            bool: True. Override to skip a package type e.g. outside a personal system
+        """
+        return True
+
+    @classmethod
+    def is_valid_package(cls, package_info=None, logger=None):
+        """
+        Are the settings of a package of this type valid? Used by PackageInfo.is_valid for package types
+        registered by plugins.
+
+        Args:
+            package_info (obj): PackageInfo instance
+            logger (obj): Logger instance
+
+        Returns:
+            bool: True if the package has a name. Override to check more e.g. a package_url
+        """
+        return True if package_info.name else False
+
+    def action(self):
+        """
+        The action needed to reach the configured state
+
+        Returns:
+            str: 'install', 'remove', 'upgrade' (install if absent, upgrade if outdated) or None if there is
+            nothing to do for the state
+        """
+        if self.state == "present":
+            return "install"
+        elif self.state == "absent":
+            return "remove"
+        elif self.state == "latest":
+            return "upgrade"
+        else:
+            return None
+
+    def is_satisfied(self):
+        """
+        Is the package in its configured state? Packages that depend on it can start once it is.
+
+        Returns:
+            bool: True if installed and configured present, not installed and configured absent, or
+            installed and up to date and configured latest. An installed package must also have a version
+            that satisfies its version constraint, if any.
+        """
+        action = self.action()
+        if action == "install":
+            return self.is_present() and self.is_version_compliant()
+        elif action == "remove":
+            return not self.is_present()
+        elif action == "upgrade":
+            return self.is_present() and not self.is_outdated() and self.is_version_compliant()
+        return True
+
+    def run(self):
+        """
+        Install or remove this package according to the configured state
+
+        Returns:
+            bool: Result of install(), remove() or upgrade(). None if there is nothing to do for the state.
+        """
+        action = self.action()
+        if action == "install":
+            return self.install()
+        elif action == "remove":
+            return self.remove()
+        elif action == "upgrade":
+            return self.upgrade()
+        else:
+            return None
+
+    @Tracer.traced("upgrade")
+    def upgrade(self):
+        """
+        Bring this package to its newest version: install it if absent, upgrade it if outdated
+
+        Returns:
+            bool: True if installed or upgraded, False if already up to date or the upgrade failed
+        """
+        class_name = type(self).__name__
+        if not self.is_present():
+            return self.install()
+        if not self.is_outdated():
+            self.logger.info("{0}.upgrade {1} is up to date".format(class_name, self.name))
+            return False
+
+        cmd = self.upgrade_command()
+        if cmd is None:
+            self.logger.error("{0}.upgrade not implemented".format(class_name))
+            return False
+        self.logger.info("{0}.upgrading {1}".format(class_name, self.name))
+        results = command.run(cmd=cmd, working_dir=self.command_working_dir(), logger=self.logger,
+                              lock=command.HOMEBREW_LOCK if self.uses_homebrew else None,
+                              backend=self.package_info.package_type)
+        if results.success:
+            self.record_upgraded()
+            self.logger.info("{0}.upgrade {1} succeeded".format(class_name, self.name))
+            return True
+        self.logger.error("{0}.upgrade {1} failed status {2} results {3} errors {4}".format(
+            class_name, self.name, results.status_code, results.results, results.errors))
+        return False
+
+    def upgrade_command(self):
+        """
+        Get the command that upgrades this package
+
+        Returns:
+            list(str): Command or None if this installer type can't upgrade
+        """
+        if self.batch_upgrade_command is None:
+            return None
+        return self.batch_upgrade_command + [self.batch_argument()]
+
+    def batch_argument(self):
+        """
+        Get what names this package in a batch command
+
+        Returns:
+            str: Package name
+        """
+        return self.name
+
+    def install_command(self):
+        """
+        Get the command that installs this package
+
+        Returns:
+            list(str): Command or None if not implemented
+        """
+        return None
+
+    def remove_command(self):
+        """
+        Get the command that removes this package
+
+        Returns:
+            list(str): Command or None if not implemented
+        """
+        return None
+
+    def command_working_dir(self):
+        """
+        Get the directory install and remove commands run in
+
+        Returns:
+            str: Directory or None for the current directory
+        """
+        return None
+
+    def presence_key(self):
+        """
+        Get what identifies this package in its inventory
+
+        Returns:
+            tuple(str): name, mas_id
+        """
+        return self.name, self.package_info.mas_id
+
+    @Tracer.traced("is_present")
+    async def is_present_async(self, runner=None):
+        """
+        Is package present? Any listing needed runs on the event loop.
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            bool: True if installed, False otherwise
+        """
+        inventory = self.inventory()
+        if inventory is None:
+            return self.is_present()
+        name, mas_id = self.presence_key()
+        return await inventory.contains_async(runner=runner, name=name, mas_id=mas_id)
+
+    @Tracer.traced("install")
+    async def install_async(self, runner=None):
+        """
+        Install this package on the event loop
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            bool: True if installation occurred, False if package already installed or installation failed
+        """
+        class_name = type(self).__name__
+        cmd = self.install_command()
+        if cmd is None:
+            self.logger.error("{0}.install_async not implemented".format(class_name))
+            return False
+        if await self.is_present_async(runner=runner):
+            self.logger.info("{0}.install {1} is already installed".format(class_name, self.name))
+            return False
+
+        self.logger.info("{0}.installing {1}".format(class_name, self.name))
+        results = await runner.run(cmd=cmd, backend=self.package_info.package_type,
+                                   working_dir=self.command_working_dir(), homebrew_lock=self.uses_homebrew)
+        if results.success:
+            self.record_installed()
+            self.logger.info("{0}.install {1} succeeded".format(class_name, self.name))
+            return True
+        self.logger.error("{0}.install {1} failed status {2} results {3} errors {4}".format(
+            class_name, self.name, results.status_code, results.results, results.errors))
+        return False
+
+    @Tracer.traced("remove")
+    async def remove_async(self, runner=None):
+        """
+        Remove this package on the event loop
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            bool: True if removal succeeded, False if package not installed or removal failed
+        """
+        class_name = type(self).__name__
+        cmd = self.remove_command()
+        if cmd is None:
+            self.logger.error("{0}.remove_async not implemented".format(class_name))
+            return False
+        if not await self.is_present_async(runner=runner):
+            self.logger.info("{0}.remove {1} is not installed".format(class_name, self.name))
+            return False
+
+        results = await runner.run(cmd=cmd, backend=self.package_info.package_type,
+                                   working_dir=self.command_working_dir(), homebrew_lock=self.uses_homebrew)
+        if results.success:
+            self.record_removed()
+            self.logger.info("{0}.remove {1} removal succeeded".format(class_name, self.name))
+            return True
+        self.logger.error("{0}.remove {1} failed status {2} results {3} errors {4}".format(
+            class_name, self.name, results.status_code, results.results, results.errors))
+        return False
+
+    async def run_async(self, runner=None):
+        """
+        Install or remove this package according to the configured state, on the event loop
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            bool: Result of install_async(), remove_async() or upgrade_async(). None if there is nothing to do
+            for the state.
+        """
+        action = self.action()
+        if action == "install":
+            return await self.install_async(runner=runner)
+        elif action == "remove":
+            return await self.remove_async(runner=runner)
+        elif action == "upgrade":
+            return await self.upgrade_async(runner=runner)
+        else:
+            return None
+
+    @Tracer.traced("upgrade")
+    async def upgrade_async(self, runner=None):
+        """
+        Bring this package to its newest version on the event loop: install it if absent, upgrade it if outdated
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            bool: True if installed or upgraded, False if already up to date or the upgrade failed
+        """
+        class_name = type(self).__name__
+        if not await self.is_present_async(runner=runner):
+            return await self.install_async(runner=runner)
+        if not await self.is_outdated_async(runner=runner):
+            self.logger.info("{0}.upgrade {1} is up to date".format(class_name, self.name))
+            return False
+
+        cmd = self.upgrade_command()
+        if cmd is None:
+            self.logger.error("{0}.upgrade_async not implemented".format(class_name))
+            return False
+        self.logger.info("{0}.upgrading {1}".format(class_name, self.name))
+        results = await runner.run(cmd=cmd, backend=self.package_info.package_type,
+                                   working_dir=self.command_working_dir(), homebrew_lock=self.uses_homebrew)
+        if results.success:
+            self.record_upgraded()
+            self.logger.info("{0}.upgrade {1} succeeded".format(class_name, self.name))
+            return True
+        self.logger.error("{0}.upgrade {1} failed status {2} results {3} errors {4}".format(
+            class_name, self.name, results.status_code, results.results, results.errors))
+        return False
+
+    def needs_fetch(self):
+        """
+        Is there an artifact to download before install() runs?
+
+        Returns:
+            bool: True if the package is to be installed and can be prefetched
+        """
+        return self.fetch_command is not None and self.action() == "install" and not self.is_present()
+
+    def fetch(self):
+        """
+        Download this package's artifact without installing it, so that install() doesn't wait on the network.
+        Takes no Homebrew lock: fetching only writes to the download cache.
+
+        Returns:
+            bool: True if the artifact was downloaded or there is nothing to fetch, False otherwise
+        """
+        if not self.needs_fetch():
+            return True
+        cmd = self.fetch_command + [self.name]
+        results = command.run(cmd=cmd, logger=self.logger, backend=self.package_info.package_type)
+        if not results.success:
+            # Not fatal: install() downloads the artifact itself
+            self.logger.warning("{0}.fetch {1} failed status {2} results {3} errors {4}".format(
+                type(self).__name__, self.name, results.status_code, results.results, results.errors))
+        return results.success
+
+    def inventory(self):
+        """
+        Get the shared snapshot of installed packages for this installer type
+
+        Returns:
+            obj: Inventory instance or None if this installer type isn't inventoried
+        """
+        return None
+
+    def outdated(self):
+        """
+        Get the shared snapshot of outdated packages for this installer type
+
+        Returns:
+            obj: Outdated instance or None if this installer type can't tell which packages are outdated
+        """
+        return Outdated.get(logger=self.logger, backend=self.package_info.package_type)
+
+    def is_outdated(self):
+        """
+        Does this package have a newer version? Answered from one query per backend per run.
+
+        Returns:
+            bool: True if outdated, False if up to date or this installer type can't tell
+        """
+        outdated = self.outdated()
+        if outdated is None:
+            return False
+        name, mas_id = self.presence_key()
+        return outdated.contains(backend=self.package_info.package_type, name=name, mas_id=mas_id)
+
+    async def is_outdated_async(self, runner=None):
+        """
+        Does this package have a newer version? Any query needed runs on the event loop.
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            bool: True if outdated, False if up to date or this installer type can't tell
+        """
+        outdated = self.outdated()
+        if outdated is None:
+            return False
+        name, mas_id = self.presence_key()
+        return await outdated.contains_async(runner=runner, backend=self.package_info.package_type, name=name,
+                                             mas_id=mas_id)
+
+    def installed_versions(self):
+        """
+        Get the shared index of installed versions for this installer type
+
+        Returns:
+            obj: InstalledVersions instance or None if this installer type isn't indexed
+        """
+        return InstalledVersions.get(logger=self.logger, backend=self.package_info.package_type)
+
+    def version_constraint(self):
+        """
+        Get the version this package must have when installed
+
+        Returns:
+            obj: VersionConstraint instance or None if any version will do
+        """
+        if self.package_info.version is None:
+            return None
+        return VersionConstraint.parse(self.package_info.version)
+
+    def is_version_compliant(self):
+        """
+        Does the installed version satisfy the version constraint? Answered from one query per run.
+
+        Returns:
+            bool: True if any installed version satisfies it or there is no constraint
+        """
+        constraint = self.version_constraint()
+        installed_versions = self.installed_versions()
+        if constraint is None or installed_versions is None:
+            return True
+        versions = installed_versions.versions(backend=self.package_info.package_type, name=self.name)
+        return any(constraint.matches(version) for version in versions)
+
+    async def is_version_compliant_async(self, runner=None):
+        """
+        Does the installed version satisfy the version constraint? Any query needed runs on the event loop.
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            bool: True if any installed version satisfies it or there is no constraint
+        """
+        constraint = self.version_constraint()
+        installed_versions = self.installed_versions()
+        if constraint is None or installed_versions is None:
+            return True
+        versions = await installed_versions.versions_async(runner=runner, backend=self.package_info.package_type,
+                                                           name=self.name)
+        return any(constraint.matches(version) for version in versions)
+
+    def record_version_changed(self):
+        """
+        Record that the installed version changed, so that it is looked up again when next needed
+
+        Returns:
+            No return value
+        """
+        installed_versions = self.installed_versions()
+        if installed_versions is not None and self.package_info.version is not None:
+            installed_versions.discard(backend=self.package_info.package_type, name=self.name)
+
+    def record_upgraded(self):
+        """
+        Record a successful upgrade in the outdated snapshot
+
+        Returns:
+            No return value
+        """
+        outdated = self.outdated()
+        if outdated is not None:
+            name, mas_id = self.presence_key()
+            outdated.discard(backend=self.package_info.package_type, name=name, mas_id=mas_id)
+        self.record_version_changed()
+
+    def record_installed(self):
+        """
+        Record a successful installation in the inventory
+
+        Returns:
+            No return value
+        """
+        inventory = self.inventory()
+        if inventory:
+            name, mas_id = self.presence_key()
+            inventory.add(name=name, mas_id=mas_id)
+        self.record_version_changed()
+
+    def record_removed(self):
+        """
+        Record a successful removal in the inventory
+
+        Returns:
+            No return value
+        """
+        inventory = self.inventory()
+        if inventory:
+            name, mas_id = self.presence_key()
+            inventory.discard(name=name, mas_id=mas_id)
+
+    def can_plan(self):
+        """
+        Can this package's state be checked without changing anything? See Plan.build
+
+        Returns:
+            bool: True unless the installer lacks what it needs to tell e.g. a cask definition
+        """
+        return True
+
+    @classmethod
+    def can_batch(cls, action):
+        """
+        Can several packages of this type be handled in one command?
+
+        Args:
+            action (str): 'install', 'remove' or 'upgrade'
+
+        Returns:
+            bool: True if a batch command exists for the action
+        """
+        return cls.batch_command(action) is not None
+
+    @classmethod
+    def batch_command(cls, action):
+        """
+        Get the batch command prefix for an action
+
+        Args:
+            action (str): 'install', 'remove' or 'upgrade'
+
+        Returns:
+            list(str): Command prefix or None
+        """
+        if action == "install":
+            return cls.batch_install_command
+        elif action == "remove":
+            return cls.batch_remove_command
+        elif action == "upgrade":
+            return cls.batch_upgrade_command
+        else:
+            return None
+
+    @classmethod
+    def run_batch(cls, logger=None, installers=None, action=None):
+        """
+        Install, remove or upgrade several packages of this type with as few commands as possible.
+
+        Packages already in the requested state are skipped. Packages to upgrade that aren't installed
+        are installed in one batch of their own. If the batch command fails the batch is split in half
+        and each half retried until the failing packages are found, unless the backend's circuit opened.
+
+        Args:
+            logger (obj): Logger instance
+            installers list(obj): Installer instances of this type
+            action (str): 'install', 'remove' or 'upgrade'
+
+        Returns:
+            dict: installer -> bool, the same result install(), remove() or upgrade() would have returned
+        """
+        results = {}
+        pending = []
+        absent = []
+        for installer in installers:
+            present = installer.is_present()
+            if action == "install" and present:
+                logger.info("{0}.install {1} is already installed".format(cls.__name__, installer.name))
+                results[installer] = False
+            elif action == "remove" and not present:
+                logger.info("{0}.remove {1} is not installed".format(cls.__name__, installer.name))
+                results[installer] = False
+            elif action == "upgrade" and not present:
+                absent.append(installer)
+            elif action == "upgrade" and not installer.is_outdated():
+                logger.info("{0}.upgrade {1} is up to date".format(cls.__name__, installer.name))
+                results[installer] = False
+            else:
+                pending.append(installer)
+
+        if absent:
+            if cls.can_batch("install"):
+                cls.bisect_batch(logger=logger, installers=absent, action="install", results=results)
+            else:
+                for installer in absent:
+                    results[installer] = installer.install()
+        cls.bisect_batch(logger=logger, installers=pending, action=action, results=results)
+        return results
+
+    @classmethod
+    def bisect_batch(cls, logger=None, installers=None, action=None, results=None):
+        """
+        Run one batch command, splitting and retrying the batch on failure
+
+        Args:
+            logger (obj): Logger instance
+            installers list(obj): Installer instances still to be processed
+            action (str): 'install', 'remove' or 'upgrade'
+            results (dict): installer -> bool. Updated in place.
+
+        Returns:
+            No return value
+        """
+        if not installers:
+            return
+
+        names = [installer.name for installer in installers]
+        logger.info("{0}.{1} batch {2}".format(cls.__name__, action, ", ".join(names)))
+        cmd = cls.batch_command(action) + [installer.batch_argument() for installer in installers]
+        cmd_results = command.run(cmd=cmd, logger=logger, lock=command.HOMEBREW_LOCK if cls.uses_homebrew else None,
+                                  backend=installers[0].package_info.package_type)
+        if cmd_results.success:
+            for installer in installers:
+                if action == "install":
+                    installer.record_installed()
+                elif action == "upgrade":
+                    installer.record_upgraded()
+                else:
+                    installer.record_removed()
+                logger.info("{0}.{1} {2} succeeded".format(cls.__name__, action, installer.name))
+                results[installer] = True
+            return
+
+        if CircuitBreaker.is_open(installers[0].package_info.package_type):
+            # The backend is down: splitting the batch can't find a failing package
+            for installer in installers:
+                results[installer] = False
+            return
+
+        if len(installers) == 1:
+            logger.error("{0}.{1} {2} failed status {3} results {4} errors {5}".format(
+                cls.__name__, action, installers[0].name,
+                cmd_results.status_code, cmd_results.results, cmd_results.errors))
+            results[installers[0]] = False
+            return
+
+        # A failed batch may still have completed some of its packages, so relist once before retrying
+        snapshot = installers[0].outdated() if action == "upgrade" else installers[0].inventory()
+        if snapshot:
+            snapshot.load()
+        remaining = []
+        for installer in installers:
+            if installer.is_satisfied():
+                logger.info("{0}.{1} {2} succeeded".format(cls.__name__, action, installer.name))
+                results[installer] = True
+            else:
+                remaining.append(installer)
+
+        middle = len(remaining) // 2
+        cls.bisect_batch(logger=logger, installers=remaining[:middle], action=action, results=results)
+        cls.bisect_batch(logger=logger, installers=remaining[middle:], action=action, results=results)
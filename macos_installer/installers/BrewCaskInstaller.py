@@ -1,10 +1,18 @@
-from run_command import run_command
+from .. import command
 from .BaseInstaller import BaseInstaller
+from ..Tracer import Tracer
+from ..Inventory import Inventory
 
 
 class BrewCaskInstaller(BaseInstaller):
     """ Installer for a Homebrew Caskpackage"""
 
+    batch_install_command = ["brew", "cask", "install"]
+    batch_remove_command = ["brew", "cask", "uninstall"]
+    batch_upgrade_command = ["brew", "cask", "upgrade"]
+    fetch_command = ["brew", "cask", "fetch"]
+    uses_homebrew = True
+
     def __init__(self,
                  logger=None,
                  package_info=None):
@@ -17,6 +25,25 @@ class BrewCaskInstaller(BaseInstaller):
         """
         super(BrewCaskInstaller, self).__init__(logger=logger, package_info=package_info)
 
+    def install_command(self):
+        """
+        Get the command that installs this package
+
+        Returns:
+            list(str): Command
+        """
+        return self.batch_install_command + [self.package_info.name]
+
+    def remove_command(self):
+        """
+        Get the command that removes this package
+
+        Returns:
+            list(str): Command
+        """
+        return self.batch_remove_command + [self.package_info.name]
+
+    @Tracer.traced("install")
     def install(self):
         """
         Install a Homebrew Cask package
@@ -35,20 +62,19 @@ class BrewCaskInstaller(BaseInstaller):
             return False
         else:
             self.logger.info("BrewCaskInstaller.installing {0}".format(self.package_info.name))
-            cmd = ["brew", "cask", "install", self.package_info.name]
-            results = run_command(cmd=cmd, logger=self.logger)
+            cmd = self.install_command()
+            results = command.run(cmd=cmd, logger=self.logger, lock=command.HOMEBREW_LOCK,
+                                  backend=self.package_info.package_type)
             if results.success:
-                if self.is_present:
-                    self.logger.info("BrewCaskInstaller.install {0} succeeded".format(self.package_info.name))
-                    return True
-                else:
-                    self.logger.warning("BrewCaskInstaller.install {0} failed".format(self.package_info.name))
-                    return False
+                self.record_installed()
+                self.logger.info("BrewCaskInstaller.install {0} succeeded".format(self.package_info.name))
+                return True
             else:
                 self.logger.error("BrewCaskInstaller.install {0} failed status {1} results {2} errors {3}".format(
                     self.package_info.name, results.status_code, results.results, results.errors))
                 return False
 
+    @Tracer.traced("remove")
     def remove(self):
         """
         Remove a Homebrew Cask package
@@ -59,15 +85,13 @@ class BrewCaskInstaller(BaseInstaller):
             False if package not installed or removal failed.
         """
         if self.is_present():
-            cmd = ["brew", "cask", "uninstall", self.package_info.name]
-            results = run_command(cmd=cmd, logger=self.logger)
+            cmd = self.remove_command()
+            results = command.run(cmd=cmd, logger=self.logger, lock=command.HOMEBREW_LOCK,
+                                  backend=self.package_info.package_type)
             if results.success:
-                if self.is_present():
-                    self.logger.warning("BrewCaskInstaller.remove {0} removal failed".format(self.package_info.name))
-                    return False
-                else:
-                    self.logger.info("BrewCaskInstaller.remove {0} removal succeeded".format(self.package_info.name))
-                    return True
+                self.record_removed()
+                self.logger.info("BrewCaskInstaller.remove {0} removal succeeded".format(self.package_info.name))
+                return True
             else:
                 self.logger.error("BrewCaskInstaller.remove {0} failed status {1} results {2} errors {3}".format(
                     self.package_info.name, results.status_code, results.results, results.errors))
@@ -76,6 +100,7 @@ class BrewCaskInstaller(BaseInstaller):
             self.logger.info("BrewCaskInstaller.remove {0} is not installed".format(self.package_info.name))
             return False
 
+    @Tracer.traced("is_present")
     def is_present(self):
         """
         Is package present
@@ -85,13 +110,13 @@ class BrewCaskInstaller(BaseInstaller):
             True if installed
             False Otherwise
         """
-        cmd = ["brew", "cask", "list"]
-        results = run_command(cmd=cmd, logger=self.logger)
-        if results.success:
-            results = results.results.split("\n")
-            if self.package_info.name in results:
-                return True
-            else:
-                return False
-        else:
-            return False
+        return self.inventory().contains(name=self.package_info.name)
+
+    def inventory(self):
+        """
+        Get the shared snapshot of installed Homebrew Cask packages
+
+        Returns:
+            obj: Inventory instance
+        """
+        return Inventory.get(logger=self.logger, backend='brewcask')
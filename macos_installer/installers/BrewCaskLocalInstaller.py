@@ -1,21 +1,38 @@
-import sys
+import asyncio
 import os
 from os import path
 import glob
 
-from run_command import run_command
+from .. import command
+from .. import paths
+from .. import privileged
 from .BaseInstaller import BaseInstaller
-
-STARTUP_DIR = "{0}/.startup".format(os.environ['HOME'])
+from ..Tracer import Tracer
+from ..CaskDefinition import CaskDefinition
+from ..CaskRepo import CaskRepo
+from ..Inventory import Inventory
+from ..FilesystemProbe import FilesystemProbe
+from ..PrivilegedHelper import PrivilegedHelper
 
 LOCAL_CASK_REPO_NAME = "private_casks"
-LOCAL_CASK_REPO_DIR = "{0}/{1}".format(STARTUP_DIR,LOCAL_CASK_REPO_NAME)
 LOCAL_CASK_REPO_URL = "git@github.com:tflynn/{0}.git".format(LOCAL_CASK_REPO_NAME)
 
 
+def local_cask_repo_dir():
+    """
+    Get the checkout of the local cask definitions repo. Resolved on every call, never at import time.
+
+    Returns:
+        str: Directory
+    """
+    return os.path.join(paths.startup_dir(), LOCAL_CASK_REPO_NAME)
+
+
 class BrewCaskLocalInstaller(BaseInstaller):
     """ Installer for a Homebrew CaskLocal package"""
 
+    uses_homebrew = True
+
     def __init__(self,
                  logger=None,
                  package_info=None):
@@ -28,37 +45,56 @@ class BrewCaskLocalInstaller(BaseInstaller):
         """
         super(BrewCaskLocalInstaller, self).__init__(logger=logger, package_info=package_info)
 
+    @classmethod
+    def is_enabled(cls, logger=None):
+        """
+        Local casks are only installed on a personal system
+
+        Args:
+            logger (obj): Logger instance
+
+        Returns:
+            bool: True if paths.personal_bootstrap() exists
+        """
+        return os.path.exists(paths.personal_bootstrap())
+
     def ensure_local_cask_repo_present(self):
         """
-        Ensure that the repo contain the local cask definitions is present
+        Ensure that the repo contain the local cask definitions is present and up to date.
+        The repo is synced at most once per run and the result shared by all installers.
 
         Returns:
-            No return
-            
-            Will exit if an error occurs during repo cloning.
+            bool: True if the repo is present and up to date, False otherwise
 
         """
-        if not path.exists(LOCAL_CASK_REPO_DIR):
-            # git clone git@github.com:tflynn/private_casks.git
-            cmd = ['git', 'clone', LOCAL_CASK_REPO_URL]
-            results = run_command(cmd=cmd, working_dir=STARTUP_DIR, logger=self.logger)
-            if not results.success:
-                self.logger.error(("BrewCaskLocalInstaller error cloning cask definitions repo"
-                                    + " status {0} results {1} errors {2}").format(
-                                    results.status_code, results.results, results.errors))
-                sys.exit(1)
+        repo = CaskRepo.get(logger=self.logger, url=LOCAL_CASK_REPO_URL, repo_dir=local_cask_repo_dir())
+        return repo.ensure_synced()
 
-        else:
-            # git pull
-            cmd = ['git', 'pull']
-            results = run_command(cmd=cmd, working_dir=LOCAL_CASK_REPO_DIR, logger=self.logger)
-            if not results.success:
-                self.logger.error(("BrewCaskLocalInstaller error updating cask definitions repo"
-                                    + " status {0} results {1} errors {2}").format(
-                                    results.status_code, results.results, results.errors))
-                sys.exit(1)
+    def cask_definition(self):
+        """
+        Get the parsed cask definition from the checkout as it is: never synced here, so that planning and
+        presence checks run no git command. install() and remove() sync first. The file is parsed again only
+        if it changed.
 
-        return
+        Returns:
+            obj: CaskDefinition instance or None if the cask can't be read
+        """
+        local_cask_qname_file = "{0}/casks/{1}.rb".format(local_cask_repo_dir(), self.package_info.name)
+        try:
+            return CaskDefinition.load(path=local_cask_qname_file)
+        except OSError as e:
+            self.logger.error("BrewCaskLocalInstaller {0}: can't read cask {1}: {2}".format(
+                self.package_info.name, local_cask_qname_file, e))
+            return None
+
+    def can_plan(self):
+        """
+        Can this package's state be checked? Only if its cask can be read from the checkout.
+
+        Returns:
+            bool: True if the cask definition names an application
+        """
+        return self.get_cask_info() is not None
 
     def get_cask_info(self):
         """
@@ -68,27 +104,21 @@ class BrewCaskLocalInstaller(BaseInstaller):
             tuple(str): 
 
             cask name, directory containing cask, qualified cask name, application name
-            
-            Will exit if application name cannot be determined
-
-        """
-        # TODO This needs improvement
-        local_cask_name = self.package_info.name + ".rb"
-        local_cask_dir = "{0}/casks".format(LOCAL_CASK_REPO_DIR)
-        local_cask_qname_file = "{0}/{1}".format(local_cask_dir, local_cask_name)
-        app_name = None
-        with open(local_cask_qname_file, 'r') as cask_def:
-            for cask_def_line in cask_def.readlines():
-                cleaned_cask_def_line = cask_def_line.strip().replace("\n", '')
-                # print('z' + cleaned_cask_def_line + 'z')
-                if cleaned_cask_def_line.startswith('app'):
-                    # print('x' + cleaned_cask_def_line[4:] + 'x')
-                    app_name = cleaned_cask_def_line[4:].strip()[1:-1]
-                    # print(app_name)
+
+            None if the cask definition can't be read or names no application
+
+        """
+        definition = self.cask_definition()
+        if definition is None:
+            return None
+        local_cask_qname_file = definition.path
+        local_cask_dir, local_cask_name = path.split(local_cask_qname_file)
+        app_name = definition.app
 
         if not app_name:
-            self.logger.error("BrewCaskLocalInstaller can't determine application name from cask")
-            sys.exit(1)
+            self.logger.error("BrewCaskLocalInstaller {0}: can't determine application name from cask {1}".format(
+                self.package_info.name, local_cask_qname_file))
+            return None
 
         return local_cask_name, local_cask_dir, local_cask_qname_file, app_name
 
@@ -107,25 +137,166 @@ class BrewCaskLocalInstaller(BaseInstaller):
             False: If any errors during unzip processing
 
         """
-        tmp_dir = os.environ['MY_TEMP']
+        operation = self.receipts_operation(app_name)
+        if operation:
+            try:
+                # Reinstalls usually find the receipts in place: then the helper isn't needed at all
+                if privileged.is_extracted(operation["archive"], operation["target"]):
+                    self.logger.info("BrewCaskLocalInstaller receipts of {0} are up to date".format(app_name))
+                    return True
+            except (OSError, ValueError):
+                pass
+            results = PrivilegedHelper.get(logger=self.logger).run(operations=[operation])
+            return self.check_receipts_results(results[0])
+
+        return True
 
-        # Extract receipts zip and unpack to /private/var/db/receipts
-        possible_zips = glob.glob("/Applications/{0}/*-receipts.zip".format(app_name), recursive=False)
+    def receipts_operation(self, app_name):
+        """
+        Get the privileged operation that unpacks the receipts zip of the installed App
+
+        Args:
+            app_name: Name of app to search for receipts zip
+
+        Returns:
+            dict: PrivilegedHelper operation or None if the App has no receipts zip
+        """
+
+        # Extract receipts zip and unpack to paths.receipts_dir() e.g. /private/var/db/receipts
+        app_dir = os.path.join((Inventory.probe or FilesystemProbe()).applications_dir, app_name)
+        possible_zips = glob.glob(os.path.join(glob.escape(app_dir), "*-receipts.zip"), recursive=False)
         if possible_zips:
             receipts_zip_file = possible_zips[0]
-            full_target_dir = '/private/var/db/receipts'
-            # "sudo unzip <zip file name> -d dir"
-            cmd = ['sudo', 'unzip', receipts_zip_file, '-d', full_target_dir]
-            results = run_command(cmd=cmd, logger=self.logger)
-            if not results.success:
-                if results.results:
-                    self.logger.info("unzip receipts results {0}".format(results.results))
-                if results.errors:
-                    self.logger.info("unzip receipts errors {0}".format(results.errors))
-                return False
+            return {"op": "extract", "archive": receipts_zip_file, "target": paths.receipts_dir()}
+        return None
+
+    def check_receipts_results(self, result):
+        """
+        Log the outcome of unpacking receipts
+
+        Args:
+            result (dict): PrivilegedHelper result
 
+        Returns:
+            bool: True if unpacking succeeded, False otherwise
+        """
+
+        if not result.get("ok"):
+            self.logger.info("unzip receipts errors {0}".format(result.get("error")))
+            return False
+        self.logger.info("unzip receipts: {0} files extracted, {1} unchanged".format(
+            result.get("extracted"), result.get("skipped")))
         return True
 
+    def install_command(self):
+        """
+        Get the command that installs this package. Runs in command_working_dir().
+
+        Returns:
+            list(str): Command or None if the cask definition can't be read
+        """
+        cask_info = self.get_cask_info()
+        if cask_info is None:
+            return None
+        local_cask_name, local_cask_dir, local_cask_qname_file, app_name = cask_info
+        brew_command = "install" if self.package_info.force == "false" else "reinstall"
+        return ["brew", "cask", brew_command, local_cask_name]
+
+    def remove_command(self):
+        """
+        Get the command that removes this package
+
+        Returns:
+            list(str): Command
+        """
+        return ["brew", "cask", "uninstall", self.package_info.name]
+
+    def command_working_dir(self):
+        """
+        Get the directory install and remove commands run in: the directory containing the cask
+
+        Returns:
+            str: Directory or None if the cask definition can't be read
+        """
+        cask_info = self.get_cask_info()
+        return cask_info[1] if cask_info else None
+
+    def presence_key(self):
+        """
+        Get what identifies this package in its inventory: the application name
+
+        Returns:
+            tuple(str): application name, None. None, None if the cask definition can't be read
+        """
+        cask_info = self.get_cask_info()
+        return (cask_info[3] if cask_info else None), None
+
+    @Tracer.traced("install")
+    async def install_async(self, runner=None):
+        """
+        Install a Homebrew CaskLocal package on the event loop
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            bool: True if installation occurred, False if package already installed or installation failed
+        """
+        # Synced at most once per run, shared with all other installers
+        synced = await asyncio.get_running_loop().run_in_executor(None, self.ensure_local_cask_repo_present)
+        if not synced:
+            self.logger.error("BrewCaskLocalInstaller.install {0} failed: cask definitions repo unavailable".format(
+                self.package_info.name))
+            return False
+
+        if await self.is_present_async(runner=runner) and self.package_info.force == "false":
+            self.logger.info("BrewCaskLocalInstaller.install {0} is already installed".format(self.package_info.name))
+            return False
+
+        cask_info = self.get_cask_info()
+        if cask_info is None:
+            return False
+        local_cask_name, local_cask_dir, local_cask_qname_file, app_name = cask_info
+        self.logger.info("BrewCaskLocalInstaller.installing {0}".format(self.package_info.name))
+        results = await runner.run(cmd=self.install_command(), backend=self.package_info.package_type,
+                                   working_dir=local_cask_dir, homebrew_lock=True)
+        if not results.success:
+            self.logger.error("BrewCaskLocalInstaller.install {0} failed status {1} results {2} errors {3}".format(
+                self.package_info.name, results.status_code, results.results, results.errors))
+            return False
+
+        self.inventory().load()
+        if not self.is_present():
+            self.logger.warning("BrewCaskLocalInstaller.install {0} failed: {1} not found".format(
+                self.package_info.name, app_name))
+            return False
+
+        processed = await asyncio.get_running_loop().run_in_executor(None, self.process_receipt_info, app_name)
+        if not processed:
+            self.logger.error("BrewCaskLocalInstaller.install {0} failed".format(self.package_info.name))
+            return False
+        self.logger.info("BrewCaskLocalInstaller.install {0} succeeded".format(self.package_info.name))
+        return True
+
+    @Tracer.traced("remove")
+    async def remove_async(self, runner=None):
+        """
+        Remove a Homebrew CaskLocal package on the event loop
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            bool: True if removal succeeded, False if package not installed or removal failed
+        """
+        synced = await asyncio.get_running_loop().run_in_executor(None, self.ensure_local_cask_repo_present)
+        if not synced:
+            self.logger.error("BrewCaskLocalInstaller.remove {0} failed: cask definitions repo unavailable".format(
+                self.package_info.name))
+            return False
+        return await super(BrewCaskLocalInstaller, self).remove_async(runner=runner)
+
+    @Tracer.traced("install")
     def install(self):
         """
         Install a Homebrew CaskLocal package
@@ -138,24 +309,29 @@ class BrewCaskLocalInstaller(BaseInstaller):
             False if package already installed or installation failed
 
         """
-        self.ensure_local_cask_repo_present()
+        if not self.ensure_local_cask_repo_present():
+            self.logger.error("BrewCaskLocalInstaller.install {0} failed: cask definitions repo unavailable".format(
+                self.package_info.name))
+            return False
 
         if self.is_present() and self.package_info.force == "false":
             self.logger.info("BrewCaskLocalInstaller.install {0} is already installed".format(self.package_info.name))
             return False
         else:
-            local_cask_name, local_cask_dir, local_cask_qname_file, app_name = self.get_cask_info()
+            cask_info = self.get_cask_info()
+            if cask_info is None:
+                return False
+            local_cask_name, local_cask_dir, local_cask_qname_file, app_name = cask_info
 
             self.logger.info("BrewCaskLocalInstaller.installing {0}".format(self.package_info.name))
 
-            start_dir = os.getcwd()
-            os.chdir(local_cask_dir)
-            brew_command = "install" if self.package_info.force == "false" else "reinstall"
-            cmd = ["brew", "cask", brew_command, local_cask_name]
-            results = run_command(cmd=cmd, logger=self.logger)
-            os.chdir(start_dir)
+            cmd = self.install_command()
+            results = command.run(cmd=cmd, working_dir=local_cask_dir, logger=self.logger,
+                                  lock=command.HOMEBREW_LOCK, backend=self.package_info.package_type)
 
             if results.success:
+                # Rescan the applications directory once to confirm
+                self.inventory().load()
                 if self.is_present():
                     status = self.process_receipt_info(app_name)
                     if status:
@@ -164,11 +340,16 @@ class BrewCaskLocalInstaller(BaseInstaller):
                     else:
                         self.logger.error("BrewCaskLocalInstaller.install {0} failed".format(self.package_info.name))
                         return False
+                else:
+                    self.logger.warning("BrewCaskLocalInstaller.install {0} failed: {1} not found".format(
+                        self.package_info.name, app_name))
+                    return False
             else:
                 self.logger.error("BrewCaskLocalInstaller.install {0} failed status {1} results {2} errors {3}".format(
                     self.package_info.name, results.status_code, results.results, results.errors))
                 return False
 
+    @Tracer.traced("remove")
     def remove(self):
         """
         Remove a Homebrew CaskLocal package
@@ -181,12 +362,17 @@ class BrewCaskLocalInstaller(BaseInstaller):
             False if package not installed or removal failed.
 
         """
-        self.ensure_local_cask_repo_present()
+        if not self.ensure_local_cask_repo_present():
+            self.logger.error("BrewCaskLocalInstaller.remove {0} failed: cask definitions repo unavailable".format(
+                self.package_info.name))
+            return False
 
         if self.is_present():
-            cmd = ["brew", "cask", "uninstall", self.package_info.name]
-            results = run_command(cmd=cmd, logger=self.logger)
+            cmd = self.remove_command()
+            results = command.run(cmd=cmd, logger=self.logger, lock=command.HOMEBREW_LOCK,
+                                  backend=self.package_info.package_type)
             if results.success:
+                self.inventory().load()
                 if not self.is_present():
                     self.logger.info("BrewCaskLocalInstaller.remove {0} removal succeeded".format(
                         self.package_info.name))
@@ -203,6 +389,7 @@ class BrewCaskLocalInstaller(BaseInstaller):
             self.logger.info("BrewCaskLocalInstaller.remove {0} is not installed".format(self.package_info.name))
             return False
 
+    @Tracer.traced("is_present")
     def is_present(self):
         """
         Is package present
@@ -212,10 +399,21 @@ class BrewCaskLocalInstaller(BaseInstaller):
 
             True if installed
 
-            False Otherwise
+            False Otherwise, or if the cask definition can't be read
             
         """
         # Check to see whether the app is present (and therefore installed) in /Applications
-        local_cask_name, local_cask_dir, local_cask_qname_file, app_name = self.get_cask_info()
-        app_exists = path.exists("/Applications/{0}".format(app_name))
-        return app_exists
+        cask_info = self.get_cask_info()
+        if cask_info is None:
+            return False
+        local_cask_name, local_cask_dir, local_cask_qname_file, app_name = cask_info
+        return self.inventory().contains(name=app_name)
+
+    def inventory(self):
+        """
+        Get the shared snapshot of installed applications
+
+        Returns:
+            obj: Inventory instance
+        """
+        return Inventory.get(logger=self.logger, backend='brewcasklocal')
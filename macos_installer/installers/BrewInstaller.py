@@ -1,10 +1,18 @@
-from run_command import run_command
+from .. import command
 from .BaseInstaller import BaseInstaller
+from ..Tracer import Tracer
+from ..Inventory import Inventory
 
 
 class BrewInstaller(BaseInstaller):
     """ Installer for a Homebrew package"""
 
+    batch_install_command = ["brew", "install"]
+    batch_remove_command = ["brew", "uninstall"]
+    batch_upgrade_command = ["brew", "upgrade"]
+    fetch_command = ["brew", "fetch"]
+    uses_homebrew = True
+
     def __init__(self,
                  logger=None,
                  package_info=None):
@@ -17,6 +25,25 @@ class BrewInstaller(BaseInstaller):
         """
         super(BrewInstaller, self).__init__(logger=logger, package_info=package_info)
 
+    def install_command(self):
+        """
+        Get the command that installs this package
+
+        Returns:
+            list(str): Command
+        """
+        return self.batch_install_command + [self.package_info.name]
+
+    def remove_command(self):
+        """
+        Get the command that removes this package
+
+        Returns:
+            list(str): Command
+        """
+        return self.batch_remove_command + [self.package_info.name]
+
+    @Tracer.traced("install")
     def install(self):
         """
         Install a Homebrew package
@@ -35,20 +62,19 @@ class BrewInstaller(BaseInstaller):
             return False
         else:
             self.logger.info("BrewInstaller.installing {0}".format(self.package_info.name))
-            cmd = ["brew", "install", self.package_info.name]
-            results = run_command(cmd=cmd, logger=self.logger)
+            cmd = self.install_command()
+            results = command.run(cmd=cmd, logger=self.logger, lock=command.HOMEBREW_LOCK,
+                                  backend=self.package_info.package_type)
             if results.success:
-                if self.is_present:
-                    self.logger.info("BrewInstaller.install {0} succeeded".format(self.package_info.name))
-                    return True
-                else:
-                    self.logger.warning("BrewInstaller.install {0} failed".format(self.package_info.name))
-                    return False
+                self.record_installed()
+                self.logger.info("BrewInstaller.install {0} succeeded".format(self.package_info.name))
+                return True
             else:
                 self.logger.error("BrewInstaller.install {0} failed status {1} results {2} errors {3}".format(
                     self.package_info.name, results.status_code, results.results, results.errors))
                 return False
 
+    @Tracer.traced("remove")
     def remove(self):
         """
         Remove a Homebrew package
@@ -62,15 +88,13 @@ class BrewInstaller(BaseInstaller):
 
         """
         if self.is_present():
-            cmd = ["brew", "uninstall", self.package_info.name]
-            results = run_command(cmd=cmd, logger=self.logger)
+            cmd = self.remove_command()
+            results = command.run(cmd=cmd, logger=self.logger, lock=command.HOMEBREW_LOCK,
+                                  backend=self.package_info.package_type)
             if results.success:
-                if self.is_present():
-                    self.logger.warning("BrewInstaller.remove {0} removal failed".format(self.package_info.name))
-                    return False
-                else:
-                    self.logger.info("BrewInstaller.remove {0} removal succeeded".format(self.package_info.name))
-                    return True
+                self.record_removed()
+                self.logger.info("BrewInstaller.remove {0} removal succeeded".format(self.package_info.name))
+                return True
             else:
                 self.logger.error("BrewInstaller.remove {0} failed status {1} results {2} errors {3}".format(
                     self.package_info.name, results.status_code, results.results, results.errors))
@@ -79,6 +103,7 @@ class BrewInstaller(BaseInstaller):
             self.logger.info("BrewInstaller.remove {0} is not installed".format(self.package_info.name))
             return False
 
+    @Tracer.traced("is_present")
     def is_present(self):
         """
         Is package present
@@ -91,13 +116,13 @@ class BrewInstaller(BaseInstaller):
             False Otherwise
             
         """
-        cmd = ["brew", "list"]
-        results = run_command(cmd=cmd, logger=self.logger)
-        if results.success:
-            results = results.results.split("\n")
-            if self.name in results:
-                return True
-            else:
-                return False
-        else:
-            return False
+        return self.inventory().contains(name=self.name)
+
+    def inventory(self):
+        """
+        Get the shared snapshot of installed Homebrew packages
+
+        Returns:
+            obj: Inventory instance
+        """
+        return Inventory.get(logger=self.logger, backend='brew')
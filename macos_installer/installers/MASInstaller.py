@@ -1,11 +1,23 @@
+import asyncio
 import os
-from run_command import run_command
+from .. import command
+from .. import paths
 from .BaseInstaller import BaseInstaller
+from ..Tracer import Tracer
+from ..Inventory import Inventory
+from ..FilesystemProbe import FilesystemProbe
+from ..PrivilegedHelper import PrivilegedHelper
 
 
 class MASInstaller(BaseInstaller):
     """ Installer for a MAS (Mac Apple Store) package"""
 
+    # Remove Apps by moving them to a quarantine that the privileged helper purges in the background,
+    # so that remove() returns at once. False deletes them before remove() returns.
+    quarantine = True
+
+    batch_upgrade_command = ["mas", "upgrade"]
+
     def __init__(self,
                  logger=None,
                  package_info=None):
@@ -18,6 +30,78 @@ class MASInstaller(BaseInstaller):
         """
         super(MASInstaller, self).__init__(logger=logger, package_info=package_info)
 
+    def install_command(self):
+        """
+        Get the command that installs this package
+
+        Returns:
+            list(str): Command
+        """
+        return ["mas", "install", self.package_info.mas_id]
+
+    def batch_argument(self):
+        """
+        Get what names this package in a batch command: the Mac Apple Store id
+
+        Returns:
+            str: mas_id
+        """
+        return self.package_info.mas_id
+
+    def remove_operations(self):
+        """
+        Get the privileged operations that remove this package: remove the App, then empty the trash.
+        Only a path inside the applications directory is removed.
+
+        Returns:
+            list(dict): PrivilegedHelper operations
+        """
+        applications_dir = (Inventory.probe or FilesystemProbe()).applications_dir
+        app_path = os.path.join(applications_dir, "{0}.app".format(self.package_info.name))
+        trash_dir = os.path.join(paths.home_dir(), ".Trash")
+        return [{"op": "remove_tree", "path": app_path, "root": applications_dir, "background": self.quarantine},
+                {"op": "empty_dir", "path": trash_dir, "background": self.quarantine}]
+
+    def remove_app(self):
+        """
+        Remove the App and empty the trash in one batch of the privileged helper
+
+        Returns:
+            bool: True if the App was removed
+        """
+        results = PrivilegedHelper.get(logger=self.logger).run(operations=self.remove_operations())
+        # Errors emptying the trash are ignored
+        if results[0].get("ok"):
+            self.record_removed()
+            if results[0].get("quarantined"):
+                self.logger.info("MASInstaller.remove {0} removal succeeded, purging {1} in the background".format(
+                    self.package_info.name, results[0].get("quarantined")))
+            else:
+                self.logger.info("MASInstaller.remove {0} removal succeeded, {1} files, {2} bytes freed".format(
+                    self.package_info.name, results[0].get("files"), results[0].get("bytes")))
+            return True
+        self.logger.error("MASInstaller.remove {0} failed: {1}".format(self.package_info.name,
+                                                                      results[0].get("error")))
+        return False
+
+    @Tracer.traced("remove")
+    async def remove_async(self, runner=None):
+        """
+        Remove a MAS package on the event loop
+
+        Args:
+            runner (obj): AsyncCommandRunner instance
+
+        Returns:
+            bool: True if removal succeeded, False if package not installed or removal failed
+        """
+        self.logger.warning("MASInstaller.remove ia experimental. Use at your own risk")
+        if not await self.is_present_async(runner=runner):
+            self.logger.info("MASInstaller.remove {0} is not installed".format(self.package_info.name))
+            return False
+        return await asyncio.get_running_loop().run_in_executor(None, self.remove_app)
+
+    @Tracer.traced("install")
     def install(self):
         """
         Install a MAS package
@@ -36,9 +120,10 @@ class MASInstaller(BaseInstaller):
             return False
         else:
             self.logger.info("MASInstaller.installing {0}".format(self.package_info.name))
-            cmd = ["mas", "install", self.package_info.mas_id]
-            results = run_command(cmd=cmd, logger=self.logger)
+            cmd = self.install_command()
+            results = command.run(cmd=cmd, logger=self.logger, backend=self.package_info.package_type)
             if results.success:
+                self.record_installed()
                 self.logger.info("MASInstaller.install {0} succeeded".format(self.package_info.name))
                 return True
             else:
@@ -46,6 +131,7 @@ class MASInstaller(BaseInstaller):
                     self.package_info.name, results.status_code, results.results, results.errors))
                 return False
 
+    @Tracer.traced("remove")
     def remove(self):
         """
         Remove a MAS package
@@ -62,28 +148,12 @@ class MASInstaller(BaseInstaller):
 
         self.logger.warning("MASInstaller.remove ia experimental. Use at your own risk")
         if self.is_present():
-            app_name = "/Applications/{0}.app".format(self.package_info.name)
-            cmd = ["sudo", "rm", "-rf", app_name]
-            results = run_command(cmd=cmd, logger=self.logger)
-            if results.success:
-                if self.is_present():
-                    self.logger.warning("MASInstaller.remove {0} removal failed".format(self.package_info.name))
-                    return False
-                else:
-                    self.logger.info("MASInstaller.remove {0} removal succeeded".format(self.package_info.name))
-                    trash_dir = "{0}/.Trash/*".format(os.environ['HOME'])
-                    cmd = ["sudo", "rm", "-rf", trash_dir]
-                    run_command(cmd=cmd, logger=self.logger)
-                    # Ignore errors
-                    return True
-            else:
-                self.logger.error("MASInstaller.remove {0} failed status {1} results {2} errors {3}".format(
-                    self.package_info.name, results.status_code, results.results, results.errors))
-                return False
+            return self.remove_app()
         else:
             self.logger.info("MASInstaller.remove {0} is not installed".format(self.package_info.name))
             return False
 
+    @Tracer.traced("is_present")
     def is_present(self):
         """
         Is package present
@@ -96,14 +166,13 @@ class MASInstaller(BaseInstaller):
             False Otherwise
             
         """
-        cmd = ["mas", "list"]
-        results = run_command(cmd=cmd, logger=self.logger)
-        if results.success:
-            results = results.results.split("\n")
-            results = [result.split(" ")[0] for result in results]
-            if self.package_info.mas_id in results:
-                return True
-            else:
-                return False
-        else:
-            return False
+        return self.inventory().contains(name=self.package_info.name, mas_id=self.package_info.mas_id)
+
+    def inventory(self):
+        """
+        Get the shared snapshot of installed Mac Apple Store packages
+
+        Returns:
+            obj: Inventory instance
+        """
+        return Inventory.get(logger=self.logger, backend='mas')
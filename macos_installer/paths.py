@@ -0,0 +1,58 @@
+import os
+
+
+def home_dir():
+    """
+    Get the user's home directory. Resolved on every call, never at import time.
+
+    Returns:
+        str: Home directory
+    """
+    return os.environ.get('HOME') or os.path.expanduser("~")
+
+
+def cache_dir():
+    """
+    Get the directory holding state kept between runs.
+    $MACOS_INSTALLER_CACHE_DIR, else $XDG_CACHE_HOME/macos_installer, else ~/.cache/macos_installer
+
+    Returns:
+        str: Cache directory. Not created here.
+    """
+
+    configured = os.environ.get('MACOS_INSTALLER_CACHE_DIR')
+    if configured:
+        return configured
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(home_dir(), ".cache")
+    return os.path.join(xdg_cache_home, "macos_installer")
+
+
+def startup_dir():
+    """
+    Get the directory holding personal bootstrap data e.g. the local cask definitions repo
+
+    Returns:
+        str: ~/.startup
+    """
+    return os.path.join(home_dir(), ".startup")
+
+
+def personal_bootstrap():
+    """
+    Get the file whose presence marks a personal system
+
+    Returns:
+        str: ~/.bootstrap_personal
+    """
+    return os.path.join(home_dir(), ".bootstrap_personal")
+
+
+def receipts_dir():
+    """
+    Get the directory local cask receipts are unpacked into.
+    $MACOS_INSTALLER_RECEIPTS_DIR, else /private/var/db/receipts
+
+    Returns:
+        str: Receipts directory
+    """
+    return os.environ.get('MACOS_INSTALLER_RECEIPTS_DIR') or "/private/var/db/receipts"
@@ -0,0 +1,488 @@
+"""
+Privileged helper process. Started once per run by PrivilegedHelper, usually through sudo, and run by
+file path with python -I, so it imports only the standard library.
+
+Reads batches of file operations from stdin, one JSON list per line, carries them out in order and
+writes one JSON list of results per batch to stdout. Exits at the end of its input.
+
+Operations:
+
+{"op": "remove_tree", "path": p, "root": r, "background": b}: remove a file or directory tree, like rm -rf.
+A missing path is not an error. With a root, a path not inside it is refused. Reports the "files" and
+"bytes" freed. In the background: see below.
+
+{"op": "empty_dir", "path": p, "background": b}: remove everything inside a directory, keeping the directory.
+
+{"op": "wait_purged"}: wait for the background removals and report the "files" and "bytes" they freed.
+
+{"op": "extract", "archive": zip file, "target": directory}: extract a zip archive, like unzip -o, skipping
+files already identical (same size and CRC). Large archives are extracted by several threads.
+
+{"op": "copy", "source": s, "target": t}: copy a file or directory tree, replacing the target.
+
+Results: {"ok": true} or {"ok": false, "error": message}. extract also reports "extracted" and "skipped"
+file counts and "bytes" written.
+
+Removals in the background rename what is removed into a hidden quarantine directory next to it, which is
+immediate, and answer at once with where it went ("quarantined"). The quarantine is purged by a background
+thread; anything a killed helper left there is purged the next time the same quarantine is used. The
+helper finishes purging before it exits.
+"""
+
+import json
+import os
+import shutil
+import stat
+import sys
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Archives with at least this many bytes to write are extracted by EXTRACT_WORKERS threads
+PARALLEL_EXTRACT_BYTES = 8 * 1024 * 1024
+EXTRACT_WORKERS = 4
+
+CHUNK_SIZE = 1024 * 1024
+
+# Directories of a tree being removed are emptied by this many threads at once
+REMOVE_WORKERS = 8
+
+# Hidden, so that neither Finder nor FilesystemProbe lists what is in it
+QUARANTINE_NAME = ".macos_installer-quarantine"
+
+# Background purges: futures of delete() and the quarantined paths already scheduled
+purges = []
+purged = set()
+purge_lock = threading.Lock()
+purge_executor = None
+
+
+def clear_files(directory):
+    """
+    Remove the files and links in a directory, leaving its subdirectories
+
+    Args:
+        directory (str): Directory
+
+    Returns:
+        tuple(list(str), int, int): Subdirectories, files removed, bytes freed
+    """
+
+    subdirectories = []
+    files = 0
+    freed = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+                continue
+            try:
+                size = entry.stat(follow_symlinks=False).st_size
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                continue
+            files += 1
+            freed += size
+    return subdirectories, files, freed
+
+
+def delete(path):
+    """
+    Remove a file or directory tree. Directories are emptied by REMOVE_WORKERS threads, each subdirectory
+    handed to a thread as soon as it is found, then removed deepest first.
+
+    Args:
+        path (str): Path
+
+    Returns:
+        dict: 'files' removed and 'bytes' freed
+    """
+
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return {"files": 0, "bytes": 0}
+    if not stat.S_ISDIR(mode):
+        size = os.lstat(path).st_size
+        os.unlink(path)
+        return {"files": 1, "bytes": size}
+
+    # Every directory is found after its parent, so removing them in reverse order removes children first
+    directories = [path]
+    files = 0
+    freed = 0
+    with ThreadPoolExecutor(max_workers=REMOVE_WORKERS) as executor:
+        pending = {executor.submit(clear_files, path)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                subdirectories, cleared_files, cleared_bytes = future.result()
+                files += cleared_files
+                freed += cleared_bytes
+                directories.extend(subdirectories)
+                pending.update(executor.submit(clear_files, subdirectory) for subdirectory in subdirectories)
+    for directory in reversed(directories):
+        os.rmdir(directory)
+    return {"files": files, "bytes": freed}
+
+
+def check_inside(path, root):
+    """
+    Refuse a path that isn't strictly inside a root directory
+
+    Args:
+        path (str): Path
+        root (str): Root directory or None to allow any path
+
+    Returns:
+        No return value
+    """
+
+    if root is None:
+        return
+    real_root = os.path.realpath(root)
+    real_parent = os.path.realpath(os.path.dirname(os.path.abspath(path)))
+    name = os.path.basename(os.path.abspath(path))
+    if name in ("", ".", "..") or os.path.commonpath([real_root, real_parent]) != real_root:
+        raise ValueError("{0} is not inside {1}".format(path, root))
+
+
+def quarantine(path):
+    """
+    Move a path into the quarantine next to it and schedule the quarantine to be purged
+
+    Args:
+        path (str): Path
+
+    Returns:
+        str: Quarantined path
+    """
+
+    quarantine_dir = os.path.join(os.path.dirname(os.path.abspath(path)), QUARANTINE_NAME)
+    os.makedirs(quarantine_dir, exist_ok=True)
+    quarantined = os.path.join(quarantine_dir, "{0}.{1}".format(os.path.basename(path), time.time_ns()))
+    os.rename(path, quarantined)
+    schedule_purge(quarantine_dir)
+    return quarantined
+
+
+def schedule_purge(quarantine_dir):
+    """
+    Purge everything in a quarantine in the background, including what an earlier helper left there
+
+    Args:
+        quarantine_dir (str): Quarantine directory
+
+    Returns:
+        No return value
+    """
+
+    global purge_executor
+    with purge_lock:
+        if purge_executor is None:
+            purge_executor = ThreadPoolExecutor(max_workers=1)
+        with os.scandir(quarantine_dir) as entries:
+            for entry in entries:
+                if entry.path not in purged:
+                    purged.add(entry.path)
+                    purges.append(purge_executor.submit(delete, entry.path))
+
+
+def wait_purged():
+    """
+    Wait for the background purges
+
+    Returns:
+        dict: 'files' removed and 'bytes' freed by the purges since the last call, and the 'errors'
+    """
+
+    with purge_lock:
+        futures = list(purges)
+        del purges[:]
+    files = 0
+    freed = 0
+    errors = []
+    for future in futures:
+        try:
+            result = future.result()
+            files += result["files"]
+            freed += result["bytes"]
+        except OSError as e:
+            errors.append(str(e))
+    return {"files": files, "bytes": freed, "errors": errors}
+
+
+def remove_tree(path, root=None, background=False):
+    """
+    Remove a file or directory tree. A missing path is not an error.
+
+    Args:
+        path (str): Path
+        root (str): Refuse a path not inside this directory. None for any path.
+        background (bool): Quarantine the path and purge it in the background
+
+    Returns:
+        dict: 'files' removed and 'bytes' freed, or where the path was 'quarantined'
+    """
+
+    check_inside(path, root)
+    if not os.path.lexists(path):
+        return {"files": 0, "bytes": 0}
+    if background:
+        return {"quarantined": quarantine(path)}
+    return delete(path)
+
+
+def empty_dir(path, background=False):
+    """
+    Remove everything inside a directory
+
+    Args:
+        path (str): Directory
+        background (bool): Quarantine the entries and purge them in the background
+
+    Returns:
+        dict: 'files' removed and 'bytes' freed, or the number of entries 'quarantined'
+    """
+
+    with os.scandir(path) as scanned:
+        entries = [entry.path for entry in scanned if entry.name != QUARANTINE_NAME]
+    if background:
+        for entry in entries:
+            quarantine(entry)
+        return {"quarantined": len(entries)}
+
+    files = 0
+    freed = 0
+    for entry in entries:
+        result = delete(entry)
+        files += result["files"]
+        freed += result["bytes"]
+    return {"files": files, "bytes": freed}
+
+
+def member_path(target, member):
+    """
+    Get where an archive member is extracted. Names that would land outside the target are refused.
+
+    Args:
+        target (str): Directory extracted into
+        member (obj): zipfile.ZipInfo
+
+    Returns:
+        str: Path or None if the name is unsafe
+    """
+
+    parts = [part for part in member.filename.replace("\\", "/").split("/") if part and part != "."]
+    if not parts or ".." in parts or os.path.isabs(member.filename):
+        return None
+    return os.path.join(target, *parts)
+
+
+def is_unchanged(member, path):
+    """
+    Is a file already identical to an archive member? Compares the size, then the CRC.
+
+    Args:
+        member (obj): zipfile.ZipInfo
+        path (str): Extracted file
+
+    Returns:
+        bool: True if identical
+    """
+
+    try:
+        if os.path.getsize(path) != member.file_size or os.path.islink(path):
+            return False
+        crc = 0
+        with open(path, 'rb') as existing:
+            for chunk in iter(lambda: existing.read(CHUNK_SIZE), b""):
+                crc = zlib.crc32(chunk, crc)
+        return crc == member.CRC
+    except OSError:
+        return False
+
+
+def changed_members(zip_file, target):
+    """
+    Find the archive members not yet extracted identically
+
+    Args:
+        zip_file (obj): zipfile.ZipFile
+        target (str): Directory extracted into
+
+    Returns:
+        list(tuple(obj, str)): (ZipInfo, path) of each file to write
+    """
+
+    changed = []
+    for member in zip_file.infolist():
+        path = member_path(target, member)
+        if path is None:
+            raise ValueError("unsafe archive member {0}".format(member.filename))
+        if member.is_dir():
+            continue
+        if not is_unchanged(member, path):
+            changed.append((member, path))
+    return changed
+
+
+def is_extracted(archive, target):
+    """
+    Is every file of an archive already extracted identically? Needs only read access.
+
+    Args:
+        archive (str): Zip file
+        target (str): Directory extracted into
+
+    Returns:
+        bool: True if nothing would be written
+    """
+
+    with zipfile.ZipFile(archive) as zip_file:
+        return not changed_members(zip_file, target)
+
+
+def write_members(archive, members):
+    """
+    Stream archive members to their paths. Each file is written next to its path and renamed into place.
+
+    Args:
+        archive (str): Zip file, opened again so that threads don't share a file position
+        members list(tuple(obj, str)): (ZipInfo, path) to write
+
+    Returns:
+        int: Bytes written
+    """
+
+    written = 0
+    with zipfile.ZipFile(archive) as zip_file:
+        for member, path in members:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = "{0}.{1}.tmp".format(path, os.getpid())
+            try:
+                with zip_file.open(member) as source, open(tmp_path, 'wb') as destination:
+                    shutil.copyfileobj(source, destination, CHUNK_SIZE)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            written += member.file_size
+    return written
+
+
+def extract(archive, target):
+    """
+    Extract a zip archive, leaving files already identical untouched
+
+    Args:
+        archive (str): Zip file
+        target (str): Directory to extract into
+
+    Returns:
+        dict: 'extracted' and 'skipped' file counts and 'bytes' written
+    """
+
+    os.makedirs(target, exist_ok=True)
+    with zipfile.ZipFile(archive) as zip_file:
+        files = sum(1 for member in zip_file.infolist() if not member.is_dir())
+        changed = changed_members(zip_file, target)
+        for member in zip_file.infolist():
+            if member.is_dir():
+                os.makedirs(member_path(target, member), exist_ok=True)
+
+    total = sum(member.file_size for member, _ in changed)
+    if total < PARALLEL_EXTRACT_BYTES or len(changed) < 2:
+        written = write_members(archive, changed)
+    else:
+        # Largest first, dealt round robin so that the threads get similar amounts to write
+        changed.sort(key=lambda entry: entry[0].file_size, reverse=True)
+        shares = [changed[index::EXTRACT_WORKERS] for index in range(EXTRACT_WORKERS)]
+        with ThreadPoolExecutor(max_workers=EXTRACT_WORKERS) as executor:
+            written = sum(executor.map(lambda share: write_members(archive, share), shares))
+    return {"extracted": len(changed), "skipped": files - len(changed), "bytes": written}
+
+
+def copy(source, target):
+    """
+    Copy a file or directory tree, replacing the target
+
+    Args:
+        source (str): Source path
+        target (str): Target path
+
+    Returns:
+        No return value
+    """
+
+    if os.path.isdir(source):
+        remove_tree(target)
+        shutil.copytree(source, target, symlinks=True)
+    else:
+        shutil.copy2(source, target)
+
+
+OPERATIONS = {
+    'remove_tree': lambda operation: remove_tree(operation['path'], operation.get('root'),
+                                                 operation.get('background', False)),
+    'empty_dir': lambda operation: empty_dir(operation['path'], operation.get('background', False)),
+    'wait_purged': lambda operation: wait_purged(),
+    'extract': lambda operation: extract(operation['archive'], operation['target']),
+    'copy': lambda operation: copy(operation['source'], operation['target']),
+}
+
+
+def perform(operation):
+    """
+    Carry out one operation
+
+    Args:
+        operation (dict): Operation, see above
+
+    Returns:
+        dict: Result
+    """
+
+    try:
+        result = {"ok": True}
+        result.update(OPERATIONS[operation['op']](operation) or {})
+        return result
+    except KeyError as e:
+        return {"ok": False, "error": "bad operation {0}: missing {1}".format(operation, e)}
+    except Exception as e:
+        return {"ok": False, "error": "{0}: {1}".format(type(e).__name__, e)}
+
+
+def serve(requests=None, responses=None):
+    """
+    Answer batches until the end of the input, then finish the background purges
+
+    Args:
+        requests (obj): Input stream. Defaults to stdin
+        responses (obj): Output stream. Defaults to stdout
+
+    Returns:
+        No return value
+    """
+
+    requests = requests or sys.stdin
+    responses = responses or sys.stdout
+    for line in requests:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            batch = json.loads(line)
+            results = [perform(operation) for operation in batch]
+        except (ValueError, TypeError) as e:
+            results = [{"ok": False, "error": "bad request: {0}".format(e)}]
+        responses.write(json.dumps(results) + "\n")
+        responses.flush()
+    wait_purged()
+
+
+if __name__ == "__main__":
+    serve()
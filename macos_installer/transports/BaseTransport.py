@@ -0,0 +1,69 @@
+import os
+import sys
+
+
+class BaseTransport:
+    """ Base class for all \*Transport types: how a fleet run reaches a host and starts the installer there"""
+
+    # Exit status of the transport itself when the host can't be reached, None if it has none
+    UNREACHABLE_STATUS = None
+
+    # Module started on each host
+    INSTALLER_MODULE = "macos_installer.installer"
+
+    def __init__(self,
+                 python=None):
+        """
+        Create a new base class instance
+
+        Args:
+            python (str): Python interpreter on the hosts
+        """
+
+        self.python = python if python else sys.executable
+
+    def installer_command(self, arguments=None):
+        """
+        Get the command that runs the installer on a host
+
+        Args:
+            arguments list(str): Installer command line arguments
+
+        Returns:
+            list(str): Command
+        """
+        return [self.python, "-m", self.INSTALLER_MODULE] + list(arguments or [])
+
+    def command(self, host=None, arguments=None):
+        """
+        Get the local command that runs the installer on a host. The manifest is written to its standard input.
+
+        Args:
+            host (str): Host name
+            arguments list(str): Installer command line arguments
+
+        Returns:
+            list(str): Command
+        """
+        return self.installer_command(arguments=arguments)
+
+    def environment(self, host=None):
+        """
+        Get the environment of the local command for a host
+
+        Args:
+            host (str): Host name
+
+        Returns:
+            dict: Environment variables
+        """
+        return dict(os.environ)
+
+    def __repr__(self):
+        """
+        Create the string representation of this object. For print(...) etc.
+
+        Returns:
+            String representation of this object
+        """
+        return type(self).__name__
@@ -0,0 +1,35 @@
+import os
+
+from .BaseTransport import BaseTransport
+
+
+class LocalTransport(BaseTransport):
+    """ Transport that runs the installer for each host as a local process, e.g. for tests and benchmarks"""
+
+    def __init__(self,
+                 python=None,
+                 environments=None):
+        """
+        Create a LocalTransport class instance
+
+        Args:
+            python (str): Python interpreter. Defaults to the current one
+            environments (dict): host -> environment variables set for that host's process, e.g. a sandbox
+                per host made with benchmarks/fake_tools.py
+        """
+        super(LocalTransport, self).__init__(python=python)
+        self.environments = environments if environments else {}
+
+    def environment(self, host=None):
+        """
+        Get the environment of a host's process: ours, with the host's variables on top
+
+        Args:
+            host (str): Host name
+
+        Returns:
+            dict: Environment variables
+        """
+        environment = dict(os.environ)
+        environment.update(self.environments.get(host, {}))
+        return environment
@@ -0,0 +1,45 @@
+import shlex
+
+from .BaseTransport import BaseTransport
+
+
+class SSHTransport(BaseTransport):
+    """ Transport that runs the installer on each host through ssh"""
+
+    # ssh exits with 255 when the connection fails, whatever the remote command returns
+    UNREACHABLE_STATUS = 255
+
+    # Never prompt: a host that needs a password fails rather than blocking the fleet
+    DEFAULT_OPTIONS = ["-o", "BatchMode=yes", "-o", "ConnectTimeout=10"]
+
+    def __init__(self,
+                 python=None,
+                 user=None,
+                 options=None):
+        """
+        Create a SSHTransport class instance
+
+        Args:
+            python (str): Python interpreter on the hosts. Defaults to 'python3'
+            user (str): Remote user for hosts given without one. Defaults to ssh's configuration
+            options list(str): ssh options added to DEFAULT_OPTIONS e.g. ["-i", "~/.ssh/fleet"]
+        """
+        super(SSHTransport, self).__init__(python=python if python else "python3")
+        self.user = user
+        self.options = list(options or [])
+
+    def command(self, host=None, arguments=None):
+        """
+        Get the ssh command that runs the installer on a host
+
+        Args:
+            host (str): Host name or user@host
+            arguments list(str): Installer command line arguments
+
+        Returns:
+            list(str): Command
+        """
+        destination = host if self.user is None or "@" in host else "{0}@{1}".format(self.user, host)
+        # ssh passes the remote command to the remote shell as one string
+        remote_command = " ".join(shlex.quote(argument) for argument in self.installer_command(arguments=arguments))
+        return ["ssh"] + self.DEFAULT_OPTIONS + self.options + [destination, remote_command]
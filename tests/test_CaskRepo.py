@@ -0,0 +1,112 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from macos_installer import command
+from macos_installer.CaskRepo import CaskRepo
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+}
+
+
+class CaskRepoTest(unittest.TestCase):
+    """CaskRepo.sync against a local bare repo"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="macos_installer_test_")
+        self.env = dict(os.environ, **GIT_ENV)
+        self.remote = os.path.join(self.root, "remote.git")
+        self.work = os.path.join(self.root, "work")
+        self.git("init", "--bare", "-q", self.remote)
+        self.git("clone", "-q", self.remote, self.work)
+        self.commit("cask one")
+        self.repo_dir = os.path.join(self.root, "checkout")
+        self.repo = CaskRepo(logger=logging.getLogger("test"), url="file://" + self.remote, repo_dir=self.repo_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def git(self, *args, cwd=None):
+        return subprocess.run(["git"] + list(args), cwd=cwd, env=self.env, check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True).stdout
+
+    def commit(self, text):
+        os.makedirs(os.path.join(self.work, "casks"), exist_ok=True)
+        with open(os.path.join(self.work, "casks", "app.rb"), 'w') as cask_file:
+            cask_file.write(text)
+        self.git("add", "-A", cwd=self.work)
+        self.git("commit", "-q", "-m", text, cwd=self.work)
+        self.git("push", "-q", "origin", "HEAD", cwd=self.work)
+
+    def cask(self):
+        with open(os.path.join(self.repo_dir, "casks", "app.rb"), 'r') as cask_file:
+            return cask_file.read()
+
+    def sync(self, force=False):
+        with mock.patch.object(command, "run", wraps=command.run) as run:
+            synced = self.repo.sync(force=force)
+        return synced, [call[1]["cmd"][1] for call in run.call_args_list]
+
+    def test_clone(self):
+        synced, commands = self.sync()
+        self.assertTrue(synced)
+        self.assertEqual(commands[0], "clone")
+        self.assertEqual(self.cask(), "cask one")
+        self.assertEqual(self.git("rev-list", "--count", "HEAD", cwd=self.repo_dir).strip(), "1")
+
+    def test_clone_failure(self):
+        self.repo.url = "file://" + os.path.join(self.root, "missing.git")
+        synced, commands = self.sync()
+        self.assertFalse(synced)
+
+    def test_ttl_skip(self):
+        self.sync()
+        self.commit("cask two")
+        synced, commands = self.sync()
+        self.assertTrue(synced)
+        self.assertEqual(commands, [])
+        self.assertEqual(self.cask(), "cask one")
+
+    def test_unchanged_ref_skip(self):
+        self.sync()
+        synced, commands = self.sync(force=True)
+        self.assertTrue(synced)
+        self.assertEqual(commands, ["ls-remote"])
+
+    def test_fetch(self):
+        self.sync()
+        self.commit("cask two")
+        synced, commands = self.sync(force=True)
+        self.assertTrue(synced)
+        self.assertIn("fetch", commands)
+        self.assertEqual(self.cask(), "cask two")
+        self.assertEqual(self.git("rev-list", "--count", "HEAD", cwd=self.repo_dir).strip(), "1")
+
+    def test_local_changes_kept(self):
+        self.sync()
+        with open(os.path.join(self.repo_dir, "casks", "app.rb"), 'w') as cask_file:
+            cask_file.write("edited")
+        self.commit("cask two")
+        synced, commands = self.sync(force=True)
+        self.assertTrue(synced)
+        self.assertNotIn("fetch", commands)
+        self.assertEqual(self.cask(), "edited")
+
+    def test_unreachable_remote_keeps_checkout(self):
+        self.sync()
+        self.repo.url = "file://" + os.path.join(self.root, "missing.git")
+        synced, commands = self.sync(force=True)
+        self.assertTrue(synced)
+        self.assertEqual(self.cask(), "cask one")
+
+
+if __name__ == "__main__":
+    unittest.main()